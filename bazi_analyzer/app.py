@@ -2,13 +2,19 @@
 Flask Web 应用 - 八字算命机
 提供 Web 界面进行八字排盘和分析
 """
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from mcp_client import call_bazi_mcp, parse_datetime_input
-from datetime import datetime
+from batch_stream import iter_rows, iter_results, ndjson_line
+from llm_jobs import JobQueue
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 import requests
 
+# mcp_client 已把仓库根目录加入 sys.path
+from bazi_core.chart import as_chart
+from bazi_core.engine import bazi_detail
+
 app = Flask(__name__)
 
 # 配置大模型 API（Silicon Flow）
@@ -16,6 +22,20 @@ SILICON_FLOW_API_KEY = os.getenv('SILICON_FLOW_API_KEY', 'sk-bqvwghqjntyjcfstnti
 SILICON_FLOW_API_URL = 'https://api.siliconflow.cn/v1/chat/completions'
 LLM_MODEL = "Qwen/Qwen2.5-7B-Instruct"
 
+# 排盘引擎：mcp 始终调用 bazi-mcp（含农历、完整神煞、刑冲合会）；native 进程内排盘（失败时回退 MCP），
+# 不含农历，神煞只有 bazi_core.shensha 推出的常用神煞。页面与大模型解读需要农历，默认 mcp
+BAZI_ENGINE = os.getenv('BAZI_ENGINE', 'mcp').lower()
+
+# /analyze/batch：排盘线程数与同时在途的行数上限（决定内存占用，与批量大小无关）
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', str(BATCH_WORKERS * 4)))
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='bazi-batch')
+
+# 大模型解读在后台线程池生成，任务与按命盘缓存的解读存于 SQLite
+LLM_JOB_DB = os.getenv('LLM_JOB_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_jobs.sqlite3')
+LLM_JOB_WORKERS = int(os.getenv('LLM_JOB_WORKERS', '2'))
+LLM_JOB_STREAM_TIMEOUT = float(os.getenv('LLM_JOB_STREAM_TIMEOUT', '120'))
+
 
 class BaziAnalyzer:
     """八字分析逻辑"""
@@ -24,86 +44,92 @@ class BaziAnalyzer:
     def analyze(birth_date, birth_time, gender, timezone="+08:00"):
         """执行八字分析"""
         iso_datetime = parse_datetime_input(birth_date, birth_time, timezone)
-        bazi_result = call_bazi_mcp(solar_datetime=iso_datetime, gender=gender)
+        bazi_result = None
+        if BAZI_ENGINE == 'native':
+            try:
+                bazi_result = bazi_detail(iso_datetime, gender=gender)
+            except ValueError as e:
+                print(f"原生排盘失败，回退 MCP: {e}")
+        if bazi_result is None:
+            bazi_result = call_bazi_mcp(solar_datetime=iso_datetime, gender=gender)
         
         if not bazi_result:
             return None
         
+        # 解析一次，后续统计都基于紧凑排盘
+        chart = as_chart(bazi_result)
+        
         # 统计五行
-        wuxing_count = BaziAnalyzer.count_wuxing(bazi_result)
+        wuxing_count = BaziAnalyzer.count_wuxing(chart)
         
         # 格式化大运
-        dayun_formatted = BaziAnalyzer.format_dayun(bazi_result)
+        dayun_formatted = BaziAnalyzer.format_dayun(chart)
+        
+        # 格式化神煞（MCP 排盘为完整神煞，原生排盘为 bazi_core.shensha 本地推出的常用神煞）
+        shensha_formatted = BaziAnalyzer.format_shensha(chart)
         
-        # 格式化神煞
-        shensha_formatted = BaziAnalyzer.format_shensha(bazi_result)
+        # 刑冲合会（原生排盘本地计算）
+        relations_formatted = BaziAnalyzer.format_relations(chart)
         
         return {
             'raw': bazi_result,
             'wuxing': wuxing_count,
             'dayun': dayun_formatted,
-            'shensha': shensha_formatted
+            'shensha': shensha_formatted,
+            'shensha_source': 'mcp' if chart.has_shensha else 'local',
+            'relations': relations_formatted
         }
     
     @staticmethod
     def count_wuxing(bazi_result):
-        """统计五行数量"""
-        wuxing_count = {'木': 0, '火': 0, '土': 0, '金': 0, '水': 0}
-        
-        pillars = ['年柱', '月柱', '日柱', '时柱']
-        for pillar_name in pillars:
-            pillar = bazi_result.get(pillar_name, {})
-            if pillar:
-                tg_wx = pillar.get('天干', {}).get('五行', '')
-                dz_wx = pillar.get('地支', {}).get('五行', '')
-                if tg_wx in wuxing_count:
-                    wuxing_count[tg_wx] += 1
-                if dz_wx in wuxing_count:
-                    wuxing_count[dz_wx] += 1
-        
-        return wuxing_count
+        """统计五行数量（bazi_result 为 Chart 或排盘 dict）"""
+        return as_chart(bazi_result).wuxing_counts()
     
     @staticmethod
     def format_dayun(bazi_result):
         """格式化大运数据"""
-        dayun_data = bazi_result.get('大运', {})
-        if not dayun_data or '大运' not in dayun_data:
-            return []
-        
-        dayun_list = dayun_data.get('大运', [])
-        current_year = datetime.now().year
+        chart = as_chart(bazi_result)
+        current = chart.current_dayun()
         
         formatted = []
-        for yun in dayun_list[:6]:
-            start_year = yun.get('开始年份', '')
-            end_year = yun.get('结束', '')
-            is_current = start_year <= current_year <= end_year if isinstance(start_year, int) else False
-            
+        for yun in chart.dayun()[:6]:
             formatted.append({
-                'ganzhi': yun.get('干支', ''),
-                'period': f"{start_year}-{end_year}年",
-                'age': f"{yun.get('开始年龄', '')}-{yun.get('结束年龄', '')}岁",
-                'shishen': yun.get('天干十神', ''),
-                'is_current': is_current
+                'ganzhi': yun.ganzhi,
+                'period': f"{yun.start_year}-{yun.end_year}年",
+                'age': f"{yun.start_age}-{yun.end_age}岁",
+                'shishen': yun.gan_shishen,
+                'is_current': yun is current
             })
         
         return formatted
     
     @staticmethod
     def format_shensha(bazi_result):
-        """格式化神煞数据"""
-        shensha = bazi_result.get('神煞', {})
-        if not shensha:
-            return {}
+        """格式化神煞数据（排盘中没有神煞时用本地推出的常用神煞，见 Chart.shensha_map）"""
+        chart = as_chart(bazi_result)
         
-        pillars = ['年柱', '月柱', '日柱', '时柱']
         formatted = {}
-        for pillar_name in pillars:
-            sha_list = shensha.get(pillar_name, [])
+        for pillar_name, sha_list in chart.shensha_map().items():
             if sha_list:
                 formatted[pillar_name] = sha_list[:8]
         
         return formatted
+    
+    @staticmethod
+    def format_relations(bazi_result):
+        """格式化刑冲合会：{'月柱': ['未卯半合木（日）', ...]}，不截断"""
+        chart = as_chart(bazi_result)
+        
+        formatted = {}
+        for label, parts in chart.relation_map().items():
+            items = [f"{entry.get('知识点', kind)}（{entry.get('柱', '')}）"
+                     for part in ('天干', '地支')
+                     for kind, entries in ((parts or {}).get(part) or {}).items()
+                     for entry in entries]
+            if items:
+                formatted[f"{label}柱"] = items
+        
+        return formatted
 
 
 def analyze_with_llm(bazi_result):
@@ -190,6 +216,9 @@ def analyze_with_llm(bazi_result):
         return f"⚠️ 大模型分析异常: {str(e)}"
 
 
+LLM_JOBS = JobQueue(analyze_with_llm, LLM_JOB_DB, workers=LLM_JOB_WORKERS, model=LLM_MODEL)
+
+
 @app.route('/')
 def index():
     """首页"""
@@ -218,21 +247,136 @@ def analyze():
         if not result:
             return jsonify({'error': 'MCP 工具调用失败，请检查配置'}), 500
         
-        # 如果请求大模型分析
+        # 如果请求大模型分析：提交后台任务，命盘立即返回；解读通过 /analyze/jobs/<id>/stream 获取
         llm_analysis = None
+        llm_job = None
         if use_llm:
-            llm_analysis = analyze_with_llm(result['raw'])
+            job = LLM_JOBS.submit(result['raw'])
+            llm_analysis = job['analysis']  # 命中缓存时已有
+            llm_job = {'id': job['id'], 'status': job['status']}
         
         return jsonify({
             'success': True, 
             'data': result,
-            'llm_analysis': llm_analysis
+            'llm_analysis': llm_analysis,
+            'llm_job': llm_job
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def analyze_batch_row(row):
+    """
+    批量接口的单行排盘
+
+    参数:
+        row (dict): birth_date、birth_time，可选 gender（1/0 或 男/女，默认 1）、timezone（默认 +08:00）
+
+    返回:
+        dict: bazi、wuxing、dayun、shensha、shensha_source、relations
+            shensha_source 为 'mcp'（bazi-mcp 的完整神煞）或 'local'（原生排盘，只含 bazi_core.shensha
+            覆盖的常用神煞；需要完整神煞时设置 BAZI_ENGINE=mcp）
+
+    异常:
+        ValueError: 缺少字段或排盘失败
+    """
+    birth_date = str(row.get('birth_date') or '').strip()
+    birth_time = str(row.get('birth_time') or '').strip()
+    if not birth_date or not birth_time:
+        raise ValueError('缺少出生日期或时间')
+    gender = row.get('gender')
+    gender = int({'男': 1, '女': 0}.get(gender, gender if gender not in (None, '') else 1))
+    timezone = str(row.get('timezone') or '+08:00').strip()
+
+    result = BaziAnalyzer.analyze(birth_date, birth_time, gender, timezone)
+    if not result:
+        raise ValueError('排盘失败')
+    return {
+        'bazi': result['raw'].get('八字', ''),
+        'wuxing': result['wuxing'],
+        'dayun': result['dayun'],
+        'shensha': result['shensha'],
+        'shensha_source': result['shensha_source'],
+        'relations': result['relations'],
+    }
+
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    批量分析接口（NDJSON 流式返回）
+
+    请求体: CSV（Content-Type: text/csv，表头 birth_date,birth_time,gender,timezone）
+            或 JSON 数组 / NDJSON，每项 {"birth_date", "birth_time", "gender", "timezone", "id"}
+    响应: 每行一个 JSON，按完成顺序输出 {"index", "id", "bazi", "wuxing", "dayun", "shensha", "shensha_source", "relations"}
+          或 {"index", "error"}；最后一行为 {"done": true, "total", "failed"}
+    """
+    rows = iter_rows(request.stream, request.content_type)
+
+    def generate():
+        total = failed = 0
+        try:
+            for item in iter_results(rows, analyze_batch_row, BATCH_EXECUTOR, BATCH_MAX_IN_FLIGHT):
+                total += 1
+                failed += 'error' in item
+                yield ndjson_line(item)
+        except ValueError as e:
+            # 请求体格式错误：已输出的行保留，附上错误后结束
+            yield ndjson_line({'error': str(e)})
+        yield ndjson_line({'done': True, 'total': total, 'failed': failed})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'},
+    )
+
+
+@app.route('/analyze/jobs/<job_id>')
+def analyze_job(job_id):
+    """大模型解读任务状态"""
+    job = LLM_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+
+@app.route('/analyze/jobs/<job_id>/stream')
+def analyze_job_stream(job_id):
+    """
+    大模型解读（SSE）
+
+    事件: status（{"status"}，pending / running）、done（{"analysis"}）、failed（{"error"}）；
+    等待期间定期发送注释行保活，超过 LLM_JOB_STREAM_TIMEOUT 秒发送 timeout 事件（任务继续执行，可重新订阅）
+    """
+    if LLM_JOBS.get(job_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
+        for job in LLM_JOBS.watch(job_id, timeout=LLM_JOB_STREAM_TIMEOUT):
+            if job is None:
+                yield ": keep-alive\n\n"
+            elif job['status'] == 'done':
+                yield event('done', {'analysis': job['analysis']})
+                return
+            elif job['status'] == 'failed':
+                yield event('failed', {'error': job['error']})
+                return
+            else:
+                yield event('status', {'status': job['status']})
+        yield event('timeout', {'job_id': job_id})
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'},
+    )
+
+
 @app.route('/raw/<path:filename>')
 def download_raw(filename):
     """下载原始 JSON 数据"""
@@ -0,0 +1,130 @@
+"""
+批量排盘的流式读写 - /analyze/batch 使用
+
+请求体边读边解析（CSV 或 JSON 数组 / NDJSON），每行提交到线程池，
+同时在途的行数有上限；结果按完成顺序逐行产出。内存占用只与在途窗口有关，与批量大小无关
+"""
+import csv
+import io
+import json
+from concurrent.futures import FIRST_COMPLETED, wait
+
+CSV_FIELDS = ('birth_date', 'birth_time', 'gender', 'timezone')
+_CHUNK_SIZE = 64 * 1024
+_SEPARATORS = ' \t\r\n,'
+
+
+def iter_csv_rows(stream):
+    """
+    逐行读取 CSV（首行为表头，至少包含 birth_date、birth_time）
+
+    参数:
+        stream: 二进制文件对象（如 request.stream）
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def iter_json_rows(stream):
+    """
+    逐个读取 JSON 数组的元素（也兼容每行一个对象的 NDJSON），不把整个请求体读入内存
+
+    参数:
+        stream: 二进制文件对象（如 request.stream）
+
+    异常:
+        ValueError: JSON 格式错误
+    """
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if not started and position < len(buffer):
+            started = True
+            if buffer[position] == '[':
+                position += 1
+                continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"JSON 格式错误: {e}") from e
+                item = None
+            else:
+                # 缓冲区末尾的数字 / 字面量可能被截断，读到更多内容或 EOF 后再确认
+                if end < len(buffer) or eof or isinstance(item, (dict, list, str)):
+                    position = end
+                    yield item
+                    continue
+        elif eof:
+            return
+        chunk = reader.read(_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_rows(stream, content_type):
+    """按 Content-Type 选择 CSV 或 JSON 解析"""
+    if 'csv' in (content_type or ''):
+        return iter_csv_rows(stream)
+    return iter_json_rows(stream)
+
+
+def iter_results(rows, handler, executor, max_in_flight):
+    """
+    并发处理各行，按完成顺序产出结果
+
+    参数:
+        rows: 可迭代的行（dict）
+        handler: 单行处理函数 row -> dict，抛出异常视为该行失败
+        executor: concurrent.futures 线程池
+        max_in_flight (int): 同时在途的行数上限
+
+    返回:
+        生成器，每项为 {'index': 行号, 'id': 行内 id（若有）, ...handler 的结果} 或 {'index', 'id', 'error'}
+    """
+    pending = set()
+
+    def drain(return_when):
+        nonlocal pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            yield future.result()
+
+    def run(index, row):
+        item = {'index': index}
+        if isinstance(row, dict) and row.get('id') is not None:
+            item['id'] = row['id']
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("每一行必须是对象")
+            item.update(handler(row))
+        except Exception as e:
+            item['error'] = str(e)
+        return item
+
+    try:
+        for index, row in enumerate(rows):
+            pending.add(executor.submit(run, index, row))
+            if len(pending) >= max_in_flight:
+                yield from drain(FIRST_COMPLETED)
+        while pending:
+            yield from drain(FIRST_COMPLETED)
+    finally:
+        # 客户端断开（生成器被关闭）时，尚未开始的行不再执行
+        for future in pending:
+            future.cancel()
+
+
+def ndjson_line(item):
+    return json.dumps(item, ensure_ascii=False) + '\n'
@@ -4,7 +4,8 @@
 """
 import json
 from mcp_client import call_bazi_mcp, parse_datetime_input
-from datetime import datetime
+# mcp_client 已把仓库根目录加入 sys.path
+from bazi_core.chart import as_chart
 
 
 class BaziFortuneTeller:
@@ -44,59 +45,43 @@ class BaziFortuneTeller:
     
     def print_basic_info(self, bazi_result):
         """打印基本信息"""
+        chart = as_chart(bazi_result)
         print("\n" + "="*60)
         print("📋 基本信息")
         print("="*60)
-        print(f"性别：{bazi_result.get('性别', '')}")
-        print(f"阳历：{bazi_result.get('阳历', '')}")
-        print(f"农历：{bazi_result.get('农历', '')}")
-        print(f"生肖：{bazi_result.get('生肖', '')} 🐯" if '虎' in str(bazi_result.get('生肖', '')) else f"生肖：{bazi_result.get('生肖', '')}")
-        print(f"八字：{bazi_result.get('八字', '')}")
-        print(f"日主：{bazi_result.get('日主', '')} (你的核心五行)")
+        print(f"性别：{chart.gender_name}")
+        print(f"阳历：{chart.solar_text}")
+        print(f"农历：{chart.lunar_text}")
+        print(f"生肖：{chart.zodiac} 🐯" if '虎' in chart.zodiac else f"生肖：{chart.zodiac}")
+        print(f"八字：{chart.bazi}")
+        print(f"日主：{chart.day_master_name} (你的核心五行)")
     
     def print_four_pillars(self, bazi_result):
         """打印四柱详情"""
+        chart = as_chart(bazi_result)
         print("\n" + "="*60)
         print("🏛️  四柱详解（年月日时）")
         print("="*60)
         
-        pillars = [
-            ('年柱', bazi_result.get('年柱', {})),
-            ('月柱', bazi_result.get('月柱', {})),
-            ('日柱', bazi_result.get('日柱', {})),
-            ('时柱', bazi_result.get('时柱', {}))
-        ]
-        
-        for name, pillar in pillars:
-            if not pillar:
-                continue
-            
-            tian_gan = pillar.get('天干', {})
-            di_zhi = pillar.get('地支', {})
+        for i, name in enumerate(['年柱', '月柱', '日柱', '时柱']):
+            pillar = chart.pillar(i)
             
             print(f"\n【{name}】")
-            print(f"  天干：{tian_gan.get('天干', '')} ({tian_gan.get('五行', '')}{tian_gan.get('阴阳', '')})", end="")
-            if tian_gan.get('十神'):
-                print(f" - {tian_gan.get('十神', '')}", end="")
+            print(f"  天干：{pillar.gan_name} ({pillar.gan_wuxing}{pillar.gan_yinyang})", end="")
+            if pillar.shishen:
+                print(f" - {pillar.shishen}", end="")
             print()
             
-            print(f"  地支：{di_zhi.get('地支', '')} ({di_zhi.get('五行', '')}{di_zhi.get('阴阳', '')})")
+            print(f"  地支：{pillar.zhi_name} ({pillar.zhi_wuxing}{pillar.zhi_yinyang})")
             
-            # 地支藏干
-            cang_gan = di_zhi.get('藏干', {})
-            if cang_gan:
+            # 地支藏干（主气 / 中气 / 余气）
+            hidden = pillar.hidden
+            if hidden:
                 print(f"  藏干：", end="")
-                parts = []
-                if cang_gan.get('主气'):
-                    parts.append(f"{cang_gan['主气'].get('天干', '')}({cang_gan['主气'].get('十神', '')})")
-                if cang_gan.get('中气'):
-                    parts.append(f"{cang_gan['中气'].get('天干', '')}({cang_gan['中气'].get('十神', '')})")
-                if cang_gan.get('余气'):
-                    parts.append(f"{cang_gan['余气'].get('天干', '')}({cang_gan['余气'].get('十神', '')})")
-                print(" / ".join(parts))
+                print(" / ".join(f"{gan}({shishen})" for gan, shishen in hidden))
             
-            print(f"  纳音：{pillar.get('纳音', '')}")
-            print(f"  运势：{pillar.get('星运', '')} (自坐{pillar.get('自坐', '')})")
+            print(f"  纳音：{pillar.nayin}")
+            print(f"  运势：{pillar.xingyun} (自坐{pillar.zizuo})")
     
     def print_wuxing_analysis(self, bazi_result):
         """打印五行分析"""
@@ -105,18 +90,7 @@ class BaziFortuneTeller:
         print("="*60)
         
         # 统计五行
-        wuxing_count = {'木': 0, '火': 0, '土': 0, '金': 0, '水': 0}
-        
-        pillars = ['年柱', '月柱', '日柱', '时柱']
-        for pillar_name in pillars:
-            pillar = bazi_result.get(pillar_name, {})
-            if pillar:
-                tg_wx = pillar.get('天干', {}).get('五行', '')
-                dz_wx = pillar.get('地支', {}).get('五行', '')
-                if tg_wx in wuxing_count:
-                    wuxing_count[tg_wx] += 1
-                if dz_wx in wuxing_count:
-                    wuxing_count[dz_wx] += 1
+        wuxing_count = as_chart(bazi_result).wuxing_counts()
         
         # 打印统计
         print("\n五行数量统计：")
@@ -138,59 +112,50 @@ class BaziFortuneTeller:
     
     def print_dayun(self, bazi_result):
         """打印大运"""
-        dayun_data = bazi_result.get('大运', {})
-        if not dayun_data or '大运' not in dayun_data:
+        chart = as_chart(bazi_result)
+        if not chart.dayun():
             return
         
         print("\n" + "="*60)
         print("🔮 大运分析（人生阶段运势）")
         print("="*60)
         
-        print(f"\n起运年龄：{dayun_data.get('起运年龄', '')}岁")
-        print(f"起运日期：{dayun_data.get('起运日期', '')}")
+        print(f"\n起运年龄：{chart.dayun_start_age}岁")
+        print(f"起运日期：{chart.dayun_start_text}")
         
-        dayun_list = dayun_data.get('大运', [])
-        current_year = datetime.now().year
+        current = chart.current_dayun()
         
         print("\n运势列表：")
-        for i, yun in enumerate(dayun_list[:6], 1):  # 显示前6个大运
-            gan_zhi = yun.get('干支', '')
-            start_year = yun.get('开始年份', '')
-            end_year = yun.get('结束', '')
-            start_age = yun.get('开始年龄', '')
-            end_age = yun.get('结束年龄', '')
-            tian_gan_shishen = yun.get('天干十神', '')
-            
+        for i, yun in enumerate(chart.dayun()[:6], 1):  # 显示前6个大运
             # 判断是否当前大运
-            is_current = start_year <= current_year <= end_year if isinstance(start_year, int) else False
-            marker = "👉 " if is_current else "   "
+            marker = "👉 " if yun is current else "   "
             
-            print(f"{marker}{i}. {gan_zhi} ({start_year}-{end_year}年, {start_age}-{end_age}岁) - {tian_gan_shishen}")
+            print(f"{marker}{i}. {yun.ganzhi} ({yun.start_year}-{yun.end_year}年, {yun.start_age}-{yun.end_age}岁) - {yun.gan_shishen}")
     
     def print_shensha(self, bazi_result):
         """打印神煞"""
-        shensha = bazi_result.get('神煞', {})
-        if not shensha:
+        chart = as_chart(bazi_result)
+        if not chart.has_shensha:
             return
         
         print("\n" + "="*60)
         print("⭐ 神煞分析")
         print("="*60)
         
-        pillars = ['年柱', '月柱', '日柱', '时柱']
-        for pillar_name in pillars:
-            sha_list = shensha.get(pillar_name, [])
+        for i, pillar_name in enumerate(['年柱', '月柱', '日柱', '时柱']):
+            sha_list = chart.shensha_names(i)
             if sha_list:
                 print(f"\n{pillar_name}：{', '.join(sha_list[:8])}")  # 只显示前8个
     
     def print_fortune_summary(self, bazi_result):
         """打印运势总结"""
+        chart = as_chart(bazi_result)
         print("\n" + "="*60)
         print("💡 简要总结")
         print("="*60)
         
-        ri_zhu = bazi_result.get('日主', '')
-        bazi_str = bazi_result.get('八字', '')
+        ri_zhu = chart.day_master_name
+        bazi_str = chart.bazi
         
         print(f"\n你的日主是【{ri_zhu}】，八字为【{bazi_str}】")
         print("\n这份命盘的特点：")
@@ -211,13 +176,14 @@ class BaziFortuneTeller:
         if not bazi_result:
             return
         
-        # 打印各部分
-        self.print_basic_info(bazi_result)
-        self.print_four_pillars(bazi_result)
-        self.print_wuxing_analysis(bazi_result)
-        self.print_dayun(bazi_result)
-        self.print_shensha(bazi_result)
-        self.print_fortune_summary(bazi_result)
+        # 打印各部分（解析一次，各部分共用）
+        chart = as_chart(bazi_result)
+        self.print_basic_info(chart)
+        self.print_four_pillars(chart)
+        self.print_wuxing_analysis(chart)
+        self.print_dayun(chart)
+        self.print_shensha(chart)
+        self.print_fortune_summary(chart)
         
         # 保存原始数据
         print("\n" + "="*60)
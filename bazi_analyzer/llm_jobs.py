@@ -0,0 +1,214 @@
+"""
+大模型解读的后台任务队列 - 进程内线程池 + SQLite 任务表
+
+    queue = JobQueue(analyze_with_llm, 'llm_jobs.sqlite3', model=LLM_MODEL)
+    job = queue.submit(bazi_result)         # 立即返回 {'id', 'status', 'analysis'}
+    for job in queue.watch(job['id']):      # 状态变化时产出，直到 done / failed
+        ...
+
+同一命盘（chart hash = 模型名 + 排盘 JSON 的 sha256）的解读完成后缓存在 interpretations 表，
+再次提交直接返回 done；相同命盘正在生成时复用同一个任务。进程重启后未完成的任务重新入队。
+任务表中的排盘以 bazi_core.codec 的二进制编码保存（早先写入的 JSON 文本仍可读取）
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from bazi_core import codec
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    chart_hash TEXT NOT NULL,
+    chart BLOB NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_chart_hash ON jobs (chart_hash, status);
+CREATE TABLE IF NOT EXISTS interpretations (
+    chart_hash TEXT PRIMARY KEY,
+    analysis TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def chart_hash(bazi_result, model=''):
+    """命盘 + 模型 -> 缓存键"""
+    payload = json.dumps(bazi_result, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(f"{model}\n{payload}".encode('utf-8')).hexdigest()
+
+
+def _dump_chart(bazi_result):
+    """排盘 -> 任务表中保存的值（无法编码时退回 JSON 文本）"""
+    try:
+        return codec.encode(bazi_result)
+    except ValueError:
+        return json.dumps(bazi_result, ensure_ascii=False)
+
+
+def _load_chart(value):
+    return json.loads(value) if isinstance(value, str) else codec.decode_dict(value)
+
+
+class JobQueue:
+    """
+    解读任务队列（线程安全）
+
+    参数:
+        worker (callable): bazi_result -> 解读文本；抛出异常或返回以 "⚠️" 开头的文本视为失败（不缓存）
+        db_path (str): SQLite 文件路径
+        workers (int): 并发生成的线程数
+        model (str): 参与缓存键，换模型后不会命中旧解读
+    """
+
+    def __init__(self, worker, db_path, workers=2, model=''):
+        self.worker = worker
+        self.db_path = db_path
+        self.model = model
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-job')
+        self._changed = threading.Condition()
+        self._version = 0  # 每次状态变化 +1，watch 据此判断是否错过了通知
+        self._submit_lock = threading.Lock()
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+        self._resume()
+
+    @contextmanager
+    def _connect(self):
+        """每次操作一个连接（跨线程安全），退出时提交并关闭"""
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _resume(self, stale_after=300):
+        """
+        重新入队未完成的任务：pending 的，以及 running 超过 stale_after 秒未更新的（生成它的进程已退出）
+
+        多个进程共用同一个任务表时，_run 的原子领取保证同一任务只执行一次
+        """
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ? WHERE status = ? AND updated_at < ?",
+                       (PENDING, RUNNING, time.time() - stale_after))
+            rows = db.execute("SELECT id FROM jobs WHERE status = ?", (PENDING,)).fetchall()
+        for row in rows:
+            self._executor.submit(self._run, row['id'])
+        if rows:
+            print(f"[LLM_JOBS] 重新入队 {len(rows)} 个未完成任务", flush=True)
+
+    def _set_status(self, job_id, status, error=None):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                       (status, error, time.time(), job_id))
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def _run(self, job_id):
+        with self._connect() as db:
+            claimed = db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                                 (RUNNING, time.time(), job_id, PENDING)).rowcount
+            row = db.execute("SELECT chart_hash, chart FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not claimed:
+            return  # 已被其他线程 / 进程领取
+        self._notify()
+        start = time.perf_counter()
+        try:
+            analysis = self.worker(_load_chart(row['chart']))
+            if not analysis or analysis.startswith('⚠️'):
+                raise RuntimeError(analysis or '大模型返回为空')
+        except Exception as e:
+            print(f"[LLM_JOBS] 任务 {job_id} 失败: {e}", flush=True)
+            self._set_status(job_id, FAILED, str(e))
+            return
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO interpretations (chart_hash, analysis, created_at) VALUES (?, ?, ?)",
+                       (row['chart_hash'], analysis, time.time()))
+        self._set_status(job_id, DONE)
+        print(f"[LLM_JOBS] 任务 {job_id} 完成 ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    def submit(self, bazi_result):
+        """
+        提交解读任务（不等待生成）
+
+        返回:
+            dict: 任务状态，见 get()；命中缓存时 status 已为 done 且带 analysis
+        """
+        key = chart_hash(bazi_result, self.model)
+        now = time.time()
+        with self._submit_lock, self._connect() as db:
+            cached = db.execute("SELECT 1 FROM interpretations WHERE chart_hash = ?", (key,)).fetchone()
+            running = None if cached else db.execute(
+                "SELECT id FROM jobs WHERE chart_hash = ? AND status IN (?, ?) LIMIT 1",
+                (key, PENDING, RUNNING)).fetchone()
+            if running:
+                job_id = running['id']
+            else:
+                job_id = uuid.uuid4().hex
+                db.execute("INSERT INTO jobs (id, chart_hash, chart, status, created_at, updated_at) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (job_id, key, _dump_chart(bazi_result),
+                            DONE if cached else PENDING, now, now))
+        if not cached and not running:
+            self._executor.submit(self._run, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        任务状态
+
+        返回:
+            dict: {'id', 'status', 'error', 'analysis'（done 时）}；任务不存在时返回 None
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT j.id, j.status, j.error, i.analysis FROM jobs j "
+                "LEFT JOIN interpretations i ON i.chart_hash = j.chart_hash AND j.status = ? "
+                "WHERE j.id = ?", (DONE, job_id)).fetchone()
+        return dict(row) if row else None
+
+    def watch(self, job_id, timeout=120, heartbeat=15):
+        """
+        跟踪任务直到结束：状态变化时产出任务 dict，超过 heartbeat 秒无变化时产出 None（用于保活）
+
+        超过 timeout 秒仍未结束则停止（任务本身继续在后台执行）
+        """
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while True:
+            version = self._version
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield job
+            if job['status'] in FINISHED:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            with self._changed:
+                notified = self._changed.wait_for(lambda: self._version != version, min(heartbeat, remaining))
+            if not notified and time.monotonic() < deadline:
+                yield None
@@ -1,12 +1,17 @@
 """
 Bazi MCP Client - 独立版本
-用于直接调用 MCP 工具并输出完整排盘信息
+用于直接调用 MCP 工具并输出完整排盘信息（常驻 bazi-mcp 进程，JSON-RPC 流水线）
 """
-import subprocess
 import json
 import logging
+import os
+import sys
 from datetime import datetime
 
+# 仓库根目录下的共享包（bazi_core：原生排盘、MCP 常驻客户端）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bazi_core.mcp_client import MCPError, get_client
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -26,100 +31,38 @@ def call_bazi_mcp(solar_datetime=None, lunar_datetime=None, gender=1, provider_s
         None: 调用失败时返回None
     """
     try:
-        # 构建工具参数
-        tool_args = {
-            "gender": gender,
-            "eightCharProviderSect": provider_sect
-        }
-        
-        if solar_datetime:
-            tool_args["solarDatetime"] = solar_datetime
-        elif lunar_datetime:
-            tool_args["lunarDatetime"] = lunar_datetime
-        else:
-            logger.error("必须提供 solar_datetime 或 lunar_datetime 之一")
-            return None
-        
-        # 构建 MCP 请求（JSON-RPC 格式）
-        mcp_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "tools/call",
-            "params": {
-                "name": "getBaziDetail",
-                "arguments": tool_args
-            }
-        }
-        
-        request_json = json.dumps(mcp_request)
         logger.info(f"发送 MCP 请求...")
-        
-        # 启动 MCP 服务器进程（stdio 模式）
-        process = subprocess.Popen(
-            ["npx", "bazi-mcp"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            shell=True
+        bazi_result = get_client().get_bazi_detail(
+            solar_datetime=solar_datetime,
+            lunar_datetime=lunar_datetime,
+            gender=gender,
+            provider_sect=provider_sect,
         )
-        
-        # 发送请求并获取响应
-        stdout, stderr = process.communicate(input=request_json + "\n", timeout=15)
-        
-        if stderr:
-            logger.debug(f"MCP stderr: {stderr[:200]}")
-        
-        if not stdout:
-            logger.error("MCP 服务器无响应")
-            return None
-        
-        # 解析响应
-        lines = stdout.strip().split('\n')
-        for line in lines:
-            try:
-                response = json.loads(line)
-                if "result" in response:
-                    result_data = response["result"]
-                    
-                    # MCP 可能返回 content 数组格式
-                    if isinstance(result_data, dict) and "content" in result_data:
-                        content_list = result_data["content"]
-                        if content_list and len(content_list) > 0:
-                            text_content = content_list[0].get("text", "")
-                            if text_content:
-                                bazi_result = json.loads(text_content)
-                                logger.info("✅ 成功获取八字排盘")
-                                return bazi_result
-                    else:
-                        bazi_result = result_data
-                        if isinstance(bazi_result, str):
-                            bazi_result = json.loads(bazi_result)
-                        logger.info("✅ 成功获取八字排盘")
-                        return bazi_result
-                        
-                elif "error" in response:
-                    logger.error(f"MCP 返回错误: {response['error']}")
-                    return None
-            except json.JSONDecodeError:
-                continue
-        
-        logger.error("无法解析 MCP 响应")
-        return None
-        
-    except subprocess.TimeoutExpired:
-        logger.error("MCP 调用超时")
-        process.kill()
-        return None
-    except Exception as e:
-        logger.error(f"调用 MCP 发生异常: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.info("✅ 成功获取八字排盘")
+        return bazi_result
+    except (MCPError, ValueError) as e:
+        logger.error(f"调用 MCP 失败: {e}")
         return None
 
 
+def call_bazi_mcp_many(charts, timeout=None):
+    """
+    批量排盘：所有请求在同一个 MCP 进程上流水线发送
+
+    参数:
+        charts (list): [{'solar_datetime': ..., 'gender': ...}, ...]
+
+    返回:
+        list: 与 charts 一一对应的排盘 dict，失败的项为 None
+    """
+    try:
+        results = get_client().call_many(charts, timeout=timeout)
+    except MCPError as e:
+        logger.error(f"调用 MCP 失败: {e}")
+        return [None] * len(charts)
+    return [None if isinstance(r, Exception) else r for r in results]
+
+
 def parse_datetime_input(date_str, time_str, timezone="+08:00"):
     """
     将用户输入的日期时间转换为 ISO 格式
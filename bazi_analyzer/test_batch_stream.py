@@ -0,0 +1,54 @@
+"""
+iter_json_rows：JSON 被读取块切在任意位置（对象、字符串、数字 / 字面量中间）时结果不变
+"""
+import io
+import json
+
+import pytest
+
+import batch_stream
+from batch_stream import iter_json_rows
+
+ROWS = [
+    {'birth_date': '1998-07-31', 'birth_time': '14:10', 'gender': 1, 'id': 12345},
+    {'birth_date': '1995-05-20', 'birth_time': '08:30', 'gender': '女', 'note': '八字 "引号" \\ 反斜杠'},
+    [1, 2.5, True, None],
+    1234567,
+    {'nested': {'a': [{'b': 'c'}]}, 'n': -0.125},
+]
+
+
+@pytest.fixture(params=[1, 2, 3, 7, 64])
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(batch_stream, '_CHUNK_SIZE', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('body', [
+    json.dumps(ROWS, ensure_ascii=False),
+    json.dumps(ROWS, ensure_ascii=False, indent=2),
+    '\n'.join(json.dumps(row, ensure_ascii=False) for row in ROWS) + '\n',
+    '\ufeff' + json.dumps(ROWS, ensure_ascii=False),
+])
+def test_rows_split_across_chunks(body, chunk_size):
+    assert list(iter_json_rows(io.BytesIO(body.encode('utf-8')))) == ROWS
+
+
+def test_trailing_number_at_chunk_boundary(monkeypatch):
+    # 数字恰好在缓冲区末尾：必须读到更多内容后才能确定
+    monkeypatch.setattr(batch_stream, '_CHUNK_SIZE', 4)
+    assert list(iter_json_rows(io.BytesIO(b'[1234, 56789]'))) == [1234, 56789]
+    assert list(iter_json_rows(io.BytesIO(b'1234\n56789'))) == [1234, 56789]
+
+
+def test_empty_bodies():
+    assert list(iter_json_rows(io.BytesIO(b''))) == []
+    assert list(iter_json_rows(io.BytesIO(b'[]'))) == []
+    assert list(iter_json_rows(io.BytesIO(b' [ ] '))) == []
+
+
+def test_malformed_json_raises(chunk_size):
+    rows = iter_json_rows(io.BytesIO(b'[{"birth_date": "1998-07-31"}, {"birth_time": ]'))
+    assert next(rows) == {'birth_date': '1998-07-31'}
+    with pytest.raises(ValueError):
+        next(rows)
@@ -0,0 +1,238 @@
+"""
+JobQueue：相同命盘去重、原子领取、重启后重新入队、watch 心跳 / 超时、任务表中排盘的二进制编码
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import llm_jobs
+from llm_jobs import DONE, FAILED, PENDING, RUNNING, JobQueue, chart_hash
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bazi_result_19980731.json')
+
+
+@pytest.fixture(scope='module')
+def sample():
+    with open(SAMPLE_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class StubLLM:
+    """记录调用的假大模型；gate 未 set 时阻塞，便于观察 running 状态"""
+
+    def __init__(self, reply='解读'):
+        self.reply = reply
+        self.calls = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, bazi_result):
+        self.calls.append(bazi_result)
+        self.started.set()
+        self.gate.wait(5)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(worker, **kwargs):
+        queue = JobQueue(worker, str(tmp_path / 'jobs.sqlite3'), **kwargs)
+        queues.append((queue, worker))
+        return queue
+
+    yield make
+    for queue, worker in queues:
+        if isinstance(worker, StubLLM):
+            worker.gate.set()
+        queue._executor.shutdown(wait=True)
+
+
+def wait_status(queue, job_id, status, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"任务 {job_id} 未进入 {status}: {queue.get(job_id)}")
+
+
+def raw_rows(queue, sql, *params):
+    db = sqlite3.connect(queue.db_path)
+    try:
+        return db.execute(sql, params).fetchall()
+    finally:
+        db.close()
+
+
+def test_chart_stored_as_codec_blob(make_queue, sample):
+    llm = StubLLM()
+    queue = make_queue(llm)
+    job = queue.submit(sample)
+    wait_status(queue, job['id'], DONE)
+    (stored,), = raw_rows(queue, "SELECT chart FROM jobs WHERE id = ?", job['id'])
+    assert isinstance(stored, bytes)
+    assert llm.calls == [sample]
+
+
+def test_unencodable_chart_falls_back_to_json(make_queue):
+    llm = StubLLM()
+    queue = make_queue(llm)
+    chart = {'八字': '任意结构', 'n': [1, 2]}
+    assert isinstance(llm_jobs._dump_chart(chart), str)
+    job = queue.submit(chart)
+    wait_status(queue, job['id'], DONE)
+    assert llm.calls == [chart]
+
+
+def test_legacy_json_text_is_readable(sample):
+    text = json.dumps(sample, ensure_ascii=False)
+    assert llm_jobs._load_chart(text) == sample
+    assert llm_jobs._load_chart(llm_jobs._dump_chart(sample)) == sample
+
+
+def test_submit_reuses_running_job_then_cache(make_queue, sample):
+    llm = StubLLM(reply='甲木生于未月')
+    llm.gate.clear()
+    queue = make_queue(llm)
+    first = queue.submit(sample)
+    assert llm.started.wait(2)
+    second = queue.submit(sample)
+    assert second['id'] == first['id']
+    assert second['status'] == RUNNING
+
+    llm.gate.set()
+    done = wait_status(queue, first['id'], DONE)
+    assert done['analysis'] == '甲木生于未月'
+
+    cached = queue.submit(sample)
+    assert cached['id'] != first['id']
+    assert cached['status'] == DONE and cached['analysis'] == '甲木生于未月'
+    assert len(llm.calls) == 1
+
+
+def test_model_is_part_of_cache_key(sample):
+    assert chart_hash(sample, 'qwen') != chart_hash(sample, 'llama')
+    assert chart_hash(sample, 'qwen') == chart_hash(dict(reversed(list(sample.items()))), 'qwen')
+
+
+@pytest.mark.parametrize('reply', ['⚠️ 模型不可用', '', RuntimeError('连接被拒绝')])
+def test_failure_is_not_cached(make_queue, sample, reply):
+    llm = StubLLM(reply=reply)
+    queue = make_queue(llm)
+    job = wait_status(queue, queue.submit(sample)['id'], FAILED)
+    assert job['error'] and job['analysis'] is None
+
+    llm.reply = '重试成功'
+    retry = queue.submit(sample)
+    assert retry['id'] != job['id']
+    assert wait_status(queue, retry['id'], DONE)['analysis'] == '重试成功'
+
+
+def test_run_claims_job_once(make_queue, sample):
+    llm = StubLLM()
+    llm.gate.clear()
+    queue = make_queue(llm)
+    job = queue.submit(sample)
+    assert llm.started.wait(2)
+    # 任务已被领取（running）：再次执行直接返回，不会重复调用大模型
+    queue._run(job['id'])
+    llm.gate.set()
+    wait_status(queue, job['id'], DONE)
+    queue._run(job['id'])
+    assert len(llm.calls) == 1
+
+
+def test_concurrent_claims_run_once(make_queue, sample):
+    llm = StubLLM()
+    queue = make_queue(llm)
+    now = time.time()
+    db = sqlite3.connect(queue.db_path)
+    with db:
+        db.execute("INSERT INTO jobs (id, chart_hash, chart, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                   ('j1', chart_hash(sample), llm_jobs._dump_chart(sample), PENDING, now, now))
+    db.close()
+    threads = [threading.Thread(target=queue._run, args=('j1',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert queue.get('j1')['status'] == DONE
+    assert len(llm.calls) == 1
+
+
+def test_resume_after_restart(make_queue, sample):
+    db_path = make_queue(StubLLM()).db_path  # 建表
+    now = time.time()
+    rows = [
+        ('pending', PENDING, now),
+        ('stale', RUNNING, now - 3600),   # 生成它的进程已退出
+        ('fresh', RUNNING, now),          # 可能仍在其他进程中生成
+        ('done', DONE, now - 3600),
+    ]
+    db = sqlite3.connect(db_path)
+    with db:
+        for job_id, status, updated_at in rows:
+            chart = dict(sample, 备注=job_id)
+            db.execute("INSERT INTO jobs (id, chart_hash, chart, status, created_at, updated_at) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (job_id, chart_hash(chart), llm_jobs._dump_chart(chart), status, updated_at, updated_at))
+    db.close()
+
+    llm = StubLLM()
+    queue = make_queue(llm)
+    wait_status(queue, 'pending', DONE)
+    wait_status(queue, 'stale', DONE)
+    assert queue.get('fresh')['status'] == RUNNING
+    assert sorted(call['备注'] for call in llm.calls) == ['pending', 'stale']
+
+
+def test_watch_heartbeat_then_done(make_queue, sample):
+    llm = StubLLM(reply='完成')
+    llm.gate.clear()
+    queue = make_queue(llm)
+    job = queue.submit(sample)
+    assert llm.started.wait(2)
+
+    events = []
+    for event in queue.watch(job['id'], timeout=5, heartbeat=0.05):
+        events.append(event)
+        if events.count(None) == 3:
+            llm.gate.set()
+    statuses = [event and event['status'] for event in events]
+    assert statuses[0] == RUNNING
+    assert statuses.count(None) >= 3
+    assert statuses[-1] == DONE and events[-1]['analysis'] == '完成'
+    # 只在状态变化时产出任务
+    assert [s for s in statuses if s] == [RUNNING, DONE]
+
+
+def test_watch_stops_at_timeout(make_queue, sample):
+    llm = StubLLM()
+    llm.gate.clear()
+    queue = make_queue(llm)
+    job = queue.submit(sample)
+    assert llm.started.wait(2)
+
+    start = time.monotonic()
+    events = list(queue.watch(job['id'], timeout=0.3, heartbeat=0.1))
+    assert time.monotonic() - start < 1.5
+    assert events[0]['status'] == RUNNING
+    assert all(event is None for event in events[1:])
+    # 任务本身继续在后台执行
+    llm.gate.set()
+    wait_status(queue, job['id'], DONE)
+
+
+def test_watch_unknown_job(make_queue):
+    queue = make_queue(StubLLM())
+    assert list(queue.watch('missing', timeout=1)) == []
@@ -0,0 +1,3 @@
+"""
+bazi_core - 进程内八字排盘（web_app 与 bazi_analyzer 共用）
+"""
@@ -0,0 +1,53 @@
+"""
+日主原型 - 预生成回答（l4_answer_variant）的键：(日干编码, 强弱)
+
+在线顾问（advisor.views.classify_day_master）与离线生成脚本（data_generation/generate_answer_variants.py）
+共用这里的定义，阈值或编码改动后两边同时生效
+"""
+from . import tables
+from .chart import as_chart
+
+# 强弱编码 0-2
+BALANCE_CLASSES = ('weak', 'balanced', 'strong')
+# 比劫 + 印 的个数：≤ WEAK_MAX 为弱，≤ BALANCED_MAX 为中和，其余为旺
+WEAK_MAX = 2
+BALANCED_MAX = 4
+
+
+def stem_element(stem):
+    """天干（如 '甲'）-> 五行（'木'），不是天干时返回 None"""
+    index = tables.GAN.find(stem or '')
+    return tables.WUXING[tables.GAN_WUXING[index]] if stem and index >= 0 else None
+
+
+def resource_element(element):
+    """生该五行者（印），如 木 -> 水"""
+    return tables.WUXING[(tables.WUXING.index(element) - 1) % 5]
+
+
+def balance_class(support):
+    """比劫 + 印 的个数 -> 强弱编码"""
+    return 0 if support <= WEAK_MAX else 1 if support <= BALANCED_MAX else 2
+
+
+def day_master_archetype(chart):
+    """
+    把八字归入预生成回答的原型
+
+    参数:
+        chart (Chart | dict): 排盘
+
+    返回:
+        (int, int): (日干在 tables.GAN 中的序号, 强弱编码)；缺少八字数据时返回 None
+    """
+    chart = as_chart(chart)
+    if not chart:
+        return None
+    day_master = chart.day_master_name
+    element = stem_element(day_master)
+    if not element:
+        return None
+
+    counts = chart.wuxing_counts()
+    support = counts.get(element, 0) + counts.get(resource_element(element), 0)
+    return tables.GAN.index(day_master), balance_class(support)
@@ -0,0 +1,185 @@
+"""
+批量排盘 - 对 NumPy 数组形式的生辰一次性计算四柱、五行计数、日主和起运年龄
+
+全部为数组运算：四柱编码优先从 mmap 查找表（pillar_table）按下标取，没有查找表时
+节气边界用 searchsorted 定位、干支由六十甲子的模运算得到；
+百万级生辰在一秒量级内完成。规则与 engine.bazi_detail 完全相同（逐行结果一致）
+"""
+from datetime import date
+
+import numpy as np
+
+from . import tables
+from .engine import day_index
+from .pillar_table import get_pillar_table
+from .relations import branch_masks, stem_masks
+from .shensha import pillar_mask_array
+from .solar_terms import get_table
+
+_GAN_WUXING = np.array(tables.GAN_WUXING, dtype=np.int8)
+_ZHI_WUXING = np.array(tables.ZHI_WUXING, dtype=np.int8)
+_DAY_INDEX_1970 = day_index(date(1970, 1, 1))
+_BEIJING_OFFSET = 8 * 3600
+_PILLAR_KEYS = ('year', 'month', 'day', 'hour')
+
+_jie_array = None
+
+
+def _jie():
+    global _jie_array
+    if _jie_array is None:
+        _jie_array = np.asarray(get_table().jie, dtype=np.int64)
+    return _jie_array
+
+
+def to_unix_seconds(timestamps):
+    """
+    统一为 Unix 时间戳（秒，int64）
+
+    整数数组视为 Unix 时间戳；datetime64 数组视为北京时间（与 engine 中无时区时间的约定一致）
+    """
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[s]').astype(np.int64) - _BEIJING_OFFSET
+    return timestamps.astype(np.int64)
+
+
+def _compute_codes(unix, local, provider_sect):
+    """没有 mmap 查找表时直接计算四柱编码（结构同 PillarTable.lookup_arrays）"""
+    jie = _jie()
+    position = np.searchsorted(jie, unix, side='right') - 1
+    if unix.size and (position.min() < 0 or position.max() + 1 >= len(jie)):
+        raise ValueError("timestamps outside solar term table")
+
+    # jie 列表每年 12 个“节”，第 0 个为小寒（丑月，属上一年）
+    term_year = get_table().start_year + position // 12
+    jie_in_year = position % 12
+    year = term_year - (jie_in_year == 0)
+    month_offset = (jie_in_year - 1) % 12
+    year_index = (year - 4) % 60
+    month_gan = (year_index % 10 % 5 * 2 + 2 + month_offset) % 10
+    month_zhi = (month_offset + 2) % 12
+
+    today = (_DAY_INDEX_1970 + local // 86400) % 60
+    hour = local % 86400 // 3600
+    late_zi = hour >= 23
+    hour_zhi = (hour + 1) // 2 % 12
+    hour_gan = ((today + late_zi) % 60 % 10 % 5 * 2 + hour_zhi) % 10
+    return {
+        'year': year_index,
+        'month': _ganzhi_index(month_gan, month_zhi),
+        'day': (today + (late_zi & (provider_sect == 1))) % 60,
+        'hour': _ganzhi_index(hour_gan, hour_zhi),
+        'jie': position,
+    }
+
+
+def _ganzhi_index(gan, zhi):
+    return (6 * gan.astype(np.int64) - 5 * zhi.astype(np.int64)) % 60
+
+
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+
+def _days_in_month(month_serial):
+    """month_serial = 年 * 12 + (月 - 1) -> 该月天数"""
+    year, month = np.divmod(month_serial, 12)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return _MONTH_DAYS[month] + ((month == 1) & leap)
+
+
+def _civil_from_days(days):
+    """1970-01-01 起的天数 -> (年, 月, 日)（H. Hinnant 的整数算法，避免 datetime64 转换）"""
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    return yoe + era * 400 + (month <= 2), month, day
+
+
+def chart_arrays(timestamps, genders, provider_sect=2):
+    """
+    批量排盘
+
+    参数:
+        timestamps (array-like): Unix 时间戳（秒）或北京时间的 datetime64
+        genders (array-like | int): 性别，0-女，1-男（可广播）
+        provider_sect (int): 早晚子时配置，1 或 2
+
+    返回:
+        dict: 列式结果（n 为生辰个数）
+            'gan', 'zhi': (n, 4) int8，年月日时柱的天干 / 地支编码（见 tables.GAN / tables.ZHI）
+            'ganzhi': (n, 4) int8，六十甲子编码
+            'wuxing': (n, 5) int8，四柱天干地支的五行计数（木火土金水，同 count_wuxing）
+            'day_master': (n,) int8，日干编码
+            'forward': (n,) bool，大运是否顺排
+            'dayun_start_age': (n,) int16，起运年龄（虚岁，同 getBaziDetail 的 起运年龄）
+            'stem_relations': (n,) uint16，四柱天干的合冲关系位（见 bazi_core.relations）
+            'branch_relations': (n,) uint64，四柱地支的刑冲合会关系位
+            'shensha': (n, 4) uint32，年月日时柱的常用神煞位（见 bazi_core.shensha）
+
+    异常:
+        ValueError: 存在超出节气表范围的时间
+    """
+    unix = to_unix_seconds(timestamps)
+    genders = np.broadcast_to(np.asarray(genders), unix.shape)
+    local = unix + _BEIJING_OFFSET
+
+    table = get_pillar_table()
+    try:
+        if table is None:
+            raise ValueError("pillar table unavailable")
+        codes = table.lookup_arrays(local, provider_sect)
+        jie = table.jie_time
+    except ValueError:
+        # 查找表不可用或只覆盖 1900-2100：用节气表（1899-2101）直接计算
+        codes = _compute_codes(unix, local, provider_sect)
+        jie = _jie()
+    position = codes['jie']
+    year_index = codes['year']
+    gan = np.stack([codes[k] % 10 for k in _PILLAR_KEYS], axis=1).astype(np.int8)
+    zhi = np.stack([codes[k] % 12 for k in _PILLAR_KEYS], axis=1).astype(np.int8)
+    local_day = local // 86400
+    hour = local % 86400 // 3600
+
+    # 每行 8 个五行编码 -> 行号 * 5 + 五行，一次 bincount 得到计数
+    elements = np.concatenate([_GAN_WUXING[gan], _ZHI_WUXING[zhi]], axis=1).astype(np.int64)
+    elements += np.arange(unix.size, dtype=np.int64)[:, None] * 5
+    wuxing = np.bincount(elements.ravel(), minlength=unix.size * 5).reshape(-1, 5).astype(np.int8)
+
+    # 起运：到下一个 / 上一个“节”的分钟数按 4320/360/12 折算，年月先加，溢出天数逐月进位
+    forward = (year_index % 2 == 0) == (genders == 1)
+    target = np.where(forward, jie[np.minimum(position + 1, len(jie) - 1)], jie[position])
+    minutes = np.abs(target - unix) // 60
+    add_years, minutes = np.divmod(minutes, 4320)
+    add_months, minutes = np.divmod(minutes, 360)
+    add_days, minutes = np.divmod(minutes, 12)
+
+    birth_year, birth_month, birth_day = _civil_from_days(local_day)
+    day = birth_day + add_days + (hour + minutes * 2) // 24
+    month_serial = (birth_year + add_years) * 12 + birth_month - 1 + add_months
+    length = _days_in_month(month_serial)
+    overflow = day > length
+    while overflow.any():
+        day = np.where(overflow, day - length, day)
+        month_serial = month_serial + overflow
+        length = _days_in_month(month_serial)
+        overflow = day > length
+    start_age = month_serial // 12 - birth_year + 1
+
+    return {
+        'gan': gan,
+        'zhi': zhi,
+        'ganzhi': np.stack([codes[k] for k in _PILLAR_KEYS], axis=1).astype(np.int8),
+        'wuxing': wuxing,
+        'day_master': gan[:, 2].copy(),
+        'forward': forward,
+        'dayun_start_age': start_age.astype(np.int16),
+        'stem_relations': stem_masks(gan),
+        'branch_relations': branch_masks(zhi),
+        'shensha': pillar_mask_array(gan, zhi),
+    }
@@ -0,0 +1,437 @@
+"""
+紧凑排盘对象 - 由 getBaziDetail / bazi_detail 的 dict 解析一次得到
+
+四柱只存六十甲子编码，五行、十神、藏干、纳音、星运等按需由 tables 推出；
+五行计数、大运列表、当前大运在首次访问时计算并缓存。to_dict() 还原出与原 dict 相同的结构：
+
+    chart = Chart.from_dict(bazi_result)
+    chart.bazi, chart.day_master_name, chart.wuxing_counts()
+    chart.pillar(0).nayin, chart.current_dayun()
+    chart.to_dict() == bazi_result
+
+原 dict 中与本地规则推出的值不一致的字段（理论上不会出现）原样保存在 extra 中，还原和各访问方法都以它为准
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from . import tables
+from .engine import PILLAR_NAMES, _pillar_info, dayun_items, is_forward, ming_gong, shen_gong, tai_xi, tai_yuan
+from .relations import branch_mask, mcp_relations, stem_mask
+from .shensha import shensha_map
+
+# getBaziDetail 的键顺序；农历 / 神煞 / 大运 / 刑冲合会 可缺省（原生排盘不含农历、神煞、刑冲合会，
+# 后两者可由 relation_map / shensha_map 本地推出）
+FIELDS = ('性别', '阳历', '农历', '八字', '生肖', '日主', '年柱', '月柱', '日柱', '时柱',
+          '胎元', '胎息', '命宫', '身宫', '神煞', '大运', '刑冲合会')
+OPTIONAL_FIELDS = ('农历', '神煞', '大运', '刑冲合会')
+
+DayunStep = namedtuple('DayunStep', 'ganzhi start_year end_year gan_shishen zhi_shishen hidden start_age end_age')
+_DAYUN_KEYS = ('干支', '开始年份', '结束', '天干十神', '地支十神', '地支藏干', '开始年龄', '结束年龄')
+_MISSING = object()
+
+
+def ganzhi_code(name):
+    """'甲子' -> 六十甲子编码（无法识别时抛出 ValueError）"""
+    if len(name) != 2 or name[0] not in tables.GAN or name[1] not in tables.ZHI:
+        raise ValueError(f"invalid ganzhi: {name!r}")
+    return tables.ganzhi_index(tables.GAN.index(name[0]), tables.ZHI.index(name[1]))
+
+
+class Pillar:
+    """单柱的只读视图（由六十甲子编码推出各字段）"""
+
+    __slots__ = ('code', 'day_gan', 'is_day')
+
+    def __init__(self, code, day_gan, is_day=False):
+        self.code = code
+        self.day_gan = day_gan
+        self.is_day = is_day
+
+    @property
+    def gan(self):
+        return self.code % 10
+
+    @property
+    def zhi(self):
+        return self.code % 12
+
+    @property
+    def name(self):
+        return tables.ganzhi_name(self.code)
+
+    @property
+    def gan_name(self):
+        return tables.GAN[self.gan]
+
+    @property
+    def zhi_name(self):
+        return tables.ZHI[self.zhi]
+
+    @property
+    def gan_wuxing(self):
+        return tables.WUXING[tables.GAN_WUXING[self.gan]]
+
+    @property
+    def zhi_wuxing(self):
+        return tables.WUXING[tables.ZHI_WUXING[self.zhi]]
+
+    @property
+    def gan_yinyang(self):
+        return tables.gan_yinyang(self.gan)
+
+    @property
+    def zhi_yinyang(self):
+        return tables.zhi_yinyang(self.zhi)
+
+    @property
+    def shishen(self):
+        """天干十神（日柱为日主本身，返回 None）"""
+        return None if self.is_day else tables.shishen(self.day_gan, self.gan)
+
+    @property
+    def hidden(self):
+        """藏干 [(天干, 十神), ...]，按 主气 / 中气 / 余气 顺序"""
+        return [(tables.GAN[stem], tables.shishen(self.day_gan, stem)) for stem in tables.HIDDEN_STEMS[self.zhi]]
+
+    @property
+    def nayin(self):
+        return tables.nayin(self.code)
+
+    @property
+    def xingyun(self):
+        return tables.changsheng(self.day_gan, self.zhi)
+
+    @property
+    def zizuo(self):
+        return tables.changsheng(self.gan, self.zhi)
+
+    def to_dict(self):
+        return _pillar_info(self.code, self.day_gan, self.is_day)
+
+
+class RawPillar:
+    """与 Pillar 接口相同、直接读原 dict 的视图（仅用于 extra 中保存的柱）"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def _get(self, part, key):
+        return (self.data.get(part) or {}).get(key, '')
+
+    name = property(lambda self: self.gan_name + self.zhi_name)
+    gan_name = property(lambda self: self._get('天干', '天干'))
+    zhi_name = property(lambda self: self._get('地支', '地支'))
+    gan_wuxing = property(lambda self: self._get('天干', '五行'))
+    zhi_wuxing = property(lambda self: self._get('地支', '五行'))
+    gan_yinyang = property(lambda self: self._get('天干', '阴阳'))
+    zhi_yinyang = property(lambda self: self._get('地支', '阴阳'))
+    shishen = property(lambda self: (self.data.get('天干') or {}).get('十神'))
+    nayin = property(lambda self: self.data.get('纳音', ''))
+    xingyun = property(lambda self: self.data.get('星运', ''))
+    zizuo = property(lambda self: self.data.get('自坐', ''))
+
+    @property
+    def hidden(self):
+        hidden = self._get('地支', '藏干') or {}
+        return [(hidden[key].get('天干', ''), hidden[key].get('十神', ''))
+                for key in tables.HIDDEN_STEM_KEYS if hidden.get(key)]
+
+    def to_dict(self):
+        return self.data
+
+
+class Chart:
+    """
+    紧凑排盘
+
+    属性:
+        gender (int): 0-女，1-男
+        solar (tuple): 阳历 (年, 月, 日, 时, 分, 秒)
+        lunar (str | None): 农历文本（原生排盘没有）
+        pillars (tuple): 年月日时柱的六十甲子编码
+        dayun_start (tuple | None): 起运日期 (年, 月, 日)
+        dayun_age (int): 起运年龄
+        dayun_count (int): 大运步数
+        shensha (tuple | None): 年月日时柱的神煞编码（tables.SHENSHA_NAMES 下标）
+        relations (dict | None): 刑冲合会（原样保存）
+        extra (dict | None): 与本地规则不一致的原始字段
+    """
+
+    __slots__ = ('gender', 'solar', 'lunar', 'pillars', 'dayun_start', 'dayun_age', 'dayun_count',
+                 'shensha', 'relations', 'extra', '_wuxing', '_dayun', '_current')
+
+    def __init__(self, gender, solar, pillars, lunar=None, dayun_start=None, dayun_age=0, dayun_count=0,
+                 shensha=None, relations=None, extra=None):
+        self.gender = gender
+        self.solar = solar
+        self.lunar = lunar
+        self.pillars = pillars
+        self.dayun_start = dayun_start
+        self.dayun_age = dayun_age
+        self.dayun_count = dayun_count
+        self.shensha = shensha
+        self.relations = relations
+        self.extra = extra
+        self._wuxing = None
+        self._dayun = None
+        self._current = None
+
+    # ---------- 解析 / 还原 ----------
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        解析 getBaziDetail / bazi_detail 的结果
+
+        异常:
+            ValueError: 缺少必需字段或格式无法识别
+        """
+        try:
+            missing = [key for key in FIELDS if key not in OPTIONAL_FIELDS and key not in data]
+            if missing:
+                raise ValueError(f"排盘结果缺少字段: {missing}")
+            gender = {'男': 1, '女': 0}[data['性别']]
+            solar = tuple(int(x) for x in re.findall(r'\d+', data['阳历']))
+            if len(solar) != 6:
+                raise ValueError(f"无法识别的阳历: {data['阳历']!r}")
+            pillars = tuple(ganzhi_code(name) for name in data['八字'].split())
+            if len(pillars) != 4:
+                raise ValueError(f"无法识别的八字: {data['八字']!r}")
+
+            dayun_start, dayun_age, dayun_count = None, 0, 0
+            dayun = data.get('大运')
+            if dayun:
+                dayun_start = tuple(int(x) for x in str(dayun.get('起运日期', '')).split('-') if x.isdigit())
+                dayun_age = dayun.get('起运年龄', 0)
+                if len(dayun_start) != 3 or not isinstance(dayun_age, int):
+                    dayun_start = None  # 无法识别的起运日期 / 年龄：整个大运放入 extra
+                dayun_count = len(dayun.get('大运') or [])
+
+            shensha = None
+            if data.get('神煞') is not None:
+                ids = tables.SHENSHA_IDS
+                shensha = tuple(tuple(ids.get(name, -1) for name in data['神煞'].get(pillar) or ())
+                                for pillar in PILLAR_NAMES)
+                if any(-1 in codes for codes in shensha):
+                    shensha = None  # 有未收录的神煞名：整个字段放入 extra
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"无法解析排盘结果: {e!r}") from e
+
+        chart = cls(gender, solar, pillars, lunar=data.get('农历'), dayun_start=dayun_start or None,
+                    dayun_age=dayun_age, dayun_count=dayun_count, shensha=shensha,
+                    relations=data.get('刑冲合会'))
+        # 逐字段核对，推不出原值的字段原样保存
+        derived = chart._derived()
+        extra = {key: value for key, value in data.items() if derived.get(key, _MISSING) != value}
+        chart.extra = extra or None
+        return chart
+
+    def _derived(self):
+        """由紧凑字段推出的完整 dict（不含 extra）"""
+        year, month, day, hour, minute, second = self.solar
+        day_gan = self.pillars[2] % 10
+        result = {
+            '性别': '男' if self.gender == 1 else '女',
+            '阳历': f"{year}年{month}月{day}日 {hour:02d}:{minute:02d}:{second:02d}",
+        }
+        if self.lunar is not None:
+            result['农历'] = self.lunar
+        result['八字'] = ' '.join(tables.ganzhi_name(code) for code in self.pillars)
+        result['生肖'] = tables.ZODIAC[self.pillars[0] % 12]
+        result['日主'] = tables.GAN[day_gan]
+        for i, name in enumerate(PILLAR_NAMES):
+            result[name] = _pillar_info(self.pillars[i], day_gan, i == 2)
+        codes = dict(zip(('year', 'month', 'day', 'hour'), self.pillars))
+        result['胎元'] = tai_yuan(codes['month'])
+        result['胎息'] = tai_xi(codes['day'])
+        result['命宫'] = ming_gong(codes)
+        result['身宫'] = shen_gong(codes)
+        if self.shensha is not None:
+            result['神煞'] = {name: [tables.SHENSHA_NAMES[i] for i in ids]
+                            for name, ids in zip(PILLAR_NAMES, self.shensha)}
+        if self.dayun_start is not None:
+            result['大运'] = {
+                '起运日期': '-'.join(str(x) for x in self.dayun_start),
+                '起运年龄': self.dayun_age,
+                '大运': dayun_items(self.pillars[1], day_gan, self.forward, self.dayun_start[0],
+                                   self.dayun_age, self.dayun_count),
+            }
+        if self.relations is not None:
+            result['刑冲合会'] = self.relations
+        return result
+
+    def to_dict(self):
+        """还原为 getBaziDetail 结构的 dict（与解析前的 dict 相等，键顺序同 getBaziDetail）"""
+        result = self._derived()
+        if not self.extra:
+            return result
+        result.update(self.extra)
+        order = {key: i for i, key in enumerate(FIELDS)}
+        return {key: result[key] for key in sorted(result, key=lambda k: order.get(k, len(FIELDS)))}
+
+    def _field(self, key, default):
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    # ---------- 基本信息 ----------
+
+    @property
+    def gender_name(self):
+        return self._field('性别', '男' if self.gender == 1 else '女')
+
+    @property
+    def solar_text(self):
+        year, month, day, hour, minute, second = self.solar
+        return self._field('阳历', f"{year}年{month}月{day}日 {hour:02d}:{minute:02d}:{second:02d}")
+
+    @property
+    def lunar_text(self):
+        return self._field('农历', self.lunar or '')
+
+    @property
+    def bazi(self):
+        return self._field('八字', ' '.join(tables.ganzhi_name(code) for code in self.pillars))
+
+    @property
+    def zodiac(self):
+        return self._field('生肖', tables.ZODIAC[self.pillars[0] % 12])
+
+    @property
+    def day_master(self):
+        """日干编码"""
+        return self.pillars[2] % 10
+
+    @property
+    def day_master_name(self):
+        return self._field('日主', tables.GAN[self.day_master])
+
+    @property
+    def forward(self):
+        """大运是否顺排"""
+        return is_forward(self.pillars[0], self.gender)
+
+    def _codes(self):
+        return dict(zip(('year', 'month', 'day', 'hour'), self.pillars))
+
+    @property
+    def ming_gong(self):
+        return self._field('命宫', ming_gong(self._codes()))
+
+    @property
+    def shen_gong(self):
+        return self._field('身宫', shen_gong(self._codes()))
+
+    @property
+    def tai_yuan(self):
+        return self._field('胎元', tai_yuan(self.pillars[1]))
+
+    @property
+    def tai_xi(self):
+        return self._field('胎息', tai_xi(self.pillars[2]))
+
+    # ---------- 四柱 ----------
+
+    def pillar(self, i):
+        """第 i 柱（0 年 1 月 2 日 3 时）的视图"""
+        name = PILLAR_NAMES[i]
+        if self.extra and name in self.extra:
+            return RawPillar(self.extra[name])
+        return Pillar(self.pillars[i], self.day_master, i == 2)
+
+    def wuxing_counts(self):
+        """四柱天干地支的五行计数 {'木': n, '火': n, '土': n, '金': n, '水': n}"""
+        if self._wuxing is None:
+            counts = dict.fromkeys(tables.WUXING, 0)
+            for i in range(4):
+                pillar = self.pillar(i)
+                for element in (pillar.gan_wuxing, pillar.zhi_wuxing):
+                    if element in counts:
+                        counts[element] += 1
+            self._wuxing = tuple(counts.values())
+        return dict(zip(tables.WUXING, self._wuxing))
+
+    # ---------- 刑冲合会 ----------
+
+    def relation_masks(self):
+        """(天干关系位, 地支关系位)，见 bazi_core.relations"""
+        return (stem_mask([code % 10 for code in self.pillars]),
+                branch_mask([code % 12 for code in self.pillars]))
+
+    def relation_map(self):
+        """刑冲合会（getBaziDetail 结构）；排盘中没有时（原生排盘）由 bazi_core.relations 本地计算"""
+        if self.relations is not None:
+            return self.relations
+        return mcp_relations([code % 10 for code in self.pillars], [code % 12 for code in self.pillars])
+
+    # ---------- 神煞 ----------
+
+    @property
+    def has_shensha(self):
+        return bool(self._field('神煞', self.shensha))
+
+    def shensha_names(self, i):
+        """第 i 柱的神煞名称列表"""
+        if self.extra and '神煞' in self.extra:
+            return list((self.extra['神煞'] or {}).get(PILLAR_NAMES[i]) or [])
+        if self.shensha is None:
+            return []
+        return [tables.SHENSHA_NAMES[code] for code in self.shensha[i]]
+
+    def shensha_map(self):
+        """
+        神煞 {'年柱': [...], ...}：排盘中有神煞（MCP 结果）时用它，
+        没有时（原生排盘）由 bazi_core.shensha 本地计算常用神煞（覆盖范围见该模块）
+        """
+        if self.has_shensha:
+            return {name: self.shensha_names(i) for i, name in enumerate(PILLAR_NAMES)}
+        return shensha_map([code % 10 for code in self.pillars], [code % 12 for code in self.pillars])
+
+    # ---------- 大运 ----------
+
+    @property
+    def dayun_start_text(self):
+        """起运日期文本，如 '2001-1-26'"""
+        if self.extra and '大运' in self.extra:
+            return (self.extra['大运'] or {}).get('起运日期', '')
+        return '-'.join(str(x) for x in self.dayun_start) if self.dayun_start else ''
+
+    @property
+    def dayun_start_age(self):
+        if self.extra and '大运' in self.extra:
+            return (self.extra['大运'] or {}).get('起运年龄', '')
+        return self.dayun_age if self.dayun_start else ''
+
+    def dayun(self):
+        """大运列表（DayunStep 元组），首次访问时生成并缓存"""
+        if self._dayun is None:
+            if self.extra and '大运' in self.extra:
+                items = (self.extra['大运'] or {}).get('大运') or []
+            elif self.dayun_start is not None:
+                items = dayun_items(self.pillars[1], self.day_master, self.forward, self.dayun_start[0],
+                                    self.dayun_age, self.dayun_count)
+            else:
+                items = []
+            self._dayun = tuple(DayunStep(*(item.get(key, '') for key in _DAYUN_KEYS)) for item in items)
+        return self._dayun
+
+    def current_dayun(self, year=None):
+        """year（默认今年）所在的大运步，不在任何一步内时返回 None；按年份缓存"""
+        year = year or datetime.now().year
+        if self._current is None or self._current[0] != year:
+            current = next((step for step in self.dayun()
+                            if isinstance(step.start_year, int) and step.start_year <= year <= step.end_year), None)
+            self._current = (year, current)
+        return self._current[1]
+
+
+def as_chart(value):
+    """dict / Chart / None -> Chart / None（dict 解析失败时抛出 ValueError）"""
+    if not value:
+        return None
+    if isinstance(value, Chart):
+        return value
+    return Chart.from_dict(value)
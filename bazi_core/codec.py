@@ -0,0 +1,239 @@
+"""
+排盘的紧凑二进制编码（带版本）- 会话、SQLite 等处缓存排盘时代替 JSON / dict
+
+    data = encode(bazi_result)       # dict 或 Chart -> bytes（典型 40-300 字节）
+    chart = decode(data)             # -> Chart
+    decode(data).to_dict() == bazi_result
+
+布局（v1，整数为小端；varint 为 LEB128）:
+    'BZ' | version u8 | flags u8
+    gender u8 | 阳历 year u16, month, day, hour, minute, second u8 | 四柱 4 × u8（六十甲子编码，藏干 / 十神等由此推出）
+    [flags & DAYUN]     起运 year u16, month u8, day u8 | 起运年龄 u8 | 步数 u8（大运列表由月柱与顺逆推出）
+    [flags & SHENSHA]   每柱: 个数 u8 + 神煞编码 u8 × n（tables.SHENSHA_NAMES 下标）
+    [flags & LUNAR]     农历（值编码）
+    [flags & RELATIONS] 刑冲合会（值编码）
+    [flags & EXTRA]     Chart.extra（值编码）
+
+值编码（刑冲合会等嵌套结构）: 1 字节标记 + 内容；常见的键 / 短词在 STRINGS 表中只占 1 字节，
+由干支五行等常用字组成的短文本（如“卯未半合木”）每字 1 字节
+
+STRINGS、_ALPHABET、tables.SHENSHA_NAMES 只能在末尾追加；改动已有顺序或布局时必须提升 VERSION
+"""
+import struct
+
+from . import tables
+from .chart import Chart
+
+MAGIC = b'BZ'
+VERSION = 1
+
+FLAG_DAYUN = 1
+FLAG_SHENSHA = 2
+FLAG_LUNAR = 4
+FLAG_RELATIONS = 8
+FLAG_EXTRA = 16
+
+_FIXED = struct.Struct('<2sBBBHBBBBB4B')
+_DAYUN = struct.Struct('<HBBBB')
+
+# 值编码的常用字符串（编码 0-127 时只占 1 字节）
+STRINGS = (
+    '年', '月', '日', '时', '天干', '地支', '柱', '知识点', '元素',
+    '合', '冲', '刑', '害', '破', '半合', '三合', '三会', '六合', '暗合', '自刑', '相刑', '三刑',
+    '拱合', '半会', '五合', '争合', '妒合', '克', '绝',
+    '木', '火', '土', '金', '水',
+    '年柱', '月柱', '日柱', '时柱', '主气', '中气', '余气',
+)
+_STRING_IDS = {s: i for i, s in enumerate(STRINGS)}
+# 短文本字母表：每字 1 字节
+_ALPHABET = (tables.GAN + tables.ZHI + tables.WUXING +
+             '合冲刑害破半三会六暗自相局拱化克绝生旺墓方年月日时柱')
+_ALPHABET_IDS = {c: i for i, c in enumerate(_ALPHABET)}
+
+_T_NONE, _T_FALSE, _T_TRUE, _T_INT, _T_FLOAT, _T_STR, _T_WORD, _T_LIST, _T_DICT, _T_SHORT = range(10)
+_T_TABLE = 0x80  # 0x80 | id：STRINGS 中的字符串
+
+
+# ---------- varint / 值编码 ----------
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _put_value(out, value):
+    if value is None:
+        out.append(_T_NONE)
+    elif value is True or value is False:
+        out.append(_T_TRUE if value else _T_FALSE)
+    elif isinstance(value, int):
+        out.append(_T_INT)
+        _put_varint(out, value << 1 if value >= 0 else (~value << 1) | 1)
+    elif isinstance(value, float):
+        out.append(_T_FLOAT)
+        out += struct.pack('<d', value)
+    elif isinstance(value, str):
+        string_id = _STRING_IDS.get(value)
+        if string_id is not None:
+            out.append(_T_TABLE | string_id)
+        elif value and all(c in _ALPHABET_IDS for c in value):
+            out.append(_T_SHORT)
+            _put_varint(out, len(value))
+            out += bytes(_ALPHABET_IDS[c] for c in value)
+        else:
+            raw = value.encode('utf-8')
+            out.append(_T_STR)
+            _put_varint(out, len(raw))
+            out += raw
+    elif isinstance(value, (list, tuple)):
+        out.append(_T_LIST)
+        _put_varint(out, len(value))
+        for item in value:
+            _put_value(out, item)
+    elif isinstance(value, dict):
+        out.append(_T_DICT)
+        _put_varint(out, len(value))
+        for key, item in value.items():
+            _put_value(out, key)
+            _put_value(out, item)
+    else:
+        raise ValueError(f"无法编码的类型: {type(value).__name__}")
+
+
+def _get_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag & _T_TABLE:
+        return STRINGS[tag & 0x7f], pos
+    if tag == _T_NONE:
+        return None, pos
+    if tag in (_T_FALSE, _T_TRUE):
+        return tag == _T_TRUE, pos
+    if tag == _T_INT:
+        raw, pos = _get_varint(data, pos)
+        return (raw >> 1) ^ -(raw & 1), pos
+    if tag == _T_FLOAT:
+        return struct.unpack_from('<d', data, pos)[0], pos + 8
+    if tag in (_T_STR, _T_SHORT):
+        length, pos = _get_varint(data, pos)
+        chunk = data[pos:pos + length]
+        if len(chunk) != length:
+            raise ValueError("数据被截断")
+        text = chunk.decode('utf-8') if tag == _T_STR else ''.join(_ALPHABET[b] for b in chunk)
+        return text, pos + length
+    if tag == _T_LIST:
+        length, pos = _get_varint(data, pos)
+        items = []
+        for _ in range(length):
+            item, pos = _get_value(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == _T_DICT:
+        length, pos = _get_varint(data, pos)
+        result = {}
+        for _ in range(length):
+            key, pos = _get_value(data, pos)
+            result[key], pos = _get_value(data, pos)
+        return result, pos
+    raise ValueError(f"未知的值标记: {tag}")
+
+
+# ---------- 排盘 ----------
+
+def encode(chart):
+    """
+    排盘 -> bytes
+
+    参数:
+        chart (Chart | dict): 紧凑排盘或 getBaziDetail 结构的 dict
+
+    异常:
+        ValueError: dict 无法解析，或字段超出编码范围
+    """
+    if not isinstance(chart, Chart):
+        chart = Chart.from_dict(chart)
+    flags = ((FLAG_DAYUN if chart.dayun_start is not None else 0) |
+             (FLAG_SHENSHA if chart.shensha is not None else 0) |
+             (FLAG_LUNAR if chart.lunar is not None else 0) |
+             (FLAG_RELATIONS if chart.relations is not None else 0) |
+             (FLAG_EXTRA if chart.extra else 0))
+    try:
+        out = bytearray(_FIXED.pack(MAGIC, VERSION, flags, chart.gender, *chart.solar, *chart.pillars))
+        if flags & FLAG_DAYUN:
+            out += _DAYUN.pack(*chart.dayun_start, chart.dayun_age, chart.dayun_count)
+    except struct.error as e:
+        raise ValueError(f"排盘字段超出编码范围: {e}") from e
+    if flags & FLAG_SHENSHA:
+        for ids in chart.shensha:
+            out.append(len(ids))
+            out += bytes(ids)
+    if flags & FLAG_LUNAR:
+        _put_value(out, chart.lunar)
+    if flags & FLAG_RELATIONS:
+        _put_value(out, chart.relations)
+    if flags & FLAG_EXTRA:
+        _put_value(out, chart.extra)
+    return bytes(out)
+
+
+def decode(data):
+    """
+    bytes -> Chart
+
+    异常:
+        ValueError: 不是排盘编码、版本不支持或数据损坏
+    """
+    try:
+        magic, version, flags, gender, *fields = _FIXED.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported chart encoding: {bytes(data[:3])!r}")
+        solar, pillars = tuple(fields[:6]), tuple(fields[6:])
+        pos = _FIXED.size
+
+        dayun_start, dayun_age, dayun_count = None, 0, 0
+        if flags & FLAG_DAYUN:
+            year, month, day, dayun_age, dayun_count = _DAYUN.unpack_from(data, pos)
+            dayun_start = (year, month, day)
+            pos += _DAYUN.size
+        shensha = None
+        if flags & FLAG_SHENSHA:
+            pillars_shensha = []
+            for _ in range(4):
+                count = data[pos]
+                ids = tuple(data[pos + 1:pos + 1 + count])
+                if len(ids) != count or any(i >= len(tables.SHENSHA_NAMES) for i in ids):
+                    raise ValueError("神煞编码损坏")
+                pillars_shensha.append(ids)
+                pos += 1 + count
+            shensha = tuple(pillars_shensha)
+        lunar = relations = extra = None
+        if flags & FLAG_LUNAR:
+            lunar, pos = _get_value(data, pos)
+        if flags & FLAG_RELATIONS:
+            relations, pos = _get_value(data, pos)
+        if flags & FLAG_EXTRA:
+            extra, pos = _get_value(data, pos)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"排盘编码损坏: {e}") from e
+    if pos != len(data) or any(p >= 60 for p in pillars):
+        raise ValueError("排盘编码损坏")
+    return Chart(gender, solar, pillars, lunar=lunar, dayun_start=dayun_start, dayun_age=dayun_age,
+                 dayun_count=dayun_count, shensha=shensha, relations=relations, extra=extra)
+
+
+def decode_dict(data):
+    """bytes -> getBaziDetail 结构的 dict"""
+    return decode(data).to_dict()
@@ -0,0 +1,265 @@
+"""
+合婚配对打分 - 在列式命盘库中为一个命盘找出最合的 k 个人
+
+    store = ChartStore.from_births(timestamps, genders, ids)     # 或 ChartStore.load('charts.npz')
+    me = profile_of(chart)                                       # Chart / 排盘 dict -> Profile
+    store.top_k(me, k=10)                                        # [(id, 分数), ...]，默认只配异性
+    explain(me, store.profile(store.row_of(user_id)))            # 各项得分与依据
+
+每个命盘只保留打分用到的几列（日干、日支、年支、五行计数编码、性别，每个约 14 字节）。
+打分由四项加权求和，每一项都先对“我”算出一行小表，再按库中的列一次取值：
+
+    日主    日干之间的 五合 / 相生 / 比和 / 相克 / 相冲（10 项）
+    日支    夫妻宫地支的 六合 / 半合 / 拱合 / 冲 / 刑 / 害 / 破（relations.BRANCH_PAIR_TABLE，12 项）
+    年支    生肖地支，规则同日支（12 项）
+    五行    两人五行计数相加后比“与自己相同的人”更均衡的程度（9^4 个计数编码）
+
+100 万个命盘的一次查询约 20-30ms（python -m bazi_core.compat 可复测）
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from . import tables
+from .chart import as_chart
+from .relations import BRANCH_KINDS, STEM_KINDS, WUHE, branch_pair_bits, stem_pair_bits
+
+Profile = namedtuple('Profile', 'day_master day_branch year_branch wuxing_key gender')
+
+WEIGHTS = {'day_master': 1.0, 'day_branch': 1.5, 'year_branch': 0.5, 'wuxing': 2.0}
+BRANCH_SCORES = {'六合': 1.0, '半合': 0.7, '拱合': 0.3, '冲': -1.0, '刑': -0.6, '自刑': -0.3, '害': -0.6, '破': -0.3}
+STEM_SCORES = {'合': 1.0, '生': 0.5, '比和': 0.3, '克': -0.3, '冲': -1.0}
+
+_WUXING_BASE = 9          # 每项计数 0-8
+_WUXING_KEYS = _WUXING_BASE ** 4
+_WUXING_TOTAL = 8         # 四柱天干地支共 8 个
+
+
+def wuxing_key(counts):
+    """五行计数（木火土金水，和为 8）-> 编码；水由其余四项推出"""
+    wood, fire, earth, metal = (int(c) for c in counts[:4])
+    return ((wood * _WUXING_BASE + fire) * _WUXING_BASE + earth) * _WUXING_BASE + metal
+
+
+def _wuxing_counts(keys):
+    """编码数组 -> (n, 5) 计数"""
+    keys = np.asarray(keys, dtype=np.int64)
+    digits = [keys // _WUXING_BASE ** p % _WUXING_BASE for p in (3, 2, 1, 0)]
+    return np.stack(digits + [_WUXING_TOTAL - sum(digits)], axis=-1)
+
+
+def stem_relation(a, b):
+    """两个日干的关系：合 / 冲 / 生 / 比和 / 克 / None"""
+    bits = stem_pair_bits(a, b)
+    if bits & 1 << STEM_KINDS.index('合'):
+        return '合'
+    if bits & 1 << STEM_KINDS.index('冲'):
+        return '冲'
+    ea, eb = tables.GAN_WUXING[a], tables.GAN_WUXING[b]
+    if ea == eb:
+        return '比和'
+    if (ea - eb) % 5 in (1, 4):
+        return '生'
+    return '克'
+
+
+def branch_relations(a, b):
+    """两个地支之间的关系名列表"""
+    bits = branch_pair_bits(a, b)
+    return [kind for i, kind in enumerate(BRANCH_KINDS) if bits >> i & 1]
+
+
+DAY_MASTER_TABLE = np.array([[STEM_SCORES[stem_relation(a, b)] for b in range(10)] for a in range(10)],
+                            dtype=np.float32)
+BRANCH_TABLE = np.array([[sum(BRANCH_SCORES[kind] for kind in branch_relations(a, b)) for b in range(12)]
+                         for a in range(12)], dtype=np.float32)
+
+_ALL_WUXING = _wuxing_counts(np.arange(_WUXING_KEYS)).astype(np.float32)
+_WUXING_VALID = (_ALL_WUXING >= 0).all(axis=1)
+
+
+def _imbalance(combined):
+    """两人合计 16 个五行与均匀分布的 L1 距离"""
+    return np.abs(combined - 2 * _WUXING_TOTAL / 5).sum(axis=-1)
+
+
+def wuxing_row(key):
+    """
+    “我”的五行编码 -> 所有编码的互补分（长度 9^4 的 float32）
+
+    分数 = (与相同五行的人合计的失衡度 - 与对方合计的失衡度) / 最大失衡度，范围约 [-1, 1]
+    """
+    mine = _wuxing_counts(key).astype(np.float32)
+    worst = 2 * (2 * _WUXING_TOTAL) * (1 - 1 / 5)
+    row = (_imbalance(2 * mine) - _imbalance(mine + _ALL_WUXING)) / worst
+    return np.where(_WUXING_VALID, row, 0).astype(np.float32)
+
+
+def profile_of(chart):
+    """Chart / 排盘 dict -> Profile"""
+    chart = as_chart(chart)
+    return Profile(chart.day_master, chart.pillars[2] % 12, chart.pillars[0] % 12,
+                   wuxing_key(list(chart.wuxing_counts().values())), chart.gender)
+
+
+class ChartStore:
+    """
+    列式命盘库（只含配对打分需要的列）
+
+    属性:
+        ids (ndarray): (n,) int64，命盘对应的用户 ID
+        gender, day_master, day_branch, year_branch (ndarray): (n,) int8
+        wuxing_key (ndarray): (n,) int16，五行计数编码（见 wuxing_key）
+    """
+
+    COLUMNS = ('ids', 'gender', 'day_master', 'day_branch', 'year_branch', 'wuxing_key')
+
+    def __init__(self, ids, gender, day_master, day_branch, year_branch, wuxing_key):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.gender = np.asarray(gender, dtype=np.int8)
+        self.day_master = np.asarray(day_master, dtype=np.int8)
+        self.day_branch = np.asarray(day_branch, dtype=np.int8)
+        self.year_branch = np.asarray(year_branch, dtype=np.int8)
+        self.wuxing_key = np.asarray(wuxing_key, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_arrays(cls, charts, genders, ids=None):
+        """
+        由 batch.chart_arrays 的结果建库
+
+        参数:
+            charts (dict): chart_arrays 的返回值
+            genders (array-like | int): 与 chart_arrays 相同的性别
+            ids (array-like | None): 用户 ID，默认 0..n-1
+        """
+        n = len(charts['day_master'])
+        wuxing = charts['wuxing'].astype(np.int16)
+        keys = ((wuxing[:, 0] * _WUXING_BASE + wuxing[:, 1]) * _WUXING_BASE + wuxing[:, 2]) * _WUXING_BASE + wuxing[:, 3]
+        return cls(np.arange(n) if ids is None else ids, np.broadcast_to(np.asarray(genders), (n,)),
+                   charts['day_master'], charts['zhi'][:, 2], charts['zhi'][:, 0], keys)
+
+    @classmethod
+    def from_births(cls, timestamps, genders, ids=None, provider_sect=2):
+        """由出生时间建库（批量排盘，不调用 MCP）"""
+        from .batch import chart_arrays
+        return cls.from_arrays(chart_arrays(timestamps, genders, provider_sect), genders, ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[column] for column in cls.COLUMNS))
+
+    def save(self, path):
+        np.savez(path, **{column: getattr(self, column) for column in self.COLUMNS})
+
+    def row_of(self, user_id):
+        """
+        用户 ID -> 行号（profile 的参数）
+
+        异常:
+            KeyError: 库中没有该用户
+        """
+        rows = np.flatnonzero(self.ids == user_id)
+        if not rows.size:
+            raise KeyError(user_id)
+        return int(rows[0])
+
+    def profile(self, i):
+        """第 i 行（不是用户 ID，见 row_of）命盘的 Profile"""
+        return Profile(int(self.day_master[i]), int(self.day_branch[i]), int(self.year_branch[i]),
+                       int(self.wuxing_key[i]), int(self.gender[i]))
+
+    def scores(self, me, weights=None):
+        """“我”与库中每个命盘的配对分，(n,) float32"""
+        weights = {**WEIGHTS, **(weights or {})}
+        score = (DAY_MASTER_TABLE[me.day_master] * weights['day_master'])[self.day_master]
+        score += (BRANCH_TABLE[me.day_branch] * weights['day_branch'])[self.day_branch]
+        score += (BRANCH_TABLE[me.year_branch] * weights['year_branch'])[self.year_branch]
+        score += (wuxing_row(me.wuxing_key) * weights['wuxing'])[self.wuxing_key]
+        return score
+
+    def top_k(self, me, k=10, opposite_gender=True, exclude=None, weights=None):
+        """
+        配对分最高的 k 个命盘
+
+        参数:
+            me (Profile): 见 profile_of / profile
+            opposite_gender (bool): 只在异性中查找
+            exclude (iterable | None): 排除的用户 ID（如本人）
+
+        返回:
+            list: [(用户 ID, 分数), ...]，分数从高到低
+        """
+        score = self.scores(me, weights)
+        if opposite_gender:
+            score[self.gender == me.gender] = -np.inf
+        if exclude is not None:
+            score[np.isin(self.ids, list(exclude))] = -np.inf
+        k = min(k, len(score))
+        if k <= 0:
+            return []
+        top = np.argpartition(score, -k)[-k:]
+        top = top[np.argsort(score[top])[::-1]]
+        return [(int(self.ids[i]), float(score[i])) for i in top if score[i] > -np.inf]
+
+
+def explain(me, other, weights=None):
+    """
+    两个命盘的分项得分与依据
+
+    返回:
+        dict: {'score', 'day_master', 'day_branch', 'year_branch', 'wuxing', 'reasons': [文本, ...]}
+    """
+    weights = {**WEIGHTS, **(weights or {})}
+    parts = {
+        'day_master': float(DAY_MASTER_TABLE[me.day_master, other.day_master]),
+        'day_branch': float(BRANCH_TABLE[me.day_branch, other.day_branch]),
+        'year_branch': float(BRANCH_TABLE[me.year_branch, other.year_branch]),
+        'wuxing': float(wuxing_row(me.wuxing_key)[other.wuxing_key]),
+    }
+    gan_a, gan_b = tables.GAN[me.day_master], tables.GAN[other.day_master]
+    relation = stem_relation(me.day_master, other.day_master)
+    if relation == '合':
+        relation += tables.WUXING[WUHE[tuple(sorted((me.day_master, other.day_master)))]]
+    reasons = [f"日主{gan_a}{gan_b}{relation}"]
+    for label, a, b in (('日支', me.day_branch, other.day_branch), ('年支', me.year_branch, other.year_branch)):
+        kinds = branch_relations(a, b)
+        if kinds:
+            reasons.append(f"{label}{tables.ZHI[a]}{tables.ZHI[b]}{'、'.join(kinds)}")
+    combined = _wuxing_counts(me.wuxing_key) + _wuxing_counts(other.wuxing_key)
+    reasons.append("五行合计 " + ' '.join(f"{name}{int(c)}" for name, c in zip(tables.WUXING, combined)))
+    return {'score': sum(parts[key] * weights[key] for key in parts), **parts, 'reasons': reasons}
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="合婚配对打分基准")
+    parser.add_argument('--charts', type=int, default=1_000_000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    births = rng.integers(np.datetime64('1960-01-01', 's').astype(np.int64),
+                          np.datetime64('2005-12-31', 's').astype(np.int64), args.charts)
+    genders = rng.integers(0, 2, args.charts)
+    start = time.perf_counter()
+    store = ChartStore.from_births(births, genders)
+    print(f"建库 {len(store)} 个命盘: {time.perf_counter() - start:.2f}s，"
+          f"{sum(getattr(store, c).nbytes for c in store.COLUMNS) / 1e6:.1f}MB")
+
+    elapsed = []
+    for i in rng.integers(0, len(store), args.queries):
+        me = store.profile(i)
+        start = time.perf_counter()
+        best = store.top_k(me, args.k, exclude=[int(store.ids[i])])
+        elapsed.append(time.perf_counter() - start)
+    print(f"top-{args.k} 查询: 中位 {np.median(elapsed) * 1000:.1f}ms，最慢 {max(elapsed) * 1000:.1f}ms")
+    best_id, best_score = best[0]
+    print(f"示例: #{int(store.ids[i])} -> #{best_id} ({best_score:.2f})",
+          explain(me, store.profile(store.row_of(best_id)))['reasons'])
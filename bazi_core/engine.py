@@ -0,0 +1,266 @@
+"""
+进程内八字排盘 - 与 bazi-mcp getBaziDetail 相同的结果结构（四柱、五行阴阳、藏干十神、纳音、
+旬空、星运自坐、胎元胎息、命宫身宫、大运），不需要启动 Node 子进程
+
+约定与 bazi-mcp 一致：
+- 年柱以立春、月柱以各“节”的精确时刻为界
+- 早晚子时 provider_sect=1 时 23 点后日柱算次日，=2 时算当天；时柱天干总按次日起
+- 起运按“三天一年”折算到分钟（4320 分钟 = 1 年，360 分钟 = 1 月，12 分钟 = 1 天，1 分钟 = 2 小时）
+- 带时区的时间统一换算为北京时间（UTC+8）后排盘
+
+农历、神煞、刑冲合会不在此计算：刑冲合会与常用神煞由 bazi_core.relations / bazi_core.shensha 本地推出
+（Chart.relation_map / Chart.shensha_map），农历与完整神煞只有 MCP 结果中才有
+"""
+import calendar
+from datetime import date, datetime, timedelta, timezone
+
+from . import tables
+from .pillar_table import get_pillar_table, jie_pillars
+from .solar_terms import get_table
+
+BEIJING = timezone(timedelta(hours=8))
+_EPOCH = datetime(1970, 1, 1)
+# 1949-10-01 为甲子日
+_JIAZI_ORDINAL = date(1949, 10, 1).toordinal()
+PILLAR_NAMES = ('年柱', '月柱', '日柱', '时柱')
+DAYUN_COUNT = 10
+
+
+def parse_solar_datetime(value):
+    """
+    ISO 时间字符串 / datetime -> 北京时间的 naive datetime（无时区的视为北京时间）
+
+    异常:
+        ValueError: 格式无法解析
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif not isinstance(value, datetime):
+        raise ValueError(f"invalid solar datetime: {value!r}")
+    if value.tzinfo is not None:
+        value = value.astimezone(BEIJING).replace(tzinfo=None)
+    return value
+
+
+def local_timestamp(local_dt):
+    """北京时间 -> Unix 时间戳（秒）"""
+    return int((local_dt - _EPOCH).total_seconds()) - 8 * 3600
+
+
+def jie_at(position):
+    """第 position 个“节”的时间戳：优先用 mmap 查找表，不可用时用节气表"""
+    table = get_pillar_table()
+    return table.jie_at(position) if table is not None else get_table().jie[position]
+
+
+def day_index(day):
+    """公历日期的日柱六十甲子编码"""
+    return (day.toordinal() - _JIAZI_ORDINAL) % 60
+
+
+def four_pillars(local_dt, provider_sect=2):
+    """
+    计算四柱
+
+    参数:
+        local_dt (datetime): 北京时间（naive）
+        provider_sect (int): 早晚子时配置，1 或 2
+
+    返回:
+        dict: {'year', 'month', 'day', 'hour'（六十甲子编码）, 'jie'（所在“节”在节气表 jie 列表中的下标）}
+
+    异常:
+        ValueError: 超出节气表范围
+    """
+    pillar_table = get_pillar_table()
+    if pillar_table is not None:
+        pillars = pillar_table.lookup(local_timestamp(local_dt) + 8 * 3600, local_dt.hour, provider_sect)
+        if pillars is not None:
+            return pillars
+
+    table = get_table()
+    jie = table.jie_position(local_timestamp(local_dt))
+    year_index, month_index = jie_pillars(table.start_year, jie)
+
+    today = day_index(local_dt.date())
+    late_zi = local_dt.hour >= 23
+    day = (today + 1) % 60 if late_zi and provider_sect == 1 else today
+    hour_zhi = (local_dt.hour + 1) // 2 % 12
+    hour_day_gan = ((today + 1) % 60 if late_zi else today) % 10
+    hour_index = tables.ganzhi_index((hour_day_gan % 5 * 2 + hour_zhi) % 10, hour_zhi)
+
+    return {'year': year_index, 'month': month_index, 'day': day, 'hour': hour_index, 'jie': jie}
+
+
+def is_forward(year_index, gender):
+    """大运顺排：阳年男、阴年女"""
+    return (year_index % 2 == 0) == (gender == 1)
+
+
+def child_limit(local_dt, gender, pillars):
+    """
+    起运时刻
+
+    返回:
+        (datetime, bool): (起运的北京时间, 是否顺排)
+    """
+    forward = is_forward(pillars['year'], gender)
+    born = local_timestamp(local_dt)
+    jie = jie_at(pillars['jie'] + 1 if forward else pillars['jie'])
+    minutes = abs(jie - born) // 60
+
+    years, minutes = divmod(minutes, 4320)
+    months, minutes = divmod(minutes, 360)
+    days, minutes = divmod(minutes, 12)
+    hours = minutes * 2
+
+    # 先加年月（日不变），溢出的天数逐月进位
+    hour = local_dt.hour + hours
+    day = local_dt.day + days + hour // 24
+    hour %= 24
+    month_serial = (local_dt.year + years) * 12 + local_dt.month - 1 + months
+    year, month = divmod(month_serial, 12)
+    month += 1
+    while day > calendar.monthrange(year, month)[1]:
+        day -= calendar.monthrange(year, month)[1]
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return datetime(year, month, day, hour, local_dt.minute, local_dt.second), forward
+
+
+def _stem_info(gan, day_gan=None):
+    info = {
+        '天干': tables.GAN[gan],
+        '五行': tables.WUXING[tables.GAN_WUXING[gan]],
+        '阴阳': tables.gan_yinyang(gan),
+    }
+    if day_gan is not None:
+        info['十神'] = tables.shishen(day_gan, gan)
+    return info
+
+
+def _pillar_info(index, day_gan, is_day):
+    gan, zhi = tables.ganzhi(index)
+    hidden = {
+        key: {'天干': tables.GAN[stem], '十神': tables.shishen(day_gan, stem)}
+        for key, stem in zip(tables.HIDDEN_STEM_KEYS, tables.HIDDEN_STEMS[zhi])
+    }
+    kong = tables.kongwang(index)
+    return {
+        '天干': _stem_info(gan, None if is_day else day_gan),
+        '地支': {
+            '地支': tables.ZHI[zhi],
+            '五行': tables.WUXING[tables.ZHI_WUXING[zhi]],
+            '阴阳': tables.zhi_yinyang(zhi),
+            '藏干': hidden,
+        },
+        '纳音': tables.nayin(index),
+        '旬': tables.ganzhi_name(tables.xun(index)),
+        '空亡': tables.ZHI[kong[0]] + tables.ZHI[kong[1]],
+        '星运': tables.changsheng(day_gan, zhi),
+        '自坐': tables.changsheng(gan, zhi),
+    }
+
+
+def _palace(year_gan, offset):
+    """命宫 / 身宫：offset 为以寅为 1 的宫位序号"""
+    return tables.GAN[((year_gan + 1) * 2 + offset - 1) % 10] + tables.ZHI[(offset + 1) % 12]
+
+
+def _palace_order(zhi):
+    """地支编码 -> 以寅为 1 的序号（子 11，丑 12）"""
+    order = zhi - 1
+    return order + 12 if order < 1 else order
+
+
+def tai_yuan(month_pillar):
+    """胎元：月干进一、月支进三"""
+    month_gan, month_zhi = tables.ganzhi(month_pillar)
+    return tables.GAN[(month_gan + 1) % 10] + tables.ZHI[(month_zhi + 3) % 12]
+
+
+def tai_xi(day_pillar):
+    """胎息：日干所合之干 + 日支所合之支"""
+    day_gan, day_zhi = tables.ganzhi(day_pillar)
+    return tables.GAN[(day_gan + 5) % 10] + tables.ZHI[(13 - day_zhi) % 12]
+
+
+def ming_gong(pillars):
+    offset = _palace_order(pillars['month'] % 12) + _palace_order(pillars['hour'] % 12)
+    offset = (26 if offset >= 14 else 14) - offset
+    return _palace(pillars['year'] % 10, offset)
+
+
+def shen_gong(pillars):
+    offset = _palace_order(pillars['month'] % 12) + pillars['hour'] % 12 + 1
+    if offset > 12:
+        offset -= 12
+    return _palace(pillars['year'] % 10, offset)
+
+
+def dayun_items(month_index, day_gan, forward, start_year, start_age, count=DAYUN_COUNT):
+    """大运列表（结构同 getBaziDetail 的 '大运'.'大运'）：从月柱起顺 / 逆排，每步十年"""
+    step = 1 if forward else -1
+    items = []
+    for i in range(count):
+        index = (month_index + step * (i + 1)) % 60
+        gan, zhi = tables.ganzhi(index)
+        hidden = tables.HIDDEN_STEMS[zhi]
+        items.append({
+            '干支': tables.ganzhi_name(index),
+            '开始年份': start_year + 10 * i,
+            '结束': start_year + 10 * i + 9,
+            '天干十神': tables.shishen(day_gan, gan),
+            '地支十神': [tables.shishen(day_gan, stem) for stem in hidden],
+            '地支藏干': [tables.GAN[stem] for stem in hidden],
+            '开始年龄': start_age + 10 * i,
+            '结束年龄': start_age + 10 * i + 9,
+        })
+    return items
+
+
+def dayun(local_dt, gender, pillars):
+    """大运（结构同 getBaziDetail 的 '大运' 字段）"""
+    start, forward = child_limit(local_dt, gender, pillars)
+    start_age = start.year - local_dt.year + 1
+    return {
+        '起运日期': f"{start.year}-{start.month}-{start.day}",
+        '起运年龄': start_age,
+        '大运': dayun_items(pillars['month'], pillars['day'] % 10, forward, start.year, start_age),
+    }
+
+
+def bazi_detail(solar_datetime, gender=1, provider_sect=2):
+    """
+    进程内排盘，返回与 call_bazi_mcp 相同结构的 dict（不含 农历 / 神煞 / 刑冲合会）
+
+    参数:
+        solar_datetime (str | datetime): 公历时间，例如 "2000-05-15T12:00:00+08:00"
+        gender (int): 性别，0-女，1-男
+        provider_sect (int): 早晚子时配置，1 或 2
+
+    返回:
+        dict: 八字排盘结果
+
+    异常:
+        ValueError: 时间无法解析或超出节气表范围（1899-2101）
+    """
+    local_dt = parse_solar_datetime(solar_datetime)
+    pillars = four_pillars(local_dt, provider_sect)
+    day_gan = pillars['day'] % 10
+    codes = [pillars['year'], pillars['month'], pillars['day'], pillars['hour']]
+
+    result = {
+        '性别': '男' if gender == 1 else '女',
+        '阳历': f"{local_dt.year}年{local_dt.month}月{local_dt.day}日 {local_dt:%H:%M:%S}",
+        '八字': ' '.join(tables.ganzhi_name(i) for i in codes),
+        '生肖': tables.ZODIAC[pillars['year'] % 12],
+        '日主': tables.GAN[day_gan],
+    }
+    for name, index in zip(PILLAR_NAMES, codes):
+        result[name] = _pillar_info(index, day_gan, name == '日柱')
+    result['胎元'] = tai_yuan(pillars['month'])
+    result['胎息'] = tai_xi(pillars['day'])
+    result['命宫'] = ming_gong(pillars)
+    result['身宫'] = shen_gong(pillars)
+    result['大运'] = dayun(local_dt, gender, pillars)
+    return result
@@ -0,0 +1,314 @@
+"""
+bazi-mcp 常驻客户端 - 每个进程一个 `npx bazi-mcp` 子进程，initialize 握手一次，
+之后在同一 stdio 通道上流水线发送 JSON-RPC 请求（每个请求唯一 id），读线程逐行按 id 分发响应
+
+    client = get_client()
+    chart = client.get_bazi_detail(solar_datetime="1998-07-31T14:10:00+08:00", gender=1)
+    charts = client.call_many([{'solar_datetime': ..., 'gender': 0}, ...])   # 一次提交，并发在途
+"""
+import atexit
+import itertools
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+PROTOCOL_VERSION = '2024-11-05'
+CLIENT_INFO = {'name': 'suishi-bazi', 'version': '1.0'}
+
+
+class MCPError(Exception):
+    """MCP 进程不可用、超时、返回 error 或响应无法解析"""
+
+
+def command_args():
+    """(启动参数, 是否用 shell)；Windows 下 npx 是 .cmd，需要经过 shell"""
+    command = os.getenv('BAZI_MCP_COMMAND', 'npx bazi-mcp').strip('"').strip("'")
+    if os.name == 'nt':
+        return command, True
+    return command.split(), False
+
+
+def bazi_arguments(solar_datetime=None, lunar_datetime=None, gender=1, provider_sect=2):
+    """
+    getBaziDetail 的工具参数
+
+    异常:
+        ValueError: solar_datetime 与 lunar_datetime 都未提供
+    """
+    arguments = {'gender': gender, 'eightCharProviderSect': provider_sect}
+    if solar_datetime:
+        arguments['solarDatetime'] = solar_datetime
+    elif lunar_datetime:
+        arguments['lunarDatetime'] = lunar_datetime
+    else:
+        raise ValueError("必须提供 solar_datetime 或 lunar_datetime 之一")
+    return arguments
+
+
+def parse_tool_result(result):
+    """
+    tools/call 的 result -> 排盘 dict
+
+    MCP 一般返回 {"content": [{"type": "text", "text": "<JSON>"}]}，也兼容直接返回对象 / JSON 字符串
+    """
+    try:
+        if isinstance(result, dict) and 'content' in result:
+            if result.get('isError'):
+                raise MCPError(f"tool error: {result['content']}")
+            text = (result['content'] or [{}])[0].get('text', '')
+            return json.loads(text)
+        return json.loads(result) if isinstance(result, str) else result
+    except (json.JSONDecodeError, AttributeError, IndexError) as e:
+        raise MCPError(f"无法解析 MCP 响应: {e}") from e
+
+
+class MCPClient:
+    """
+    常驻的 MCP stdio 客户端（线程安全）
+
+    进程退出后，在途请求全部以 MCPError 结束，下一次请求时自动重启并重新握手
+
+    参数:
+        timeout (float): 单个请求的默认超时秒数
+        max_in_flight (int): 同时在途的请求上限（超出时 request 等待空位，最长等到该请求的超时）
+    """
+
+    def __init__(self, timeout=15, max_in_flight=64):
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()         # 保护进程启动 / 关闭
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()  # 保护各进程的 process.pending = {id: Future}
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._process = None
+        self.server_info = None
+
+    # ---------- 进程管理 ----------
+
+    @staticmethod
+    def _alive(process):
+        # stdout 读到 EOF 时进程可能尚未被回收（poll() 仍为 None），以读线程的标记为准
+        return process is not None and not process.exited and process.poll() is None
+
+    def _ensure_started(self):
+        process = self._process
+        if self._alive(process):
+            return process
+        with self._lock:
+            if self._alive(self._process):
+                return self._process
+            args, shell = command_args()
+            try:
+                process = subprocess.Popen(
+                    args,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    encoding='utf-8',
+                    errors='ignore',
+                    bufsize=1,
+                    shell=shell,
+                )
+            except OSError as e:
+                raise MCPError(f"无法启动 MCP 进程 {args}: {e}") from e
+            process.pending = {}
+            process.exited = False
+            self._process = process
+            threading.Thread(target=self._read_stdout, args=(process,), daemon=True, name='mcp-stdout').start()
+            threading.Thread(target=self._drain_stderr, args=(process,), daemon=True, name='mcp-stderr').start()
+            try:
+                response = self._submit(process, 'initialize', {
+                    'protocolVersion': PROTOCOL_VERSION,
+                    'capabilities': {},
+                    'clientInfo': CLIENT_INFO,
+                }, self.timeout).result(self.timeout)
+            except Exception as e:
+                # 握手未完成（超时 / 返回 error / 写入失败）的进程不能再被复用
+                self._kill(process)
+                self._process = None
+                if isinstance(e, FutureTimeoutError):
+                    raise MCPError("MCP initialize 超时") from e
+                raise
+            self.server_info = response.get('serverInfo')
+            self._write(process, {'jsonrpc': '2.0', 'method': 'notifications/initialized'})
+            print(f"[MCP] 常驻进程已启动 (pid={process.pid}, server={self.server_info})", flush=True)
+            return process
+
+    def _kill(self, process):
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            process, self._process = self._process, None
+        if self._alive(process):
+            try:
+                process.stdin.close()
+                process.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self._kill(process)
+
+    # ---------- 收发 ----------
+
+    def _read_stdout(self, process):
+        """逐行读取响应，按 id 交给对应的 Future；进程结束时让所有在途请求失败"""
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # npx 的安装提示等非 JSON 输出
+            if not isinstance(message, dict) or message.get('id') is None:
+                continue  # 通知
+            with self._pending_lock:
+                future = process.pending.pop(message['id'], None)
+            if future is None:
+                continue
+            self._slots.release()
+            if 'error' in message:
+                future.set_exception(MCPError(f"MCP 返回错误: {message['error']}"))
+            else:
+                future.set_result(message.get('result'))
+
+        with self._pending_lock:
+            process.exited = True
+            pending, process.pending = process.pending, {}
+        try:
+            code = process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            code = None
+        for future in pending.values():
+            self._slots.release()
+            future.set_exception(MCPError(f"MCP 进程已退出 (code={code})"))
+
+    def _drain_stderr(self, process):
+        for line in process.stderr:
+            if line.strip():
+                print(f"[MCP] stderr: {line.rstrip()[:200]}", flush=True)
+
+    def _write(self, process, message):
+        with self._write_lock:
+            try:
+                process.stdin.write(json.dumps(message, ensure_ascii=False) + '\n')
+                process.stdin.flush()
+            except (OSError, ValueError) as e:
+                raise MCPError(f"写入 MCP 进程失败: {e}") from e
+
+    def _submit(self, process, method, params, timeout):
+        """
+        写入一个请求，返回 Future
+
+        异常:
+            MCPError: timeout 秒内没有空出在途名额、进程已退出或写入失败
+        """
+        request_id = next(self._ids)
+        future = Future()
+        future.request_id = request_id
+        future.process = process
+        if not self._slots.acquire(timeout=max(0.0, timeout)):
+            raise MCPError(f"MCP 在途请求已满，{timeout:.1f}s 内未等到空位")
+        with self._pending_lock:
+            if process.exited:
+                self._slots.release()
+                raise MCPError("MCP 进程已退出")
+            process.pending[request_id] = future
+        try:
+            self._write(process, {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+        except MCPError:
+            self._forget(future)
+            raise
+        return future
+
+    def _forget(self, future):
+        """放弃一个在途请求（超时 / 写入失败），之后到达的响应会被忽略"""
+        with self._pending_lock:
+            if future.process.pending.pop(future.request_id, None) is None:
+                return
+        self._slots.release()
+
+    def request(self, method, params=None, timeout=None):
+        """发送请求（不等待），返回 Future；结果为 JSON-RPC result。在途名额最多等 timeout 秒（默认 self.timeout）"""
+        return self._submit(self._ensure_started(), method, params or {},
+                            self.timeout if timeout is None else timeout)
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(max(0.0, timeout))
+        except FutureTimeoutError as e:
+            self._forget(future)
+            raise MCPError(f"MCP 请求 {future.request_id} 超时") from e
+
+    # ---------- 排盘 ----------
+
+    def get_bazi_detail(self, solar_datetime=None, lunar_datetime=None, gender=1, provider_sect=2, timeout=None):
+        """
+        单个排盘
+
+        异常:
+            MCPError: 进程不可用 / 超时 / 返回错误
+            ValueError: 参数不完整
+        """
+        arguments = bazi_arguments(solar_datetime, lunar_datetime, gender, provider_sect)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        future = self.request('tools/call', {'name': 'getBaziDetail', 'arguments': arguments},
+                              deadline - time.monotonic())
+        return parse_tool_result(self._wait(future, deadline - time.monotonic()))
+
+    def call_many(self, charts, timeout=None):
+        """
+        一次提交多个排盘请求（全部写入后统一等待，响应按 id 对应回原顺序）
+
+        超过 max_in_flight 的请求要等前面的响应空出名额才能写入；等名额也计入整批超时，
+        进程卡住时整批最多等 timeout 秒，之后未写入的项直接以 MCPError 结束
+
+        参数:
+            charts (list): [{'solar_datetime': ..., 'gender': ..., 'provider_sect': ...}, ...]
+            timeout (float): 整批的超时秒数
+
+        返回:
+            list: 与 charts 一一对应的排盘 dict；失败的项为 MCPError / ValueError 实例
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        futures = []
+        for chart in charts:
+            try:
+                arguments = bazi_arguments(**chart)
+                futures.append(self.request('tools/call', {'name': 'getBaziDetail', 'arguments': arguments},
+                                            deadline - time.monotonic()))
+            except (MCPError, ValueError) as e:
+                futures.append(e)
+
+        results = []
+        for future in futures:
+            if isinstance(future, Exception):
+                results.append(future)
+                continue
+            try:
+                results.append(parse_tool_result(self._wait(future, deadline - time.monotonic())))
+            except MCPError as e:
+                results.append(e)
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """进程内共享的常驻客户端"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                timeout = float(os.getenv('BAZI_MCP_TIMEOUT', '15').strip('"').strip("'"))
+                _client = MCPClient(timeout=timeout)
+                atexit.register(_client.close)
+    return _client
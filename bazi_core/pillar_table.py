@@ -0,0 +1,238 @@
+"""
+预计算四柱查找表 - 1900-2100 年逐日的日柱与节气边界写成紧凑二进制文件，运行时 mmap 只读映射
+
+同一台机器上所有 advisor / analyzer 工作进程映射同一个文件，共享操作系统页缓存（零拷贝、无解析）。
+查找只是下标计算：
+
+    日序 d = 当地日 - 首日
+    节下标 = day_jie[d] + (当日秒数 >= day_cut[d])      # 当天若交节，day_cut 为交节时刻的当日秒数
+    年柱 / 月柱 = jie_year / jie_month[节下标]，日柱 = day_ganzhi[d]，时柱 = hour_ganzhi[日干][时支]
+
+生成（首次使用时若文件不存在也会自动生成）:
+
+    python -m bazi_core.pillar_table
+
+文件布局（小端）: 64 字节头 + 各段（偏移见头部）
+    jie_time     int64  [n_jie]      “节”的 Unix 时间戳（与 SolarTermTable.jie 下标一致）
+    day_cut      int32  [n_days]     当日交节的当日秒数，不交节为 86400
+    day_jie      uint16 [n_days]     当日 00:00 所在的节下标
+    day_ganzhi   uint8  [n_days]     日柱六十甲子编码
+    jie_year     uint8  [n_jie]      该节所属年的年柱编码
+    jie_month    uint8  [n_jie]      该节开始的月柱编码
+    hour_ganzhi  uint8  [10 * 12]    日干 × 时支 -> 时柱编码
+"""
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+from . import tables
+from .solar_terms import SolarTermTable
+
+MAGIC = b'BZPT'
+VERSION = 1
+START_YEAR = 1900
+END_YEAR = 2100
+TABLE_PATH = os.getenv('BAZI_PILLAR_TABLE') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'pillar_table.bin')
+
+# magic, version, start_year, end_year, start_day（1970-01-01 起的当地日序）, n_days, n_jie, 7 个段偏移
+_HEADER = struct.Struct('<4sHHHxxiII7I')
+_SECTIONS = (
+    ('jie_time', np.int64, 'n_jie'),
+    ('day_cut', np.int32, 'n_days'),
+    ('day_jie', np.uint16, 'n_days'),
+    ('day_ganzhi', np.uint8, 'n_days'),
+    ('jie_year', np.uint8, 'n_jie'),
+    ('jie_month', np.uint8, 'n_jie'),
+    ('hour_ganzhi', np.uint8, 'hours'),
+)
+# 单个查找用 memoryview（下标取值比 NumPy 标量快得多），批量查找用 NumPy 视图；两者都指向同一块映射内存
+_MEMORYVIEW_FORMATS = {np.int64: 'q', np.int32: 'i', np.uint16: 'H', np.uint8: 'B'}
+_HEADER_SIZE = 64
+_BEIJING_OFFSET = 8 * 3600
+_DAY_INDEX_1970 = 17  # 1970-01-01 为辛巳日
+
+
+def jie_pillars(start_year, position):
+    """
+    jie 列表下标 -> (年柱编码, 月柱编码)
+
+    每年 12 个“节”，第 0 个为小寒（丑月，仍属上一年）；其余从立春起依次为寅、卯...月
+    """
+    term_year = start_year + position // 12
+    jie_in_year = position % 12
+    year = term_year - 1 if jie_in_year == 0 else term_year
+    month_offset = (jie_in_year - 1) % 12
+    year_index = (year - 4) % 60
+    month_gan = (year_index % 10 % 5 * 2 + 2 + month_offset) % 10
+    return year_index, tables.ganzhi_index(month_gan, (month_offset + 2) % 12)
+
+
+def build(path=TABLE_PATH, start_year=START_YEAR, end_year=END_YEAR, terms=None):
+    """
+    生成查找表文件（先写临时文件再原子替换，已映射旧文件的进程不受影响）
+
+    返回:
+        str: 文件路径
+    """
+    terms = terms or SolarTermTable()
+    jie = np.asarray(terms.jie, dtype=np.int64)
+    start_day = (np.datetime64(f'{start_year}-01-01') - np.datetime64('1970-01-01')).astype(np.int64)
+    end_day = (np.datetime64(f'{end_year + 1}-01-01') - np.datetime64('1970-01-01')).astype(np.int64)
+    days = np.arange(start_day, end_day, dtype=np.int64)
+
+    day_start = days * 86400 - _BEIJING_OFFSET
+    day_jie = np.searchsorted(jie, day_start, side='right') - 1
+    next_jie = jie[day_jie + 1]
+    day_cut = np.where(next_jie < day_start + 86400, next_jie - day_start, 86400)
+    # 一天之内不会交两个节；交节后的下标 = day_jie + 1
+    assert (jie[np.minimum(day_jie + 2, len(jie) - 1)] >= day_start + 86400).all()
+
+    codes = [jie_pillars(terms.start_year, p) for p in range(len(jie))]
+    sections = {
+        'jie_time': jie,
+        'day_cut': day_cut.astype(np.int32),
+        'day_jie': day_jie.astype(np.uint16),
+        'day_ganzhi': ((_DAY_INDEX_1970 + days) % 60).astype(np.uint8),
+        'jie_year': np.array([c[0] for c in codes], dtype=np.uint8),
+        'jie_month': np.array([c[1] for c in codes], dtype=np.uint8),
+        'hour_ganzhi': np.array([tables.ganzhi_index((gan % 5 * 2 + zhi) % 10, zhi)
+                                 for gan in range(10) for zhi in range(12)], dtype=np.uint8),
+    }
+
+    offsets = []
+    offset = _HEADER_SIZE
+    for name, dtype, _ in _SECTIONS:
+        offset += -offset % np.dtype(dtype).itemsize
+        offsets.append(offset)
+        offset += sections[name].nbytes
+    header = _HEADER.pack(MAGIC, VERSION, start_year, end_year, int(start_day), len(days), len(jie), *offsets)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        for (name, _, _), section_offset in zip(_SECTIONS, offsets):
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(sections[name].tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class PillarTable:
+    """
+    mmap 映射的四柱查找表（各段为指向映射内存的只读 NumPy 视图）
+
+    参数:
+        path (str): pillar_table.bin 路径
+
+    异常:
+        ValueError: 文件格式或版本不符
+    """
+
+    def __init__(self, path=TABLE_PATH):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.start_year, self.end_year, self.start_day, n_days, n_jie, *offsets = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported pillar table {path}: {magic!r} v{version}")
+        counts = {'n_days': n_days, 'n_jie': n_jie, 'hours': 120}
+        buffer = memoryview(self._mmap)
+        self._views = {}
+        for (name, dtype, count), offset in zip(_SECTIONS, offsets):
+            size = counts[count] * np.dtype(dtype).itemsize
+            setattr(self, name, np.frombuffer(self._mmap, dtype=dtype, count=counts[count], offset=offset))
+            self._views[name] = buffer[offset:offset + size].cast(_MEMORYVIEW_FORMATS[dtype])
+        self.n_days = n_days
+
+    def lookup(self, local_seconds, hour, provider_sect=2):
+        """
+        单个生辰的四柱（结构同 engine.four_pillars）
+
+        参数:
+            local_seconds (int): 北京时间 1970-01-01 起的秒数
+            hour (int): 北京时间的小时
+
+        返回:
+            dict 或 None（超出表的范围）
+        """
+        views = self._views
+        day, second = divmod(local_seconds, 86400)
+        day -= self.start_day
+        if not 0 <= day < self.n_days:
+            return None
+        position = views['day_jie'][day] + (second >= views['day_cut'][day])
+        today = views['day_ganzhi'][day]
+        late_zi = hour >= 23
+        zhi = (hour + 1) // 2 % 12
+        hour_day_gan = ((today + 1) % 60 if late_zi else today) % 10
+        return {
+            'year': views['jie_year'][position],
+            'month': views['jie_month'][position],
+            'day': (today + 1) % 60 if late_zi and provider_sect == 1 else today,
+            'hour': views['hour_ganzhi'][hour_day_gan * 12 + zhi],
+            'jie': position,
+        }
+
+    def jie_at(self, position):
+        """第 position 个“节”的 Unix 时间戳"""
+        return self._views['jie_time'][position]
+
+    def lookup_arrays(self, local_seconds, provider_sect=2):
+        """
+        批量四柱（local_seconds 为 int64 数组）
+
+        返回:
+            dict: 'year', 'month', 'day', 'hour', 'jie'（各为数组）
+
+        异常:
+            ValueError: 存在超出表范围的时间
+        """
+        day, second = np.divmod(local_seconds, 86400)
+        day -= self.start_day
+        if day.size and (day.min() < 0 or day.max() >= self.n_days):
+            raise ValueError(f"timestamps outside pillar table ({self.start_year}-{self.end_year})")
+        position = self.day_jie[day].astype(np.int64) + (second >= self.day_cut[day])
+        today = self.day_ganzhi[day].astype(np.int64)
+        hour = second // 3600
+        late_zi = hour >= 23
+        zhi = (hour + 1) // 2 % 12
+        hour_day_gan = (today + late_zi) % 60 % 10
+        return {
+            'year': self.jie_year[position].astype(np.int64),
+            'month': self.jie_month[position].astype(np.int64),
+            'day': (today + (late_zi & (provider_sect == 1))) % 60,
+            'hour': self.hour_ganzhi[hour_day_gan * 12 + zhi].astype(np.int64),
+            'jie': position,
+        }
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_pillar_table():
+    """
+    进程内共享的查找表；文件不存在时先生成，无法生成 / 读取时返回 None（调用方回退到逐个计算）
+    """
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                try:
+                    if not os.path.exists(TABLE_PATH):
+                        build(TABLE_PATH)
+                    _table = PillarTable(TABLE_PATH)
+                except (OSError, ValueError) as e:
+                    print(f"[BAZI] 四柱查找表不可用，改为逐个计算: {e}", flush=True)
+                    _table = False
+    return _table or None
+
+
+if __name__ == '__main__':
+    path = build()
+    table = PillarTable(path)
+    print(f"已写入 {path}：{table.n_days} 天，{len(table.jie_time)} 个节，{os.path.getsize(path)} 字节")
@@ -0,0 +1,265 @@
+"""
+刑冲合会位运算引擎 - 四柱天干 / 地支之间的合、冲、刑、害、破、三合、三会
+
+两两关系预先算成 12×12（地支）/ 10×10（天干）的关系位表；再对全部 12^4 种地支组合、10^4 种天干组合
+把 6 对柱的关系位和三合 / 三会 / 三刑是否齐全压进一个整数。单个命盘只需一次下标计算 + 查表：
+
+    mask = branch_mask(zhis)                        # zhis: 年月日时地支编码
+    has(mask, '冲'), pairs(mask, '半合')             # 位与 / 移位
+    branch_masks(zhi_array)                         # (n, 4) -> (n,) uint64，批量同样一次查表
+
+地支关系位布局（uint64）: 第 p 对柱（PAIRS[p]）占 bit p*8 .. p*8+7，依次为 BRANCH_KINDS；
+bit 48-51 三合（按 SANHE 顺序）、52-55 三会（SANHUI）、56-57 三刑（SANXING）
+天干关系位布局（uint16）: 第 p 对柱占 bit p*2 .. p*2+1，依次为 STEM_KINDS
+
+神煞规则流派差异大，不在此计算
+"""
+import numpy as np
+
+from . import tables
+
+PILLAR_LABELS = ('年', '月', '日', '时')
+PAIRS = ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3))
+
+BRANCH_KINDS = ('六合', '冲', '刑', '自刑', '害', '破', '半合', '拱合')
+STEM_KINDS = ('合', '冲')
+TRIPLE_KINDS = ('三合', '三会', '三刑')
+
+# 地支编码：子 0 丑 1 寅 2 卯 3 辰 4 巳 5 午 6 未 7 申 8 酉 9 戌 10 亥 11
+LIUHE = {(0, 1): 2, (2, 11): 0, (3, 10): 1, (4, 9): 3, (5, 8): 4, (6, 7): 2}   # -> 化出的五行编码
+SANHE = ((8, 0, 4, 4), (11, 3, 7, 0), (2, 6, 10, 1), (5, 9, 1, 3))           # (生, 旺, 墓, 五行)
+SANHUI = ((2, 3, 4, 0), (5, 6, 7, 1), (8, 9, 10, 3), (11, 0, 1, 4))
+SANXING = ((2, 5, 8), (1, 10, 7))                                           # 寅巳申、丑戌未
+XING_PAIRS = {(0, 3), (2, 5), (5, 8), (2, 8), (1, 10), (7, 10), (1, 7)}
+ZIXING = (4, 6, 9, 11)                                                      # 辰午酉亥
+HAI_PAIRS = {(0, 7), (1, 6), (2, 5), (3, 4), (8, 11), (9, 10)}
+PO_PAIRS = {(0, 9), (3, 6), (1, 4), (7, 10), (2, 11), (5, 8)}
+WUHE = {(0, 5): 2, (1, 6): 3, (2, 7): 4, (3, 8): 0, (4, 9): 1}             # 天干五合 -> 五行编码
+
+_BRANCH_BITS = {kind: 1 << i for i, kind in enumerate(BRANCH_KINDS)}
+_STEM_BITS = {kind: 1 << i for i, kind in enumerate(STEM_KINDS)}
+_TRIPLE_SHIFT = {'三合': 48, '三会': 52, '三刑': 56}
+_TRIPLE_GROUPS = {'三合': SANHE, '三会': SANHUI, '三刑': SANXING}
+
+
+def _key(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def _banhe(a, b):
+    """半合（含旺支的两支）/ 拱合（生、墓两支），返回 (种类, 五行) 或 None"""
+    for *group, element in SANHE:
+        if a != b and a in group and b in group:
+            return ('半合' if group[1] in (a, b) else '拱合'), element
+    return None
+
+
+def branch_pair_bits(a, b):
+    """两个地支之间的关系位（BRANCH_KINDS）"""
+    bits = 0
+    key = _key(a, b)
+    if key in LIUHE:
+        bits |= _BRANCH_BITS['六合']
+    if (a - b) % 12 == 6:
+        bits |= _BRANCH_BITS['冲']
+    if key in XING_PAIRS:
+        bits |= _BRANCH_BITS['刑']
+    if a == b and a in ZIXING:
+        bits |= _BRANCH_BITS['自刑']
+    if key in HAI_PAIRS:
+        bits |= _BRANCH_BITS['害']
+    if key in PO_PAIRS:
+        bits |= _BRANCH_BITS['破']
+    banhe = _banhe(a, b)
+    if banhe:
+        bits |= _BRANCH_BITS[banhe[0]]
+    return bits
+
+
+def stem_pair_bits(a, b):
+    """两个天干之间的关系位（STEM_KINDS）"""
+    bits = 0
+    if _key(a, b) in WUHE:
+        bits |= _STEM_BITS['合']
+    if abs(a - b) == 6:
+        bits |= _STEM_BITS['冲']
+    return bits
+
+
+BRANCH_PAIR_TABLE = np.array([[branch_pair_bits(a, b) for b in range(12)] for a in range(12)], dtype=np.uint64)
+STEM_PAIR_TABLE = np.array([[stem_pair_bits(a, b) for b in range(10)] for a in range(10)], dtype=np.uint16)
+
+
+def _build_branch_table():
+    """12^4 种地支组合 -> 关系位"""
+    codes = np.indices((12,) * 4).reshape(4, -1).astype(np.int64)
+    table = np.zeros(codes.shape[1], dtype=np.uint64)
+    for p, (i, j) in enumerate(PAIRS):
+        table |= BRANCH_PAIR_TABLE[codes[i], codes[j]] << np.uint64(p * 8)
+    present = np.zeros(codes.shape[1], dtype=np.int64)
+    for i in range(4):
+        present |= 1 << codes[i]
+    for kind, groups in _TRIPLE_GROUPS.items():
+        for g, group in enumerate(groups):
+            group_mask = sum(1 << z for z in group[:3])
+            table |= ((present & group_mask) == group_mask).astype(np.uint64) << np.uint64(_TRIPLE_SHIFT[kind] + g)
+    return table
+
+
+def _build_stem_table():
+    """10^4 种天干组合 -> 关系位"""
+    codes = np.indices((10,) * 4).reshape(4, -1).astype(np.int64)
+    table = np.zeros(codes.shape[1], dtype=np.uint16)
+    for p, (i, j) in enumerate(PAIRS):
+        table |= STEM_PAIR_TABLE[codes[i], codes[j]] << np.uint16(p * 2)
+    return table
+
+
+BRANCH_TABLE = _build_branch_table()
+STEM_TABLE = _build_stem_table()
+# 单个查找用 list（下标取值比 NumPy 标量快）
+_BRANCH_LIST = BRANCH_TABLE.tolist()
+_STEM_LIST = STEM_TABLE.tolist()
+
+
+# ---------- 单个命盘 ----------
+
+def branch_mask(zhis):
+    """年月日时地支编码 -> 地支关系位"""
+    z0, z1, z2, z3 = zhis
+    return _BRANCH_LIST[((z0 * 12 + z1) * 12 + z2) * 12 + z3]
+
+
+def stem_mask(gans):
+    """年月日时天干编码 -> 天干关系位"""
+    g0, g1, g2, g3 = gans
+    return _STEM_LIST[((g0 * 10 + g1) * 10 + g2) * 10 + g3]
+
+
+def _kind_mask(kind, part):
+    """某种两两关系在 6 对柱上的全部位"""
+    if part == '地支':
+        bit, width = _BRANCH_BITS[kind], 8
+    else:
+        bit, width = _STEM_BITS[kind], 2
+    return sum(bit << (p * width) for p in range(len(PAIRS)))
+
+
+_KIND_MASKS = {('地支', kind): _kind_mask(kind, '地支') for kind in BRANCH_KINDS}
+_KIND_MASKS.update({('天干', kind): _kind_mask(kind, '天干') for kind in STEM_KINDS})
+
+
+def has(mask, kind, part='地支'):
+    """命盘中是否存在某种关系（三合 / 三会 / 三刑 只看地支）"""
+    if kind in _TRIPLE_SHIFT:
+        return bool(mask >> _TRIPLE_SHIFT[kind] & 0xf)
+    return bool(mask & _KIND_MASKS[(part, kind)])
+
+
+def pairs(mask, kind, part='地支'):
+    """存在某种两两关系的柱对 [(i, j), ...]"""
+    width = 8 if part == '地支' else 2
+    bit = (_BRANCH_BITS if part == '地支' else _STEM_BITS)[kind]
+    return [pair for p, pair in enumerate(PAIRS) if mask >> (p * width) & bit]
+
+
+def triples(mask, kind):
+    """齐全的三合 / 三会 / 三刑 组（SANHE / SANHUI / SANXING 中的项）"""
+    bits = mask >> _TRIPLE_SHIFT[kind] & 0xf
+    return [group for g, group in enumerate(_TRIPLE_GROUPS[kind]) if bits >> g & 1]
+
+
+# ---------- 批量 ----------
+
+def branch_masks(zhis):
+    """(n, 4) 地支编码数组 -> (n,) uint64 关系位"""
+    zhis = np.asarray(zhis, dtype=np.int64)
+    return BRANCH_TABLE[((zhis[:, 0] * 12 + zhis[:, 1]) * 12 + zhis[:, 2]) * 12 + zhis[:, 3]]
+
+
+def stem_masks(gans):
+    """(n, 4) 天干编码数组 -> (n,) uint16 关系位"""
+    gans = np.asarray(gans, dtype=np.int64)
+    return STEM_TABLE[((gans[:, 0] * 10 + gans[:, 1]) * 10 + gans[:, 2]) * 10 + gans[:, 3]]
+
+
+def has_array(masks, kind, part='地支'):
+    """批量版 has：(n,) bool"""
+    masks = np.asarray(masks)
+    if kind in _TRIPLE_SHIFT:
+        return (masks >> masks.dtype.type(_TRIPLE_SHIFT[kind])) & masks.dtype.type(0xf) != 0
+    return masks & masks.dtype.type(_KIND_MASKS[(part, kind)]) != 0
+
+
+# ---------- 展开为文本 ----------
+
+def _element(part, kind, a, b):
+    if part == '天干':
+        return tables.WUXING[WUHE[_key(a, b)]] if kind == '合' else None
+    if kind == '六合':
+        return tables.WUXING[LIUHE[_key(a, b)]]
+    if kind in ('半合', '拱合'):
+        return tables.WUXING[_banhe(a, b)[1]]
+    return None
+
+
+def describe(gans, zhis):
+    """
+    展开一个命盘的全部关系
+
+    返回:
+        list: [{'part': '天干' / '地支', 'kind', 'pillars': (柱下标, ...), 'element': 五行或 None, 'text'}, ...]
+    """
+    result = []
+    for part, codes, names, mask, kinds in (
+        ('天干', gans, tables.GAN, stem_mask(gans), STEM_KINDS),
+        ('地支', zhis, tables.ZHI, branch_mask(zhis), BRANCH_KINDS),
+    ):
+        for kind in kinds:
+            for i, j in pairs(mask, kind, part):
+                element = _element(part, kind, codes[i], codes[j])
+                result.append({
+                    'part': part,
+                    'kind': kind,
+                    'pillars': (i, j),
+                    'element': element,
+                    'text': f"{names[codes[i]]}{names[codes[j]]}{kind}{element or ''}",
+                })
+        if part != '地支':
+            continue
+        for kind in TRIPLE_KINDS:
+            for group in triples(mask, kind):
+                members = tuple(i for i in range(4) if codes[i] in group[:3])
+                element = tables.WUXING[group[3]] if kind != '三刑' else None
+                result.append({
+                    'part': part,
+                    'kind': kind,
+                    'pillars': members,
+                    'element': element,
+                    'text': ''.join(tables.ZHI[z] for z in group[:3]) + kind + (element or ''),
+                })
+    return result
+
+
+def mcp_relations(gans, zhis):
+    """
+    与 getBaziDetail '刑冲合会' 相同结构的 dict：{柱: {'天干': {种类: [...]}, '地支': {...}}}
+
+    两两关系在双方柱下各列一条 {'柱': 对方, '知识点': 本柱在前的文本, '元素': 五行（有化出五行时）}；
+    三合 / 三会 / 三刑 在每个参与的柱下列一条，'柱' 为其余参与柱
+    """
+    result = {label: {'天干': {}, '地支': {}} for label in PILLAR_LABELS}
+    for item in describe(gans, zhis):
+        names = tables.GAN if item['part'] == '天干' else tables.ZHI
+        codes = gans if item['part'] == '天干' else zhis
+        for i in item['pillars']:
+            others = [j for j in item['pillars'] if j != i]
+            if len(item['pillars']) == 2:
+                text = f"{names[codes[i]]}{names[codes[others[0]]]}{item['kind']}{item['element'] or ''}"
+            else:
+                text = item['text']
+            entry = {'柱': ''.join(PILLAR_LABELS[j] for j in others), '知识点': text}
+            if item['element']:
+                entry['元素'] = item['element']
+            result[PILLAR_LABELS[i]][item['part']].setdefault(item['kind'], []).append(entry)
+    return result
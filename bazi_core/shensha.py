@@ -0,0 +1,169 @@
+"""
+神煞位运算引擎 - 由日干 / 年干、年支 / 日支查表得出常用神煞
+
+每种神煞对应 uint32 中的一位（顺序同 KINDS）。按“起点”预先算好 (10, 12) / (12, 12) 的位表，
+第 i 柱的神煞 = 年干表[年干, 该柱地支] | 日干表[日干, 该柱地支] | 年支表[年支, 该柱地支] | 日支表[日支, 该柱地支]：
+
+    masks = pillar_masks(gans, zhis)                 # 年月日时四柱各一个 uint32
+    names(masks[2]), shensha_map(gans, zhis)         # -> ['天官贵人', '桃花']、getBaziDetail 的“神煞”结构
+    pillar_mask_array(gan_array, zhi_array)          # (n, 4) -> (n, 4) uint32，批量同样只是查表
+
+覆盖范围（口诀取《三命通会》常见说法）：
+    以日干、年干起: 天乙贵人、太极贵人、文昌贵人、国印、金舆、福星贵人、天官贵人（四柱地支，含本柱）
+    以日干起:       禄神、羊刃（只取阳干：甲卯 丙午 戊午 庚酉 壬子）、红艳煞
+    以年支、日支起: 桃花、驿马、华盖、将星、亡神、劫煞、灾煞（其余三柱地支，不含起点本柱）
+    以年支起:       孤辰、寡宿、红鸾、天喜（其余三柱）
+    日柱:           魁罡（庚辰 庚戌 壬辰 戊戌）
+
+以月令起的天德 / 月德及其合、童子煞、九丑、进神、空亡等其余神煞流派差异大或依赖节令细节，不在此计算；
+需要完整神煞时仍以 bazi-mcp 的结果为准（Chart.shensha_map 有 MCP 结果时直接用它）
+"""
+import numpy as np
+
+from . import tables
+from .relations import SANHE
+
+PILLAR_NAMES = ('年柱', '月柱', '日柱', '时柱')
+
+# 以天干起：天干编码 0-9 -> 所在地支
+STEM_RULES = {
+    '天乙贵人': ((1, 7), (0, 8), (11, 9), (11, 9), (1, 7), (0, 8), (1, 7), (2, 6), (3, 5), (3, 5)),
+    '太极贵人': ((0, 6), (0, 6), (3, 9), (3, 9), (4, 10, 1, 7), (4, 10, 1, 7), (2, 11), (2, 11),
+                 (5, 8), (5, 8)),
+    '文昌贵人': ((5,), (6,), (8,), (9,), (8,), (9,), (11,), (0,), (2,), (3,)),
+    '国印': ((10,), (11,), (1,), (2,), (1,), (2,), (4,), (5,), (7,), (8,)),
+    '金舆': ((4,), (5,), (7,), (8,), (7,), (8,), (10,), (11,), (1,), (2,)),
+    '福星贵人': ((2, 0), (3, 1), (2, 0), (11,), (8,), (7,), (6,), (5,), (4,), (3, 1)),
+    '天官贵人': ((7,), (4,), (5,), (9,), (10,), (3,), (11,), (8,), (2,), (6,)),
+    '禄神': ((2,), (3,), (5,), (6,), (5,), (6,), (8,), (9,), (11,), (0,)),
+    '羊刃': ((3,), (), (6,), (), (6,), (), (9,), (), (0,), ()),
+    '红艳煞': ((6,), (6,), (2,), (7,), (4,), (4,), (10,), (9,), (0,), (8,)),
+}
+# 以地支三合局起：局序同 relations.SANHE（申子辰、亥卯未、寅午戌、巳酉丑）-> 所在地支
+BRANCH_RULES = {
+    '桃花': (9, 0, 3, 6),
+    '驿马': (2, 5, 8, 11),
+    '华盖': (4, 7, 10, 1),
+    '将星': (0, 3, 6, 9),
+    '亡神': (11, 2, 5, 8),
+    '劫煞': (5, 8, 11, 2),
+    '灾煞': (6, 9, 0, 3),
+}
+# 以年支起：地支编码 0-11 -> 所在地支
+YEAR_BRANCH_RULES = {
+    '孤辰': tuple((2, 5, 8, 11)[(zhi + 1) % 12 // 3] for zhi in range(12)),   # 亥子丑寅、寅卯辰巳 ...
+    '寡宿': tuple((10, 1, 4, 7)[(zhi + 1) % 12 // 3] for zhi in range(12)),   # 亥子丑戌、寅卯辰丑 ...
+    '红鸾': tuple((3 - zhi) % 12 for zhi in range(12)),
+    '天喜': tuple((9 - zhi) % 12 for zhi in range(12)),
+}
+KUIGANG = ('庚辰', '庚戌', '壬辰', '戊戌')
+
+YEAR_STEM_KINDS = ('天乙贵人', '太极贵人', '文昌贵人', '国印', '金舆', '福星贵人', '天官贵人')
+DAY_STEM_KINDS = YEAR_STEM_KINDS + ('禄神', '羊刃', '红艳煞')
+
+# 位序按 tables.SHENSHA_NAMES 的顺序
+KINDS = tuple(sorted([*STEM_RULES, *BRANCH_RULES, *YEAR_BRANCH_RULES, '魁罡'], key=tables.SHENSHA_IDS.__getitem__))
+_BITS = {kind: 1 << i for i, kind in enumerate(KINDS)}
+
+
+def _stem_table(kinds):
+    table = np.zeros((10, 12), dtype=np.uint32)
+    for kind in kinds:
+        for gan, zhis in enumerate(STEM_RULES[kind]):
+            table[gan, list(zhis)] |= _BITS[kind]
+    return table
+
+
+def _branch_table(year):
+    table = np.zeros((12, 12), dtype=np.uint32)
+    for zhi in range(12):
+        group = next(i for i, (*members, _) in enumerate(SANHE) if zhi in members)
+        for kind, targets in BRANCH_RULES.items():
+            table[zhi, targets[group]] |= _BITS[kind]
+        if year:
+            for kind, targets in YEAR_BRANCH_RULES.items():
+                table[zhi, targets[zhi]] |= _BITS[kind]
+    return table
+
+
+YEAR_STEM_TABLE = _stem_table(YEAR_STEM_KINDS)
+DAY_STEM_TABLE = _stem_table(DAY_STEM_KINDS)
+YEAR_BRANCH_TABLE = _branch_table(year=True)
+DAY_BRANCH_TABLE = _branch_table(year=False)
+# 日柱六十甲子编码 -> 魁罡位
+KUIGANG_TABLE = np.zeros(60, dtype=np.uint32)
+for _name in KUIGANG:
+    KUIGANG_TABLE[tables.ganzhi_index(tables.GAN.index(_name[0]), tables.ZHI.index(_name[1]))] = _BITS['魁罡']
+
+_YEAR_STEM_LIST = YEAR_STEM_TABLE.tolist()
+_DAY_STEM_LIST = DAY_STEM_TABLE.tolist()
+_YEAR_BRANCH_LIST = YEAR_BRANCH_TABLE.tolist()
+_DAY_BRANCH_LIST = DAY_BRANCH_TABLE.tolist()
+_KUIGANG_LIST = KUIGANG_TABLE.tolist()
+
+
+# ---------- 单个命盘 ----------
+
+def pillar_masks(gans, zhis):
+    """
+    四柱的神煞位
+
+    参数:
+        gans, zhis: 年月日时的天干 / 地支编码
+
+    返回:
+        tuple: 4 个 int，第 i 位对应 KINDS[i]
+    """
+    year_stem, day_stem = _YEAR_STEM_LIST[gans[0]], _DAY_STEM_LIST[gans[2]]
+    year_branch, day_branch = _YEAR_BRANCH_LIST[zhis[0]], _DAY_BRANCH_LIST[zhis[2]]
+    masks = []
+    for i, zhi in enumerate(zhis):
+        mask = year_stem[zhi] | day_stem[zhi]
+        if i != 0:
+            mask |= year_branch[zhi]
+        if i != 2:
+            mask |= day_branch[zhi]
+        masks.append(mask)
+    masks[2] |= _KUIGANG_LIST[tables.ganzhi_index(gans[2], zhis[2])]
+    return tuple(masks)
+
+
+def has(mask, kind):
+    """mask 中是否有某种神煞"""
+    return bool(mask & _BITS[kind])
+
+
+def names(mask):
+    """神煞位 -> 名称列表（按 KINDS 顺序）"""
+    return [kind for i, kind in enumerate(KINDS) if mask >> i & 1]
+
+
+def shensha_map(gans, zhis):
+    """本地计算的神煞，结构同 getBaziDetail 的“神煞”字段：{'年柱': [...], ...}"""
+    return {name: names(mask) for name, mask in zip(PILLAR_NAMES, pillar_masks(gans, zhis))}
+
+
+# ---------- 批量 ----------
+
+def pillar_mask_array(gans, zhis):
+    """
+    批量神煞位
+
+    参数:
+        gans, zhis: (n, 4) 天干 / 地支编码数组
+
+    返回:
+        ndarray: (n, 4) uint32
+    """
+    gans = np.asarray(gans, dtype=np.intp)
+    zhis = np.asarray(zhis, dtype=np.intp)
+    masks = YEAR_STEM_TABLE[gans[:, :1], zhis] | DAY_STEM_TABLE[gans[:, 2:3], zhis]
+    masks[:, 1:] |= YEAR_BRANCH_TABLE[zhis[:, :1], zhis[:, 1:]]
+    masks[:, [0, 1, 3]] |= DAY_BRANCH_TABLE[zhis[:, 2:3], zhis[:, [0, 1, 3]]]
+    masks[:, 2] |= KUIGANG_TABLE[(6 * gans[:, 2] - 5 * zhis[:, 2]) % 60]   # 同 tables.ganzhi_index
+    return masks
+
+
+def has_array(masks, kind):
+    """批量判断：masks 中每个元素是否有某种神煞，返回同形状的 bool 数组"""
+    return (np.asarray(masks) & np.uint32(_BITS[kind])) != 0
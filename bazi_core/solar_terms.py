@@ -0,0 +1,235 @@
+"""
+二十四节气表 - 预先算好 1899-2101 年的节气时刻，运行时只做二分查找
+
+节气时刻由截断的 VSOP87 地球序列（Meeus《天文算法》第 32 章）+ 章动 + 光行差求太阳视黄经，
+牛顿迭代到整 15°，再用 ΔT 换算成世界时。精度在一分钟以内，结果写入 solar_terms.json：
+
+    python -m bazi_core.solar_terms            # 重新生成 bazi_core/solar_terms.json
+"""
+import bisect
+import json
+import math
+import os
+from datetime import datetime, timezone
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solar_terms.json')
+START_YEAR = 1899
+END_YEAR = 2101
+
+# 每年从小寒开始的 24 个节气；偶数下标为“节”（决定月柱），奇数下标为“中气”
+TERM_NAMES = (
+    '小寒', '大寒', '立春', '雨水', '惊蛰', '春分', '清明', '谷雨',
+    '立夏', '小满', '芒种', '夏至', '小暑', '大暑', '立秋', '处暑',
+    '白露', '秋分', '寒露', '霜降', '立冬', '小雪', '大雪', '冬至',
+)
+
+# ---------- VSOP87 地球日心坐标（Meeus 附录 III 截断项：A, B, C -> A*cos(B + C*τ)）----------
+_L0 = (
+    (175347046, 0, 0), (3341656, 4.6692568, 6283.07585), (34894, 4.6261, 12566.1517),
+    (3497, 2.7441, 5753.3849), (3418, 2.8289, 3.5231), (3136, 3.6277, 77713.7715),
+    (2676, 4.4181, 7860.4194), (2343, 6.1352, 3930.2097), (1324, 0.7425, 11506.7698),
+    (1273, 2.0371, 529.691), (1199, 1.1096, 1577.3435), (990, 5.233, 5884.927),
+    (902, 2.045, 26.298), (857, 3.508, 398.149), (780, 1.179, 5223.694),
+    (753, 2.533, 5507.553), (505, 4.583, 18849.228), (492, 4.205, 775.523),
+    (357, 2.92, 0.067), (317, 5.849, 11790.629), (284, 1.899, 796.298),
+    (271, 0.315, 10977.079), (243, 0.345, 5486.778), (206, 4.806, 2544.314),
+    (205, 1.869, 5573.143), (202, 2.458, 6069.777), (156, 0.833, 213.299),
+    (132, 3.411, 2942.463), (126, 1.083, 20.775), (115, 0.645, 0.98),
+    (103, 0.636, 4694.003), (102, 0.976, 15720.839), (102, 4.267, 7.114),
+    (99, 6.21, 2146.17), (98, 0.68, 155.42), (86, 5.98, 161000.69),
+    (85, 1.3, 6275.96), (85, 3.67, 71430.7), (80, 1.81, 17260.15),
+    (79, 3.04, 12036.46), (75, 1.76, 5088.63), (74, 3.5, 3154.69),
+    (74, 4.68, 801.82), (70, 0.83, 9437.76), (62, 3.98, 8827.39),
+    (61, 1.82, 7084.9), (57, 2.78, 6286.6), (56, 4.39, 14143.5),
+    (56, 3.47, 6279.55), (52, 0.19, 12139.55), (52, 1.33, 1748.02),
+    (51, 0.28, 5856.48), (49, 0.49, 1194.45), (41, 5.37, 8429.24),
+    (41, 2.4, 19651.05), (39, 6.17, 10447.39), (37, 6.04, 10213.29),
+    (37, 2.57, 1059.38), (36, 1.71, 2352.87), (36, 1.78, 6812.77),
+    (33, 0.59, 17789.85), (30, 0.44, 83996.85), (30, 2.74, 1349.87),
+    (25, 3.16, 4690.48),
+)
+_L1 = (
+    (628331966747, 0, 0), (206059, 2.678235, 6283.07585), (4303, 2.6351, 12566.1517),
+    (425, 1.59, 3.523), (119, 5.796, 26.298), (109, 2.966, 1577.344),
+    (93, 2.59, 18849.23), (72, 1.14, 529.69), (68, 1.87, 398.15),
+    (67, 4.41, 5507.55), (59, 2.89, 5223.69), (56, 2.17, 155.42),
+    (45, 0.4, 796.3), (36, 0.47, 775.52), (29, 2.65, 7.11),
+    (21, 5.34, 0.98), (19, 1.85, 5486.78), (19, 4.97, 213.3),
+    (17, 2.99, 6275.96), (16, 0.03, 2544.31), (16, 1.43, 2146.17),
+    (15, 1.21, 10977.08), (12, 2.83, 1748.02), (12, 3.26, 5088.63),
+    (12, 5.27, 1194.45), (12, 2.08, 4694.0), (11, 0.77, 553.57),
+    (10, 1.3, 6286.6), (10, 4.24, 1349.87), (9, 2.7, 242.73),
+    (9, 5.64, 951.72), (8, 5.3, 2352.87), (6, 2.65, 9437.76),
+    (6, 4.67, 4690.48),
+)
+_L2 = (
+    (52919, 0, 0), (8720, 1.0721, 6283.0758), (309, 0.867, 12566.152),
+    (27, 0.05, 3.52), (16, 5.19, 26.3), (16, 3.68, 155.42),
+    (10, 0.76, 18849.23), (9, 2.06, 77713.77), (7, 0.83, 775.52),
+    (5, 4.66, 1577.34), (4, 1.03, 7.11), (4, 3.44, 5573.14),
+    (3, 5.14, 796.3), (3, 6.05, 5507.55), (3, 1.19, 242.73),
+    (3, 6.12, 529.69), (3, 0.31, 398.15), (3, 2.28, 553.57),
+    (2, 4.38, 5223.69), (2, 3.75, 0.98),
+)
+_L3 = (
+    (289, 5.844, 6283.076), (35, 0, 0), (17, 5.49, 12566.15),
+    (3, 5.2, 155.42), (1, 4.72, 3.52), (1, 5.3, 18849.23), (1, 5.97, 242.73),
+)
+_L4 = ((114, 3.142, 0), (8, 4.13, 6283.08), (1, 3.84, 12566.15))
+_L5 = ((1, 3.14, 0),)
+_B0 = (
+    (280, 3.199, 84334.662), (102, 5.422, 5507.553), (80, 3.88, 5223.69),
+    (44, 3.7, 2352.87), (32, 4.0, 1577.34),
+)
+_B1 = ((9, 3.9, 5507.55), (6, 1.73, 5223.69))
+_R0 = (
+    (100013989, 0, 0), (1670700, 3.0984635, 6283.07585), (13956, 3.05525, 12566.1517),
+    (3084, 5.1985, 77713.7715), (1628, 1.1739, 5753.3849), (1576, 2.8469, 7860.4194),
+    (925, 5.453, 11506.77), (542, 4.564, 3930.21), (472, 3.661, 5884.927),
+)
+_R1 = ((103019, 1.10749, 6283.07585), (1721, 1.0644, 12566.1517), (702, 3.142, 0))
+_R2 = ((4359, 5.7846, 6283.0758), (124, 5.579, 12566.152))
+
+
+def _series(terms, tau):
+    return sum(a * math.cos(b + c * tau) for a, b, c in terms)
+
+
+def _poly(series, tau):
+    return sum(_series(terms, tau) * tau ** i for i, terms in enumerate(series)) / 1e8
+
+
+def delta_t(year):
+    """ΔT = TT - UT（秒），Espenak & Meeus 多项式，适用于 1860-2150"""
+    if year < 1900:
+        t = year - 1860
+        return 7.62 + 0.5737 * t - 0.251754 * t ** 2 + 0.01680668 * t ** 3 - 0.0004473624 * t ** 4 + t ** 5 / 233174
+    if year < 1920:
+        t = year - 1900
+        return -2.79 + 1.494119 * t - 0.0598939 * t ** 2 + 0.0061966 * t ** 3 - 0.000197 * t ** 4
+    if year < 1941:
+        t = year - 1920
+        return 21.20 + 0.84493 * t - 0.076100 * t ** 2 + 0.0020936 * t ** 3
+    if year < 1961:
+        t = year - 1950
+        return 29.07 + 0.407 * t - t ** 2 / 233 + t ** 3 / 2547
+    if year < 1986:
+        t = year - 1975
+        return 45.45 + 1.067 * t - t ** 2 / 260 - t ** 3 / 718
+    if year < 2005:
+        t = year - 2000
+        return (63.86 + 0.3345 * t - 0.060374 * t ** 2 + 0.0017275 * t ** 3
+                + 0.000651814 * t ** 4 + 0.00002373599 * t ** 5)
+    if year < 2050:
+        t = year - 2000
+        return 62.92 + 0.32217 * t + 0.005589 * t ** 2
+    return -20 + 32 * ((year - 1820) / 100) ** 2 - 0.5628 * (2150 - year)
+
+
+def apparent_longitude(jde):
+    """太阳视黄经（度），jde 为力学时儒略日"""
+    tau = (jde - 2451545.0) / 365250.0
+    t = tau * 10
+    lon = _poly((_L0, _L1, _L2, _L3, _L4, _L5), tau)
+    lat = _poly((_B0, _B1), tau)
+    radius = _poly((_R0, _R1, _R2), tau)
+
+    # 日心 -> 地心，并转到 FK5
+    theta = math.degrees(lon) + 180.0
+    beta = -math.degrees(lat)
+    lam = theta - 1.397 * t - 0.00031 * t * t
+    theta += (-0.09033 + 0.03916 * (math.cos(math.radians(lam)) + math.sin(math.radians(lam)))
+              * math.tan(math.radians(beta))) / 3600
+
+    # 章动（黄经）与光行差
+    omega = math.radians(125.04452 - 1934.136261 * t)
+    sun = math.radians(280.4665 + 36000.7698 * t)
+    moon = math.radians(218.3165 + 481267.8813 * t)
+    nutation = (-17.20 * math.sin(omega) - 1.32 * math.sin(2 * sun)
+                - 0.23 * math.sin(2 * moon) + 0.21 * math.sin(2 * omega)) / 3600
+    aberration = -20.4898 / 3600 / radius
+    return (theta + nutation + aberration) % 360
+
+
+def term_jde(year, index):
+    """某年第 index 个节气（0=小寒）的力学时儒略日"""
+    target = (285 + 15 * index) % 360
+    # 初值：该年 1 月 6 日前后为小寒，之后每个节气约 15.2 天
+    jde = 2451550.1 + 365.242189 * (year - 2000) + 15.218 * index
+    for _ in range(20):
+        diff = (target - apparent_longitude(jde) + 180) % 360 - 180
+        jde += diff * 365.242189 / 360
+        if abs(diff) < 1e-7:
+            break
+    return jde
+
+
+def term_timestamp(year, index):
+    """节气时刻的 Unix 时间戳（秒，UTC）"""
+    jd_ut = term_jde(year, index) - delta_t(year + (index + 0.5) / 24) / 86400
+    return round((jd_ut - 2440587.5) * 86400)
+
+
+def build_table(start_year=START_YEAR, end_year=END_YEAR):
+    return {
+        'version': 1,
+        'start_year': start_year,
+        'end_year': end_year,
+        'names': list(TERM_NAMES),
+        'terms': [term_timestamp(year, i) for year in range(start_year, end_year + 1) for i in range(24)],
+    }
+
+
+class SolarTermTable:
+    """
+    节气时刻表（terms[(year - start_year) * 24 + i] 为 year 年第 i 个节气的 Unix 时间戳）
+
+    参数:
+        path (str): solar_terms.json 路径
+    """
+
+    def __init__(self, path=TABLE_PATH):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.start_year = data['start_year']
+        self.end_year = data['end_year']
+        self.terms = data['terms']
+        # 只含“节”的时间戳，用于月柱与起运
+        self.jie = self.terms[::2]
+
+    def term_at(self, position):
+        """全表下标 -> (年, 节气下标, 时间戳)"""
+        year, index = divmod(position, 24)
+        return self.start_year + year, index, self.terms[position]
+
+    def jie_position(self, timestamp):
+        """
+        timestamp 所在的“节”在 jie 列表中的下标（该节时刻 <= timestamp < 下一个节）
+
+        异常:
+            ValueError: 超出表的范围
+        """
+        position = bisect.bisect_right(self.jie, timestamp) - 1
+        if position < 0 or position + 1 >= len(self.jie):
+            raise ValueError(f"timestamp {timestamp} outside solar term table "
+                             f"({self.start_year}-{self.end_year})")
+        return position
+
+
+_table = None
+
+
+def get_table():
+    """进程内共享的节气表（首次使用时加载）"""
+    global _table
+    if _table is None:
+        _table = SolarTermTable()
+    return _table
+
+
+if __name__ == '__main__':
+    table = build_table()
+    with open(TABLE_PATH, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, separators=(',', ':'))
+    first = datetime.fromtimestamp(table['terms'][0], timezone.utc)
+    print(f"已写入 {TABLE_PATH}：{len(table['terms'])} 个节气，首个 {TERM_NAMES[0]} {first:%Y-%m-%d %H:%M} UTC")
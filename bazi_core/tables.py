@@ -0,0 +1,128 @@
+"""
+干支基础表 - 天干地支、五行阴阳、藏干、纳音、十神、十二长生
+
+所有表都以整数编码为下标：天干 0-9（甲..癸），地支 0-11（子..亥），六十甲子 0-59（甲子..癸亥）
+"""
+
+GAN = '甲乙丙丁戊己庚辛壬癸'
+ZHI = '子丑寅卯辰巳午未申酉戌亥'
+ZODIAC = '鼠牛虎兔龙蛇马羊猴鸡狗猪'
+
+WUXING = '木火土金水'
+# 天干 / 地支 -> 五行编码
+GAN_WUXING = (0, 0, 1, 1, 2, 2, 3, 3, 4, 4)
+ZHI_WUXING = (4, 2, 0, 0, 2, 1, 1, 2, 3, 3, 2, 4)
+
+
+def gan_yinyang(gan):
+    """天干阴阳：甲丙戊庚壬为阳"""
+    return '阳' if gan % 2 == 0 else '阴'
+
+
+def zhi_yinyang(zhi):
+    """地支阴阳：子寅辰午申戌为阳"""
+    return '阳' if zhi % 2 == 0 else '阴'
+
+
+# 地支藏干（按 主气 / 中气 / 余气 顺序）
+HIDDEN_STEMS = (
+    (9,),          # 子: 癸
+    (5, 9, 7),     # 丑: 己 癸 辛
+    (0, 2, 4),     # 寅: 甲 丙 戊
+    (1,),          # 卯: 乙
+    (4, 1, 9),     # 辰: 戊 乙 癸
+    (2, 6, 4),     # 巳: 丙 庚 戊
+    (3, 5),        # 午: 丁 己
+    (5, 3, 1),     # 未: 己 丁 乙
+    (6, 8, 4),     # 申: 庚 壬 戊
+    (7,),          # 酉: 辛
+    (4, 7, 3),     # 戌: 戊 辛 丁
+    (8, 0),        # 亥: 壬 甲
+)
+HIDDEN_STEM_KEYS = ('主气', '中气', '余气')
+
+# 纳音：六十甲子每两位一个
+NAYIN = (
+    '海中金', '炉中火', '大林木', '路旁土', '剑锋金', '山头火',
+    '涧下水', '城头土', '白蜡金', '杨柳木', '泉中水', '屋上土',
+    '霹雳火', '松柏木', '长流水', '沙中金', '山下火', '平地木',
+    '壁上土', '金箔金', '覆灯火', '天河水', '大驿土', '钗钏金',
+    '桑柘木', '大溪水', '沙中土', '天上火', '石榴木', '大海水',
+)
+
+# 十神：按 (关系, 是否同阴阳) 取名；关系 0 同我 1 我生 2 我克 3 克我 4 生我
+SHISHEN = (
+    ('劫财', '比肩'),
+    ('伤官', '食神'),
+    ('正财', '偏财'),
+    ('正官', '七杀'),
+    ('正印', '偏印'),
+)
+SHISHEN_NAMES = tuple(name for pair in SHISHEN for name in pair)
+
+# 十二长生
+CHANGSHENG = ('长生', '沐浴', '冠带', '临官', '帝旺', '衰', '病', '死', '墓', '绝', '胎', '养')
+# 各天干长生所在地支：阳干顺行，阴干逆行
+CHANGSHENG_START = (11, 6, 2, 9, 2, 9, 5, 0, 8, 3)
+
+
+def ganzhi(index):
+    """六十甲子编码 -> (天干, 地支) 编码"""
+    return index % 10, index % 12
+
+
+def ganzhi_index(gan, zhi):
+    """(天干, 地支) 编码 -> 六十甲子编码（阴阳不配时抛出 ValueError）"""
+    if gan % 2 != zhi % 2:
+        raise ValueError(f"invalid ganzhi: {GAN[gan]}{ZHI[zhi]}")
+    return (6 * gan - 5 * zhi) % 60
+
+
+def ganzhi_name(index):
+    return GAN[index % 10] + ZHI[index % 12]
+
+
+def shishen(day_gan, gan):
+    """以日干为我，求某天干的十神名"""
+    me = GAN_WUXING[day_gan]
+    other = GAN_WUXING[gan]
+    relation = (other - me) % 5
+    # 五行相生顺序 木火土金水：差 1 为我生，差 2 为我克，差 3 为克我，差 4 为生我
+    return SHISHEN[relation][day_gan % 2 == gan % 2]
+
+
+def changsheng(gan, zhi):
+    """天干在地支上的十二长生状态"""
+    start = CHANGSHENG_START[gan]
+    offset = (zhi - start) % 12 if gan % 2 == 0 else (start - zhi) % 12
+    return CHANGSHENG[offset]
+
+
+def nayin(index):
+    return NAYIN[index // 2]
+
+
+def xun(index):
+    """所在旬的旬首（六十甲子编码）"""
+    return index - index % 10
+
+
+def kongwang(index):
+    """旬空的两个地支编码"""
+    first = (xun(index) + 10) % 12
+    return first, (first + 1) % 12
+
+
+# 神煞名称（bazi-mcp 输出中出现的名称）；编码即下标，只能在末尾追加，已有的顺序不能改
+SHENSHA_NAMES = (
+    '天乙贵人', '太极贵人', '天德贵人', '月德贵人', '天德合', '月德合', '德秀贵人', '天官贵人',
+    '福星贵人', '文昌贵人', '国印', '学堂', '词馆', '天厨贵人', '金舆', '禄神',
+    '羊刃', '飞刃', '血刃', '驿马', '桃花', '红鸾', '天喜', '华盖',
+    '将星', '亡神', '劫煞', '灾煞', '孤辰', '寡宿', '天罗', '地网',
+    '童子煞', '九丑', '进神', '退神', '十恶大败', '阴差阳错', '孤鸾煞', '魁罡',
+    '金神', '红艳煞', '天医', '勾绞煞', '元辰', '丧门', '吊客', '披麻',
+    '天赦', '六秀', '八专', '十灵', '天转', '地转', '流霞', '拱禄',
+    '日德', '空亡', '截路空亡', '四废', '三奇贵人', '天上三奇', '地下三奇', '人中三奇',
+    '福德', '月德', '天德', '大耗', '五鬼', '白虎', '天狗', '病符',
+)
+SHENSHA_IDS = {name: i for i, name in enumerate(SHENSHA_NAMES)}
@@ -0,0 +1,14 @@
+import json
+import os
+
+import pytest
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'bazi_analyzer', 'bazi_result_19980731.json')
+
+
+@pytest.fixture(scope='session')
+def sample():
+    """bazi-mcp getBaziDetail 的样例结果（1998-07-31 14:10，男）"""
+    with open(SAMPLE_PATH, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,113 @@
+"""
+合婚打分：top_k 与逐个 explain 的暴力排序一致，已知的合 / 冲关系方向正确
+"""
+import numpy as np
+import pytest
+
+from bazi_core import compat, tables
+from bazi_core.compat import BRANCH_TABLE, DAY_MASTER_TABLE, ChartStore, Profile, explain, profile_of
+
+GAN = tables.GAN.index
+ZHI = tables.ZHI.index
+
+
+@pytest.fixture(scope='module')
+def store():
+    rng = np.random.default_rng(7)
+    n = 400
+    births = rng.integers(np.datetime64('1960-01-01', 's').astype(np.int64),
+                          np.datetime64('2005-12-31', 's').astype(np.int64), n)
+    ids = rng.permutation(n) * 7 + 1000   # 用户 ID 与行号不同
+    return ChartStore.from_births(births, rng.integers(0, 2, n), ids=ids)
+
+
+def brute_force(store, me, k, opposite_gender=True, exclude=(), weights=None):
+    scored = [(int(store.ids[i]), explain(me, store.profile(i), weights)['score']) for i in range(len(store))
+              if not (opposite_gender and store.gender[i] == me.gender) and int(store.ids[i]) not in exclude]
+    return sorted(scored, key=lambda item: -item[1])[:k]
+
+
+@pytest.mark.parametrize('row', [0, 17, 399])
+@pytest.mark.parametrize('opposite_gender', [True, False])
+def test_top_k_matches_brute_force(store, row, opposite_gender):
+    me = store.profile(row)
+    exclude = [int(store.ids[row])]
+    top = store.top_k(me, k=15, opposite_gender=opposite_gender, exclude=exclude)
+    expected = brute_force(store, me, 15, opposite_gender, exclude)
+    assert [score for _, score in top] == pytest.approx([score for _, score in expected], abs=1e-5)
+    # 同分时顺序可以不同，但分数严格高于第 k 名的必须一致
+    cutoff = expected[-1][1] + 1e-5
+    assert {i for i, s in top if s > cutoff} == {i for i, s in expected if s > cutoff}
+    assert exclude[0] not in {i for i, _ in top}
+
+
+def test_top_k_with_weights(store):
+    me = store.profile(3)
+    weights = {'wuxing': 0.0, 'year_branch': 2.0}
+    top = store.top_k(me, k=5, weights=weights)
+    expected = brute_force(store, me, 5, weights=weights)
+    assert [score for _, score in top] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+
+def test_scores_equal_explain(store):
+    me = store.profile(5)
+    scores = store.scores(me)
+    for i in range(0, len(store), 37):
+        assert scores[i] == pytest.approx(explain(me, store.profile(i))['score'], abs=1e-5)
+
+
+def test_top_k_edge_cases(store):
+    me = store.profile(0)
+    assert store.top_k(me, k=0) == []
+    everyone = store.top_k(me, k=len(store) * 2)
+    assert len(everyone) == int((store.gender != me.gender).sum())
+
+
+def test_row_of_maps_user_id(store):
+    for row in (0, 123, 399):
+        assert store.row_of(int(store.ids[row])) == row
+    with pytest.raises(KeyError):
+        store.row_of(-1)
+
+
+def test_save_load_round_trip(store, tmp_path):
+    path = tmp_path / 'charts.npz'
+    store.save(path)
+    loaded = ChartStore.load(path)
+    for column in ChartStore.COLUMNS:
+        np.testing.assert_array_equal(getattr(loaded, column), getattr(store, column))
+
+
+def profile(day_master, day_branch='子', year_branch='子', gender=1):
+    return Profile(GAN(day_master), ZHI(day_branch), ZHI(year_branch), compat.wuxing_key([2, 2, 1, 2, 1]), gender)
+
+
+def test_known_stem_pairs():
+    assert compat.stem_relation(GAN('甲'), GAN('己')) == '合'
+    assert compat.stem_relation(GAN('甲'), GAN('庚')) == '冲'
+    assert DAY_MASTER_TABLE[GAN('甲'), GAN('己')] > DAY_MASTER_TABLE[GAN('甲'), GAN('庚')]
+    me = profile('甲')
+    he, chong = explain(me, profile('己', gender=0)), explain(me, profile('庚', gender=0))
+    assert he['score'] > chong['score']
+    assert he['reasons'][0] == '日主甲己合土'
+    assert chong['day_master'] < 0
+
+
+def test_known_branch_pairs():
+    assert '冲' in compat.branch_relations(ZHI('子'), ZHI('午'))
+    assert BRANCH_TABLE[ZHI('子'), ZHI('午')] < 0
+    assert BRANCH_TABLE[ZHI('子'), ZHI('丑')] > 0    # 子丑六合
+    result = explain(profile('甲', day_branch='子'), profile('甲', day_branch='午', gender=0))
+    assert result['day_branch'] < 0
+    assert '日支子午冲' in result['reasons']
+
+
+def test_tables_are_symmetric():
+    np.testing.assert_array_equal(DAY_MASTER_TABLE, DAY_MASTER_TABLE.T)
+    np.testing.assert_array_equal(BRANCH_TABLE, BRANCH_TABLE.T)
+
+
+def test_profile_of_sample(sample):
+    me = profile_of(sample)
+    store = ChartStore.from_births(np.array(['1998-07-31T14:10'], dtype='datetime64[s]'), 1)
+    assert store.profile(0) == me
@@ -0,0 +1,58 @@
+"""
+原生排盘：与 MCP 样例逐字段一致、四柱查找表与节气表逐个计算一致、Chart / codec 往返无损
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from bazi_core import codec, engine
+from bazi_core.chart import Chart
+from bazi_core.pillar_table import get_pillar_table
+from bazi_core.validate import diff_charts, random_births
+
+
+def test_native_matches_mcp_sample(sample):
+    native = engine.bazi_detail('1998-07-31T14:10:00+08:00', gender=1)
+    assert diff_charts(native, sample) == []
+
+
+def test_pillar_table_matches_solar_terms(monkeypatch):
+    table = get_pillar_table()
+    if table is None:
+        pytest.skip('四柱查找表不可用')
+    moments = [datetime.fromisoformat(text[:19]) for text, _ in random_births(19000, 1900, 2099, seed=43)]
+    # 另取 500 个交节时刻及其前一秒（首尾各留一年，确保在查找表范围内）
+    rng = random.Random(43)
+    for _ in range(500):
+        jie = datetime(1970, 1, 1) + timedelta(seconds=int(table.jie_at(rng.randrange(12, len(table.jie_time) - 12))) + 8 * 3600)
+        moments += [jie - timedelta(seconds=1), jie]
+    assert len(moments) == 20000
+
+    monkeypatch.setattr(engine, 'get_pillar_table', lambda: None)
+    mismatches = []
+    for moment in moments:
+        local_seconds = engine.local_timestamp(moment) + 8 * 3600
+        for provider_sect in (1, 2):
+            looked_up = table.lookup(local_seconds, moment.hour, provider_sect)
+            computed = engine.four_pillars(moment, provider_sect)
+            if {key: int(value) for key, value in looked_up.items()} != computed:
+                mismatches.append((moment, provider_sect))
+    assert mismatches == []
+
+
+def test_chart_codec_round_trip():
+    for solar_datetime, gender in random_births(3000, seed=41):
+        detail = engine.bazi_detail(solar_datetime, gender=gender)
+        chart = Chart.from_dict(detail)
+        assert chart.extra is None
+        assert chart.to_dict() == detail
+        decoded = codec.decode(codec.encode(chart))
+        assert decoded.to_dict() == detail
+        assert codec.encode(decoded) == codec.encode(chart)
+
+
+def test_chart_codec_round_trip_mcp_sample(sample):
+    chart = Chart.from_dict(sample)
+    assert chart.to_dict() == sample
+    assert codec.decode_dict(codec.encode(sample)) == sample
@@ -0,0 +1,104 @@
+"""
+常驻 MCP 客户端：用假的 stdio 服务端模拟卡住、握手失败和正常响应
+"""
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from bazi_core import mcp_client
+from bazi_core.mcp_client import MCPClient, MCPError
+
+# argv[1]: ok（正常排盘）/ stall（握手后不再响应）/ init_error（initialize 返回 error）
+FAKE_SERVER = textwrap.dedent('''
+    import json, sys
+    mode = sys.argv[1]
+    for line in sys.stdin:
+        message = json.loads(line)
+        if 'id' not in message:
+            continue
+        if message['method'] == 'initialize':
+            if mode == 'init_error':
+                reply = {'error': {'code': -32600, 'message': 'bad handshake'}}
+            else:
+                reply = {'result': {'serverInfo': {'name': 'fake'}}}
+        elif mode == 'stall':
+            continue
+        else:
+            chart = {'八字': 'echo', 'gender': message['params']['arguments']['gender']}
+            reply = {'result': {'content': [{'type': 'text', 'text': json.dumps(chart)}]}}
+        print(json.dumps({'jsonrpc': '2.0', 'id': message['id'], **reply}), flush=True)
+''')
+
+
+@pytest.fixture
+def fake_server(tmp_path, monkeypatch):
+    script = tmp_path / 'fake_mcp.py'
+    script.write_text(FAKE_SERVER, encoding='utf-8')
+    clients = []
+
+    def start(mode, **kwargs):
+        monkeypatch.setattr(mcp_client, 'command_args', lambda: ([sys.executable, str(script), mode], False))
+        client = MCPClient(**kwargs)
+        clients.append(client)
+        return client
+
+    yield start
+    for client in clients:
+        client.close()
+
+
+def charts(n):
+    return [{'solar_datetime': '1998-07-31T14:10:00+08:00', 'gender': i % 2} for i in range(n)]
+
+
+def test_call_many_round_trip(fake_server):
+    client = fake_server('ok', timeout=5, max_in_flight=2)
+    results = client.call_many(charts(5))
+    assert [r['gender'] for r in results] == [0, 1, 0, 1, 0]
+
+
+def test_call_many_respects_timeout_when_server_stalls(fake_server):
+    # 批量大于 max_in_flight：等在途名额也必须受整批超时约束，不能永久阻塞
+    client = fake_server('stall', timeout=0.5, max_in_flight=2)
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(client.call_many(charts(6), timeout=0.5)), daemon=True)
+    start = time.monotonic()
+    worker.start()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert time.monotonic() - start < 3
+    assert len(results) == 6 and all(isinstance(r, MCPError) for r in results)
+    # 超时的请求都已放弃，名额全部归还
+    assert client._slots.acquire(timeout=0) and client._slots.acquire(timeout=0)
+
+
+def test_get_bazi_detail_times_out_when_slots_are_full(fake_server):
+    client = fake_server('stall', timeout=0.3, max_in_flight=1)
+    client.request('tools/call', {})  # 占住唯一的名额，永远不会有响应
+    start = time.monotonic()
+    with pytest.raises(MCPError):
+        client.get_bazi_detail(solar_datetime='1998-07-31T14:10:00+08:00')
+    assert time.monotonic() - start < 2
+
+
+def test_failed_handshake_is_not_reused(fake_server, monkeypatch):
+    spawned = []
+    popen = mcp_client.subprocess.Popen
+
+    def record(*args, **kwargs):
+        spawned.append(popen(*args, **kwargs))
+        return spawned[-1]
+
+    monkeypatch.setattr(mcp_client.subprocess, 'Popen', record)
+    client = fake_server('init_error', timeout=2)
+    for _ in range(2):
+        with pytest.raises(MCPError):
+            client.get_bazi_detail(solar_datetime='1998-07-31T14:10:00+08:00')
+        assert client._process is None
+
+    # 每次都重新启动进程，握手失败的进程已被结束
+    assert len(spawned) == 2
+    assert all(process.wait(timeout=2) is not None for process in spawned)
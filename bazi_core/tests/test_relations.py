@@ -0,0 +1,43 @@
+"""
+刑冲合会 / 神煞查表：与 MCP 样例一致，批量结果与单个命盘一致
+"""
+import numpy as np
+import pytest
+
+from bazi_core import relations, shensha
+from bazi_core.batch import chart_arrays
+from bazi_core.chart import Chart
+
+
+@pytest.fixture(scope='module')
+def sample_chart(sample):
+    chart = Chart.from_dict(sample)
+    return sample, [code % 10 for code in chart.pillars], [code % 12 for code in chart.pillars]
+
+
+def test_mcp_relations_match_sample(sample_chart):
+    data, gans, zhis = sample_chart
+    assert relations.mcp_relations(gans, zhis) == data['刑冲合会']
+
+
+def test_local_shensha_match_sample_for_covered_kinds(sample_chart):
+    data, gans, zhis = sample_chart
+    local = shensha.shensha_map(gans, zhis)
+    for pillar, names in data['神煞'].items():
+        assert set(local[pillar]) == {name for name in names if name in shensha.KINDS}
+
+
+@pytest.fixture(scope='module')
+def charts():
+    rng = np.random.default_rng(49)
+    timestamps = rng.integers(np.datetime64('1901-03-01', 's').astype(np.int64),
+                              np.datetime64('2099-12-01', 's').astype(np.int64), 5000)
+    return chart_arrays(timestamps, 1)
+
+
+def test_batch_masks_match_single_chart(charts):
+    for i in range(len(charts['gan'])):
+        gans, zhis = charts['gan'][i].tolist(), charts['zhi'][i].tolist()
+        assert int(charts['branch_relations'][i]) == relations.branch_mask(zhis)
+        assert int(charts['stem_relations'][i]) == relations.stem_mask(gans)
+        assert tuple(int(mask) for mask in charts['shensha'][i]) == shensha.pillar_masks(gans, zhis)
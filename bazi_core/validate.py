@@ -0,0 +1,54 @@
+"""
+原生排盘与 bazi-mcp 逐字段对比
+"""
+import random
+from datetime import datetime, timedelta
+
+# 原生引擎覆盖的顶层字段（农历 / 神煞 / 刑冲合会 只在 MCP 结果中）
+NATIVE_FIELDS = (
+    '性别', '阳历', '八字', '生肖', '日主', '年柱', '月柱', '日柱', '时柱',
+    '胎元', '胎息', '命宫', '身宫', '大运',
+)
+
+
+def _walk(path, native, reference, out):
+    if isinstance(native, dict) and isinstance(reference, dict):
+        for key in list(reference) + [k for k in native if k not in reference]:
+            _walk(f"{path}.{key}" if path else key, native.get(key), reference.get(key), out)
+    elif isinstance(native, list) and isinstance(reference, list) and len(native) == len(reference):
+        for i, (a, b) in enumerate(zip(native, reference)):
+            _walk(f"{path}[{i}]", a, b, out)
+    elif native != reference:
+        out.append((path, native, reference))
+
+
+def diff_charts(native, reference, fields=NATIVE_FIELDS):
+    """
+    逐字段对比两份排盘结果
+
+    返回:
+        list: [(字段路径, 原生值, MCP 值), ...]，如 ('年柱.地支.藏干.主气.十神', '正官', '七杀')；完全一致时为空
+    """
+    out = []
+    for field in fields:
+        _walk(field, native.get(field), reference.get(field), out)
+    return out
+
+
+def field_group(path):
+    """把具体路径归并为字段类别（大运[3].干支 -> 大运[].干支），便于统计"""
+    parts = []
+    for part in path.split('.'):
+        name, bracket, _ = part.partition('[')
+        parts.append(name + ('[]' if bracket else ''))
+    return '.'.join(parts)
+
+
+def random_births(count, start_year=1901, end_year=2099, seed=0):
+    """随机生辰（北京时间 ISO 字符串, 性别），可复现"""
+    rng = random.Random(seed)
+    start = datetime(start_year, 1, 1)
+    span = int((datetime(end_year + 1, 1, 1) - start).total_seconds() // 60)
+    for _ in range(count):
+        moment = start + timedelta(minutes=rng.randrange(span))
+        yield f"{moment:%Y-%m-%dT%H:%M:00}+08:00", rng.randint(0, 1)
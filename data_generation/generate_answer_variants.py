@@ -0,0 +1,223 @@
+"""
+为每个 L4 意图 × 日主原型预生成简短回答
+
+原型 = 日主天干（甲..癸，10 种）× 日主强弱（弱 / 中和 / 旺，3 种）。
+每次 LLM 调用为一个 (L4, 日主) 生成 3 种强弱的回答，写入紧凑表 l4_answer_variant，
+在线顾问匹配到 L4 且已有用户八字时可直接输出，无需实时调用大模型。
+
+用法:
+    python generate_answer_variants.py                 # 补齐所有缺失的 (L4, 日主)
+    python generate_answer_variants.py --limit 100     # 只处理前 100 个 (L4, 日主)
+    python generate_answer_variants.py --l4-id 123     # 只处理某个 L4
+    python generate_answer_variants.py --workers 8     # 并发调用数
+"""
+import os
+import sys
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from generate_l4_content import call_llm, get_full_path
+
+# 原型定义（天干编码、强弱阈值）与在线顾问共用仓库根目录的 bazi_core
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bazi_core.archetype import BALANCE_CLASSES
+from bazi_core.tables import GAN as HEAVENLY_STEMS
+
+# Load environment variables
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+
+# 天干顺序即 day_master 编码（0-9）
+STEM_ARCHETYPES = {
+    "甲": "Yang Wood - a tall tree: principled, ambitious, grows straight toward goals",
+    "乙": "Yin Wood - a vine: flexible, diplomatic, finds a way around obstacles",
+    "丙": "Yang Fire - the sun: generous, visible, energizes everyone around them",
+    "丁": "Yin Fire - a candle: warm, perceptive, lights the way for a few people deeply",
+    "戊": "Yang Earth - a mountain: steady, reliable, hard to move once decided",
+    "己": "Yin Earth - a garden: nurturing, practical, cultivates people and resources",
+    "庚": "Yang Metal - a blade: decisive, direct, thrives on challenge",
+    "辛": "Yin Metal - a jewel: refined, detail-oriented, values quality and recognition",
+    "壬": "Yang Water - the ocean: expansive, bold thinker, restless without movement",
+    "癸": "Yin Water - rain: intuitive, gentle, quietly persistent",
+}
+
+# balance 编码（0-2）即 BALANCE_CLASSES 的下标，见 bazi_core.archetype
+BALANCE_HINTS = {
+    "weak": "their core element is under-supported: they need to build resources, allies and confidence before bold moves",
+    "balanced": "their elements are balanced: they can act directly and should focus on timing and follow-through",
+    "strong": "their core element is very strong: they should channel excess drive, avoid overpowering others, and delegate",
+}
+
+
+def setup_variant_table(cursor):
+    """Creates the compact l4_answer_variant table if it doesn't exist."""
+    sql = """
+    CREATE TABLE IF NOT EXISTS l4_answer_variant (
+        l4_id INT NOT NULL,
+        day_master TINYINT NOT NULL,
+        balance TINYINT NOT NULL,
+        answer VARCHAR(800) NOT NULL,
+        PRIMARY KEY (l4_id, day_master, balance),
+        FOREIGN KEY (l4_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+    )
+    """
+    cursor.execute(sql)
+    print("Ensured table 'l4_answer_variant' exists.")
+
+
+def find_missing_pairs(cursor, l4_id=None, limit=None):
+    """Returns (l4_id, day_master) pairs that don't have all balance variants yet."""
+    sql = """
+        SELECT kb.id, v.day_master, COUNT(v.balance)
+        FROM knowledge_base kb
+        LEFT JOIN l4_answer_variant v ON kb.id = v.l4_id
+        WHERE kb.level = 4
+    """
+    params = []
+    if l4_id is not None:
+        sql += " AND kb.id = %s"
+        params.append(l4_id)
+    sql += " GROUP BY kb.id, v.day_master"
+    cursor.execute(sql, params)
+
+    done = {}
+    for kb_id, day_master, count in cursor.fetchall():
+        done.setdefault(kb_id, set())
+        if day_master is not None and count >= len(BALANCE_CLASSES):
+            done[kb_id].add(day_master)
+
+    pairs = []
+    for kb_id in sorted(done):
+        for day_master in range(len(HEAVENLY_STEMS)):
+            if day_master not in done[kb_id]:
+                pairs.append((kb_id, day_master))
+                if limit and len(pairs) >= limit:
+                    return pairs
+    return pairs
+
+
+def generate_variants(path_info, day_master):
+    """Generates weak / balanced / strong answers for one (L4, day master)."""
+    stem = HEAVENLY_STEMS[day_master]
+    prompt = f"""
+    You are a Wu Xing (Five Elements) personal growth advisor writing pre-rendered answers for a decision app.
+
+    **User intention:**
+    - {path_info['L1']['name']} > {path_info['L2']['name']} > {path_info['L3']['name']}
+    - {path_info['L4']['name']} ({path_info['L4']['desc']})
+
+    **User archetype (day master):** {STEM_ARCHETYPES[stem]}
+
+    **Task:**
+    Write three short answers to this intention for this archetype, one per strength level:
+    - "weak": {BALANCE_HINTS['weak']}
+    - "balanced": {BALANCE_HINTS['balanced']}
+    - "strong": {BALANCE_HINTS['strong']}
+
+    **Style rules:**
+    - Under 70 words each, second person, confident ("Do this", not "You could try").
+    - ONE clear directive, then why it makes them stronger.
+    - Use the element QUALITIES in plain language; never say "day master", "Bazi", stem names or "X energy".
+
+    Output JSON with exactly the keys "weak", "balanced", "strong".
+    """
+
+    response = call_llm(prompt, is_json_output=True)
+    if not response:
+        return None
+
+    try:
+        # Clean up potential markdown code blocks
+        if response.startswith("```json"):
+            response = response[7:]
+        if response.endswith("```"):
+            response = response[:-3]
+        variants = json.loads(response)
+    except json.JSONDecodeError:
+        print("Failed to parse JSON response.")
+        return None
+
+    if not all(isinstance(variants.get(key), str) and variants[key].strip() for key in BALANCE_CLASSES):
+        print("Response is missing one of the balance variants.")
+        return None
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为 L4 × 日主原型预生成简短回答")
+    parser.add_argument("--l4-id", type=int, default=None, help="只处理指定的 L4")
+    parser.add_argument("--limit", type=int, default=None, help="最多处理多少个 (L4, 日主)")
+    parser.add_argument("--workers", type=int, default=4, help="并发 LLM 调用数")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        setup_variant_table(cursor)
+
+        print("Finding (L4, day master) pairs without variants...")
+        pairs = find_missing_pairs(cursor, args.l4_id, args.limit)
+        print(f"Found {len(pairs)} pairs needing variants ({len(pairs) * len(BALANCE_CLASSES)} answers).")
+
+        # 同一个 L4 的路径只查一次
+        paths = {}
+        for l4_id, _ in pairs:
+            if l4_id not in paths:
+                paths[l4_id] = get_full_path(cursor, l4_id)
+
+        started = time.time()
+        saved = 0
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(generate_variants, paths[l4_id], day_master): (l4_id, day_master)
+                for l4_id, day_master in pairs
+                if paths.get(l4_id)
+            }
+            for future in as_completed(futures):
+                l4_id, day_master = futures[future]
+                variants = future.result()
+                if not variants:
+                    print(f"Failed to generate variants for L4 {l4_id} / {HEAVENLY_STEMS[day_master]}.")
+                    continue
+
+                cursor.executemany(
+                    """
+                    REPLACE INTO l4_answer_variant (l4_id, day_master, balance, answer)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    [
+                        (l4_id, day_master, balance, variants[key].strip()[:800])
+                        for balance, key in enumerate(BALANCE_CLASSES)
+                    ],
+                )
+                conn.commit()
+                saved += 1
+                if saved % 50 == 0:
+                    rate = saved / (time.time() - started)
+                    print(f"Saved {saved}/{len(futures)} pairs ({rate:.1f} pairs/s).")
+
+        print(f"\nDone. Saved variants for {saved} (L4, day master) pairs.")
+
+    except mysql.connector.Error as err:
+        print(f"Database Error: {err}")
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+            print("\nDatabase connection closed.")
+
+
+if __name__ == "__main__":
+    main()
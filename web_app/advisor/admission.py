@@ -0,0 +1,153 @@
+"""
+LLM 准入控制 - 全局并发上限 + 按会话公平排队 + 优先级（流式回答优先于后台任务）
+"""
+import collections
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics
+
+# 优先级：数值越小越优先
+PRIORITY_ANSWER = 0       # 用户正在等待的流式回答
+PRIORITY_SELECTION = 1    # L1-L4 匹配选择
+PRIORITY_BACKGROUND = 2   # 决策头部等后台任务
+
+
+# 尚无数据的优先级的假定占用时长（秒）
+DEFAULT_HOLD_SECONDS = 2.0
+
+
+class AdmissionRejected(Exception):
+    """预计排队时间超过阈值，或等待超时"""
+
+    def __init__(self, estimated_wait):
+        super().__init__(f"LLM queue is busy (estimated wait {estimated_wait:.1f}s)")
+        self.estimated_wait = estimated_wait
+
+
+class _Ticket:
+    __slots__ = ('session_id', 'priority', 'tag', 'seq', 'enqueued_at')
+
+    def __init__(self, session_id, priority, tag, seq):
+        self.session_id = session_id
+        self.priority = priority
+        self.tag = tag
+        self.seq = seq
+        self.enqueued_at = time.time()
+
+
+class AdmissionController:
+    """
+    在所有上游 LLM 调用之前的并发限制器
+
+    调度规则：先比较优先级；同优先级内按会话做 start-time 公平排队——
+    每个会话的请求依次获得递增的虚拟时间标签，某个会话突发的多个请求
+    不会挤占其他会话，新会话的请求与其他会话的下一个请求交替执行。
+
+    参数:
+        name (str): 指标前缀
+        max_concurrency (int): 同时在途的上游调用上限
+        alpha (float): 平均占用时长 EWMA 系数（用于估算排队时间）
+
+    占用时长按优先级分别统计：流式回答占用几十秒，选择调用约 1 秒，混在一起会让估算随流量构成大幅摆动
+    """
+
+    def __init__(self, name, max_concurrency, alpha=0.2):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.alpha = alpha
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []
+        self._vtime = 0
+        self._session_tags = {}
+        self._seq = itertools.count()
+        self._hold_ewma = {}  # {优先级: 平均占用秒数}
+        self._active_priorities = collections.Counter()
+
+    def _publish(self):
+        metrics.set_gauge(f'{self.name}.depth', len(self._waiting))
+        metrics.set_gauge(f'{self.name}.active', self._active)
+
+    def _hold(self, priority):
+        return self._hold_ewma.get(priority, DEFAULT_HOLD_SECONDS)
+
+    def estimate_wait(self, priority=PRIORITY_ANSWER):
+        """估算某优先级的新请求需要排队多少秒"""
+        with self._cond:
+            return self._estimate_locked(priority)
+
+    def _estimate_locked(self, priority):
+        """排在前面的请求各自按其优先级的占用时长计，再加上一个在途名额释放的平均时间"""
+        ahead = [t.priority for t in self._waiting if t.priority <= priority]
+        if self._active < self.max_concurrency and not ahead:
+            return 0.0
+        active_hold = (sum(self._hold(p) * n for p, n in self._active_priorities.items()) / self._active
+                       if self._active else self._hold(priority))
+        return (sum(self._hold(p) for p in ahead) + active_hold) / self.max_concurrency
+
+    def _next_ticket(self):
+        return min(self._waiting, key=lambda t: (t.priority, t.tag, t.seq))
+
+    @contextmanager
+    def slot(self, session_id=None, priority=PRIORITY_ANSWER, busy_after=None, timeout=None):
+        """
+        获取一个上游调用名额
+
+        参数:
+            session_id (str): 会话 ID（公平排队依据）
+            priority (int): PRIORITY_* 之一
+            busy_after (float): 预计排队超过该秒数时立即拒绝（快速返回 busy）
+            timeout (float): 最长排队秒数，超时拒绝
+
+        异常:
+            AdmissionRejected
+        """
+        session_id = session_id or 'anonymous'
+        with self._cond:
+            estimated = self._estimate_locked(priority)
+            if busy_after is not None and estimated > busy_after:
+                metrics.incr(f'{self.name}.rejected')
+                raise AdmissionRejected(estimated)
+
+            tag = max(self._vtime, self._session_tags.get(session_id, 0)) + 1
+            self._session_tags[session_id] = tag
+            ticket = _Ticket(session_id, priority, tag, next(self._seq))
+            self._waiting.append(ticket)
+            self._publish()
+
+            deadline = None if timeout is None else ticket.enqueued_at + timeout
+            while not (self._active < self.max_concurrency and self._next_ticket() is ticket):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._publish()
+                    self._cond.notify_all()
+                    metrics.incr(f'{self.name}.rejected')
+                    raise AdmissionRejected(time.time() - ticket.enqueued_at)
+                self._cond.wait(remaining)
+
+            self._waiting.remove(ticket)
+            self._active += 1
+            self._active_priorities[priority] += 1
+            self._vtime = max(self._vtime, ticket.tag)
+            if len(self._session_tags) > 10000:
+                self._session_tags = {s: t for s, t in self._session_tags.items() if t > self._vtime}
+            self._publish()
+
+        wait_ms = (time.time() - ticket.enqueued_at) * 1000
+        metrics.record_stage(f'{self.name}.wait', wait_ms, priority=priority)
+        acquired_at = time.time()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._active_priorities[priority] -= 1
+                held = time.time() - acquired_at
+                self._hold_ewma[priority] = self.alpha * held + (1 - self.alpha) * self._hold(priority)
+                metrics.set_gauge(f'{self.name}.hold_seconds.{priority}', round(self._hold_ewma[priority], 2))
+                self._publish()
+                self._cond.notify_all()
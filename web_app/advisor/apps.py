@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AdvisorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "advisor"
+
+    def ready(self):
+        # LLM_PROVIDER=ollama 时预加载模型并定期保温（不阻塞启动）
+        from .ollama_warmup import start_warmup
+        start_warmup()
@@ -1,133 +1,73 @@
 """
-Bazi MCP Client - 通过 MCP stdio 协议调用 bazi-mcp 工具
+Bazi MCP Client - 通过 MCP stdio 协议调用 bazi-mcp 工具（常驻进程，JSON-RPC 流水线）
 """
-import subprocess
 import json
 import logging
 
+from bazi_core.chart import as_chart
+from bazi_core.mcp_client import MCPError, get_client
+
 logger = logging.getLogger(__name__)
 
 
 def call_bazi_mcp(solar_datetime=None, lunar_datetime=None, gender=1, provider_sect=2):
     """
     通过 MCP stdio 协议调用 bazi-mcp 工具获取八字排盘结果
-    
+
+    首次调用时启动常驻的 bazi-mcp 进程并完成 initialize 握手，之后的调用复用同一进程
+
     参数:
         solar_datetime (str): 公历时间，ISO格式，例如 "2000-05-15T12:00:00+08:00"
         lunar_datetime (str): 农历时间，例如 "2000-05-15 12:00:00"
         gender (int): 性别，0-女，1-男，默认1
         provider_sect (int): 早晚子时配置，1或2，默认2
-    
+
     返回:
         dict: 八字排盘结果
         None: 调用失败时返回None
     """
     try:
-        # 构建工具参数
-        tool_args = {
-            "gender": gender,
-            "eightCharProviderSect": provider_sect
-        }
-        
-        if solar_datetime:
-            tool_args["solarDatetime"] = solar_datetime
-        elif lunar_datetime:
-            tool_args["lunarDatetime"] = lunar_datetime
-        else:
-            logger.error("必须提供 solar_datetime 或 lunar_datetime 之一")
-            return None
-        
-        # 构建 MCP 请求（JSON-RPC 格式）
-        mcp_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "tools/call",
-            "params": {
-                "name": "getBaziDetail",
-                "arguments": tool_args
-            }
-        }
-        
-        request_json = json.dumps(mcp_request)
-        print(f"[MCP] 发送请求: {request_json}")
-        
-        # 启动 MCP 服务器进程（stdio 模式）
-        process = subprocess.Popen(
-            ["npx", "bazi-mcp"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',  # 强制使用 UTF-8 编码
-            errors='ignore',   # 忽略无法解码的字符
-            shell=True  # Windows 需要
+        bazi_result = get_client().get_bazi_detail(
+            solar_datetime=solar_datetime,
+            lunar_datetime=lunar_datetime,
+            gender=gender,
+            provider_sect=provider_sect,
         )
-        
-        # 发送请求并获取响应
-        stdout, stderr = process.communicate(input=request_json + "\n", timeout=10)
-        
-        if stderr:
-            print(f"[MCP] 错误输出: {stderr}")
-        
-        if not stdout:
-            logger.error("MCP 服务器无响应")
-            return None
-        
-        print(f"[MCP] 原始响应: {stdout[:500]}...")  # 打印前500字符
-        
-        # 解析响应（可能有多行，找到包含 result 的那一行）
-        lines = stdout.strip().split('\n')
-        for line in lines:
-            try:
-                response = json.loads(line)
-                if "result" in response:
-                    # MCP 响应格式: {"jsonrpc": "2.0", "id": 1, "result": {...}}
-                    result_data = response["result"]
-                    
-                    # MCP 可能返回 content 数组格式
-                    if isinstance(result_data, dict) and "content" in result_data:
-                        # 格式: {"content": [{"type": "text", "text": "..."}]}
-                        content_list = result_data["content"]
-                        if content_list and len(content_list) > 0:
-                            text_content = content_list[0].get("text", "")
-                            if text_content:
-                                bazi_result = json.loads(text_content)
-                                print(f"[MCP] 成功获取八字排盘")
-                                return bazi_result
-                    else:
-                        # 直接返回格式
-                        bazi_result = result_data
-                        if isinstance(bazi_result, str):
-                            bazi_result = json.loads(bazi_result)
-                        print(f"[MCP] 成功获取八字排盘")
-                        return bazi_result
-                        
-                elif "error" in response:
-                    logger.error(f"MCP 返回错误: {response['error']}")
-                    return None
-            except json.JSONDecodeError:
-                continue
-        
-        logger.error("无法解析 MCP 响应")
-        return None
-        
-    except subprocess.TimeoutExpired:
-        logger.error("MCP 调用超时")
-        process.kill()
-        return None
-    except Exception as e:
-        logger.error(f"调用 MCP 发生异常: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"[MCP] 成功获取八字排盘")
+        return bazi_result
+    except (MCPError, ValueError) as e:
+        logger.error(f"调用 MCP 失败: {e}")
         return None
 
 
+def call_bazi_mcp_many(charts, timeout=None):
+    """
+    批量排盘：所有请求在同一个 MCP 进程上流水线发送，响应按 id 对应回原顺序
+
+    参数:
+        charts (list): [{'solar_datetime': ..., 'gender': ..., 'provider_sect': ...}, ...]
+        timeout (float): 整批的超时秒数（默认 BAZI_MCP_TIMEOUT）
+
+    返回:
+        list: 与 charts 一一对应的排盘 dict，失败的项为 None
+    """
+    try:
+        results = get_client().call_many(charts, timeout=timeout)
+    except MCPError as e:
+        logger.error(f"调用 MCP 失败: {e}")
+        return [None] * len(charts)
+    for chart, result in zip(charts, results):
+        if isinstance(result, Exception):
+            logger.error(f"MCP 排盘失败 {chart}: {result}")
+    return [None if isinstance(r, Exception) else r for r in results]
+
+
 def format_bazi_for_llm(bazi_result):
     """
     将八字排盘结果格式化为适合 LLM 理解的文本
     
     参数:
-        bazi_result (dict): call_bazi_mcp 返回的排盘结果
+        bazi_result (Chart | dict): 紧凑排盘对象，或 call_bazi_mcp 返回的排盘结果
     
     返回:
         str: 格式化后的文本描述
@@ -136,56 +76,52 @@ def format_bazi_for_llm(bazi_result):
         return ""
     
     try:
+        chart = as_chart(bazi_result)
         # 提取核心信息
         text_parts = []
         
         # 基本信息
-        text_parts.append(f"性别：{bazi_result.get('性别', '')}")
-        text_parts.append(f"阳历：{bazi_result.get('阳历', '')}")
-        text_parts.append(f"农历：{bazi_result.get('农历', '')}")
-        text_parts.append(f"八字：{bazi_result.get('八字', '')}")
-        text_parts.append(f"生肖：{bazi_result.get('生肖', '')}")
-        text_parts.append(f"日主：{bazi_result.get('日主', '')}")
+        text_parts.append(f"性别：{chart.gender_name}")
+        text_parts.append(f"阳历：{chart.solar_text}")
+        if chart.lunar_text:  # 原生排盘不含农历
+            text_parts.append(f"农历：{chart.lunar_text}")
+        text_parts.append(f"八字：{chart.bazi}")
+        text_parts.append(f"生肖：{chart.zodiac}")
+        text_parts.append(f"日主：{chart.day_master_name}")
         
         # 四柱信息（年月日时）
         pillars = ['年柱', '月柱', '日柱', '时柱']
-        for pillar_name in pillars:
-            pillar = bazi_result.get(pillar_name, {})
-            if pillar:
-                tian_gan = pillar.get('天干', {})
-                di_zhi = pillar.get('地支', {})
-                text_parts.append(f"\n{pillar_name}：")
-                text_parts.append(f"  天干：{tian_gan.get('天干', '')} ({tian_gan.get('五行', '')}{tian_gan.get('阴阳', '')})")
-                if pillar_name != '日柱':  # 日柱天干没有十神
-                    text_parts.append(f"  十神：{tian_gan.get('十神', '')}")
-                text_parts.append(f"  地支：{di_zhi.get('地支', '')} ({di_zhi.get('五行', '')}{di_zhi.get('阴阳', '')})")
-                text_parts.append(f"  纳音：{pillar.get('纳音', '')}")
-                text_parts.append(f"  运势：{pillar.get('星运', '')}")
+        for i, pillar_name in enumerate(pillars):
+            pillar = chart.pillar(i)
+            text_parts.append(f"\n{pillar_name}：")
+            text_parts.append(f"  天干：{pillar.gan_name} ({pillar.gan_wuxing}{pillar.gan_yinyang})")
+            if pillar_name != '日柱':  # 日柱天干没有十神
+                text_parts.append(f"  十神：{pillar.shishen or ''}")
+            text_parts.append(f"  地支：{pillar.zhi_name} ({pillar.zhi_wuxing}{pillar.zhi_yinyang})")
+            text_parts.append(f"  纳音：{pillar.nayin}")
+            text_parts.append(f"  运势：{pillar.xingyun}")
         
         # 命宫、身宫
-        text_parts.append(f"\n命宫：{bazi_result.get('命宫', '')}")
-        text_parts.append(f"身宫：{bazi_result.get('身宫', '')}")
-        
-        # 神煞（精简显示）
-        shen_sha = bazi_result.get('神煞', {})
-        if shen_sha:
-            text_parts.append("\n神煞（重要）：")
-            for pillar_name in pillars:
-                sha_list = shen_sha.get(pillar_name, [])
+        text_parts.append(f"\n命宫：{chart.ming_gong}")
+        text_parts.append(f"身宫：{chart.shen_gong}")
+        
+        # 神煞（精简显示；原生排盘只有 bazi_core.shensha 本地推出的常用神煞）
+        shensha = chart.shensha_map()
+        if any(shensha.values()):
+            text_parts.append("\n神煞（重要）：" if chart.has_shensha else "\n神煞（常用）：")
+            for pillar_name, sha_list in shensha.items():
                 if sha_list:
                     text_parts.append(f"  {pillar_name}：{', '.join(sha_list[:5])}")  # 只显示前5个
         
         # 大运（只显示当前和未来2个）
-        da_yun = bazi_result.get('大运', {})
-        if da_yun and '大运' in da_yun:
-            text_parts.append(f"\n起运年龄：{da_yun.get('起运年龄', '')}岁")
-            yun_list = da_yun['大运'][:3]  # 只取前3个大运
+        if chart.dayun():
+            text_parts.append(f"\n起运年龄：{chart.dayun_start_age}岁")
             text_parts.append("大运（近期）：")
-            for yun in yun_list:
+            for yun in chart.dayun()[:3]:  # 只取前3个大运
                 text_parts.append(
-                    f"  {yun.get('干支', '')} ({yun.get('开始年份', '')}-{yun.get('结束', '')}年, "
-                    f"{yun.get('开始年龄', '')}-{yun.get('结束年龄', '')}岁) - "
-                    f"天干：{yun.get('天干十神', '')}"
+                    f"  {yun.ganzhi} ({yun.start_year}-{yun.end_year}年, "
+                    f"{yun.start_age}-{yun.end_age}岁) - "
+                    f"天干：{yun.gan_shishen}"
                 )
         
         return "\n".join(text_parts)
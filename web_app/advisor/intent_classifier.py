@@ -0,0 +1,211 @@
+"""
+本地意图分类器 - 哈希 n-gram 特征 + softmax 逻辑回归，预测问题所属的 L1 / L2
+
+层级结构：一个根模型在所有 L1 之间分类，每个 L1 各有一个模型在其 L2 子节点之间分类。
+纯 Python 实现，推理只做少量字典查找（微秒级），模型以 JSON 保存。
+"""
+import json
+import math
+import random
+import zlib
+
+from .lexical_index import tokenize
+
+FORMAT_VERSION = 1
+
+
+def featurize(text, n_features):
+    """问题文本 -> {哈希特征下标: 权重}（词 unigram + bigram，按 1/sqrt(n) 归一化）"""
+    tokens = tokenize(text)
+    grams = [f"u:{t}" for t in tokens] + [f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    if not grams:
+        return {}
+    value = 1.0 / math.sqrt(len(grams))
+    features = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode('utf-8')) % n_features
+        features[index] = features.get(index, 0.0) + value
+    return features
+
+
+class SoftmaxModel:
+    """
+    稀疏多分类逻辑回归
+
+    参数:
+        classes (list): 类别（节点 ID）
+    """
+
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.bias = [0.0] * len(self.classes)
+        self.weights = {}  # {feature: [每个类别的权重]}
+
+    def _logits(self, features):
+        logits = list(self.bias)
+        for feature, value in features.items():
+            row = self.weights.get(feature)
+            if row is not None:
+                for k, w in enumerate(row):
+                    logits[k] += w * value
+        return logits
+
+    def predict_proba(self, features):
+        logits = self._logits(features)
+        top = max(logits)
+        exps = [math.exp(x - top) for x in logits]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, features):
+        """返回 (类别, 概率)"""
+        if len(self.classes) == 1:
+            return self.classes[0], 1.0
+        probs = self.predict_proba(features)
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.classes[best], probs[best]
+
+    def fit(self, samples, epochs=8, learning_rate=0.5, l2=1e-5, seed=0):
+        """
+        SGD 训练
+
+        参数:
+            samples (list): [(features, label), ...]，label 必须在 classes 中
+        """
+        if len(self.classes) < 2:
+            return
+        index = {c: k for k, c in enumerate(self.classes)}
+        samples = [(f, index[label]) for f, label in samples if label in index]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            rate = learning_rate / (1 + epoch)
+            for features, target in samples:
+                probs = self.predict_proba(features)
+                probs[target] -= 1.0
+                for k, g in enumerate(probs):
+                    self.bias[k] -= rate * g
+                for feature, value in features.items():
+                    row = self.weights.get(feature)
+                    if row is None:
+                        row = self.weights[feature] = [0.0] * len(self.classes)
+                    for k, g in enumerate(probs):
+                        row[k] -= rate * (g * value + l2 * row[k])
+
+    def to_dict(self, precision=4, prune_below=1e-3):
+        weights = {}
+        for feature, row in self.weights.items():
+            if max(abs(w) for w in row) >= prune_below:
+                weights[str(feature)] = [round(w, precision) for w in row]
+        return {
+            'classes': self.classes,
+            'bias': [round(b, precision) for b in self.bias],
+            'weights': weights,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(data['classes'])
+        model.bias = list(data['bias'])
+        model.weights = {int(feature): row for feature, row in data['weights'].items()}
+        return model
+
+
+class IntentClassifier:
+    """
+    L1 / L2 层级分类器
+
+    参数:
+        n_features (int): 哈希空间大小
+    """
+
+    def __init__(self, n_features=2 ** 18):
+        self.n_features = n_features
+        self.root = None      # SoftmaxModel over L1
+        self.children = {}    # {l1_id: SoftmaxModel over L2}
+
+    def train(self, nodes, queries=(), query_weight=3, epochs=8):
+        """
+        用知识树自身的名称 / 描述（以及可选的真实问题日志）训练
+
+        参数:
+            nodes (list): 与 KnowledgeTreeIndex 相同的节点字典列表
+            queries (list): [(问题文本, l4_id), ...]
+            query_weight (int): 真实问题样本的重复次数
+        """
+        by_id = {node['id']: node for node in nodes}
+
+        def ancestors(node_id):
+            """返回 (l1_id, l2_id)，不存在的层级为 None"""
+            path = {}
+            while node_id in by_id:
+                node = by_id[node_id]
+                path[node['level']] = node_id
+                node_id = node.get('parent_id')
+            return path.get(1), path.get(2)
+
+        # (文本, l1, l2)
+        texts = []
+        for node in nodes:
+            l1_id, l2_id = ancestors(node['id'])
+            if l1_id is None:
+                continue
+            for text in (node.get('name'), f"{node.get('name') or ''} {node.get('description') or ''}"):
+                if text and text.strip():
+                    texts.append((text, l1_id, l2_id))
+        for query, l4_id in queries:
+            l1_id, l2_id = ancestors(l4_id)
+            if l1_id is not None:
+                texts.extend([(query, l1_id, l2_id)] * query_weight)
+
+        l1_ids = [node['id'] for node in nodes if node['level'] == 1]
+        self.root = SoftmaxModel(l1_ids)
+        self.root.fit([(featurize(t, self.n_features), l1) for t, l1, _ in texts], epochs=epochs)
+
+        self.children = {}
+        for l1_id in l1_ids:
+            l2_ids = [node['id'] for node in nodes if node['level'] == 2 and node.get('parent_id') == l1_id]
+            if not l2_ids:
+                continue
+            model = SoftmaxModel(l2_ids)
+            model.fit([(featurize(t, self.n_features), l2) for t, l1, l2 in texts
+                       if l1 == l1_id and l2 is not None], epochs=epochs)
+            self.children[l1_id] = model
+        return len(texts)
+
+    def predict(self, query):
+        """
+        返回 {'l1': (id, 概率), 'l2': (id, 概率) 或 None}
+
+        l2 概率为 P(L1) * P(L2 | L1)
+        """
+        features = featurize(query, self.n_features)
+        l1_id, p1 = self.root.predict(features)
+        result = {'l1': (l1_id, p1), 'l2': None}
+        child = self.children.get(l1_id)
+        if child is not None:
+            l2_id, p2 = child.predict(features)
+            result['l2'] = (l2_id, p1 * p2)
+        return result
+
+    def save(self, path):
+        data = {
+            'format_version': FORMAT_VERSION,
+            'n_features': self.n_features,
+            'root': self.root.to_dict(),
+            'children': {str(l1_id): model.to_dict() for l1_id, model in self.children.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"unsupported intent model format: {data.get('format_version')}")
+        classifier = cls(data['n_features'])
+        classifier.root = SoftmaxModel.from_dict(data['root'])
+        classifier.children = {int(l1_id): SoftmaxModel.from_dict(model)
+                               for l1_id, model in data['children'].items()}
+        return classifier
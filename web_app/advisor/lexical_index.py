@@ -0,0 +1,161 @@
+"""
+知识树词法索引 - 基于 BM25 的倒排索引，用于在 LLM 逐级选择之前缩小候选范围
+"""
+import collections
+import heapq
+import math
+
+from .query_cache import STOP_WORDS, normalize_query
+
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+
+def _stem(word):
+    """极简词干：去掉一个常见英文后缀（保留至少 3 个字母）"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """归一化 + 去停用词 + 词干"""
+    return [_stem(w) for w in normalize_query(text).split() if w not in STOP_WORDS]
+
+
+class KnowledgeTreeIndex:
+    """
+    knowledge_base 快照上的 BM25 索引（各层节点的 name + description_en 各为一篇文档）
+
+    参数:
+        nodes (list): [{'id', 'parent_id', 'level', 'name', 'description', 'has_content'}, ...]
+        k1 (float), b (float): BM25 参数
+        parent_weight (float): 路径得分中父节点得分的权重（L4 得分 = 自身 + w * L3 路径得分 ...）
+    """
+
+    def __init__(self, nodes, k1=1.5, b=0.75, parent_weight=0.5):
+        self.k1 = k1
+        self.b = b
+        self.parent_weight = parent_weight
+        self.nodes = {}
+        self.children = collections.defaultdict(list)
+        self.by_level = collections.defaultdict(list)
+        self.content_l4 = frozenset(node['id'] for node in nodes if node['level'] == 4 and node.get('has_content'))
+        self._postings = collections.defaultdict(list)  # {term: [(node_id, tf), ...]}
+        self._lengths = {}
+
+        for node in nodes:
+            node_id = node['id']
+            self.nodes[node_id] = node
+            self.children[node.get('parent_id')].append(node_id)
+            self.by_level[node['level']].append(node_id)
+            terms = tokenize(f"{node.get('name') or ''} {node.get('description') or ''}")
+            self._lengths[node_id] = len(terms)
+            for term, tf in collections.Counter(terms).items():
+                self._postings[term].append((node_id, tf))
+
+        self._avg_length = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 0.0
+        total = len(self.nodes)
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def scores(self, query):
+        """返回 {node_id: BM25 得分}（只包含与问题有词项重合的节点）"""
+        result = collections.defaultdict(float)
+        avg = self._avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for node_id, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[node_id] / avg)
+                result[node_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return result
+
+    def path(self, node_id):
+        """从根到该节点的 ID 列表（L1 在前）"""
+        ids = []
+        while node_id is not None and node_id in self.nodes:
+            ids.append(node_id)
+            node_id = self.nodes[node_id].get('parent_id')
+        return ids[::-1]
+
+    def path_score(self, node_id, scores):
+        """节点得分 + 逐级衰减的祖先得分"""
+        total = 0.0
+        weight = 1.0
+        while node_id is not None and node_id in self.nodes:
+            total += weight * scores.get(node_id, 0.0)
+            weight *= self.parent_weight
+            node_id = self.nodes[node_id].get('parent_id')
+        return total
+
+    def path_scores(self, scores):
+        """
+        批量计算路径得分：只计算有词项得分的节点及其子孙（其余节点路径得分为 0）
+
+        返回:
+            dict: {node_id: 路径得分}
+        """
+        result = {}
+        # 按层从浅到深：祖先先算出，子孙的路径得分由父节点递推
+        for node_id in sorted((i for i in scores if i in self.nodes), key=lambda i: self.nodes[i]['level']):
+            if node_id in result:
+                continue
+            result[node_id] = self.path_score(node_id, scores)
+            stack = [node_id]
+            while stack:
+                parent = stack.pop()
+                for child in self.children.get(parent, ()):
+                    result[child] = scores.get(child, 0.0) + self.parent_weight * result[parent]
+                    stack.append(child)
+        return result
+
+    def descendants(self, node_id, level=None):
+        """子树中的节点 ID（不含自身），level 指定时只返回该层"""
+        result = []
+        stack = list(self.children.get(node_id, ()))
+        while stack:
+            child = stack.pop()
+            if level is None or self.nodes[child]['level'] == level:
+                result.append(child)
+            stack.extend(self.children.get(child, ()))
+        return result
+
+    def shortlist(self, candidate_ids, scores, top_k):
+        """
+        按路径得分截取前 top_k 个候选
+
+        没有任何候选与问题有词项重合时返回全部候选（交给 LLM 判断）
+        """
+        ranked = sorted(candidate_ids, key=lambda i: self.path_score(i, scores), reverse=True)
+        if not ranked or self.path_score(ranked[0], scores) <= 0:
+            return list(candidate_ids)
+        return ranked[:top_k]
+
+    def best_at_level(self, level, scores, min_score, margin, require_content=False):
+        """
+        在某一层中找词法上足够确定的节点（用于直接跳到 L3 / L4）
+
+        参数:
+            min_score (float): 最高路径得分下限
+            margin (float): 第一名与第二名得分之比下限
+            require_content (bool): 只考虑有 l4_content 的节点
+
+        返回:
+            (node_id, score) 或 None
+        """
+        ranked = heapq.nlargest(2, (
+            (score, i) for i, score in self.path_scores(scores).items()
+            if self.nodes[i]['level'] == level and (not require_content or self.nodes[i].get('has_content'))
+        ))
+        if not ranked or ranked[0][0] < min_score:
+            return None
+        if len(ranked) > 1 and ranked[1][0] > 0 and ranked[0][0] / ranked[1][0] < margin:
+            return None
+        return ranked[0][1], ranked[0][0]
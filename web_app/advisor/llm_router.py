@@ -0,0 +1,210 @@
+"""
+LLM Provider 路由 - 按各 provider 的延迟与错误率 EWMA 选择最优 provider，
+支持失败切换与首 token 对冲请求
+
+延迟按调用类型分别统计：流式回答记首 token 延迟（ttft），非流式的选择 / 头部调用记整次响应耗时（completion），
+两者量级不同，不能混在同一个 EWMA 中
+"""
+import queue
+import threading
+import time
+
+from . import metrics
+
+
+class LLMUnavailable(Exception):
+    """所有 provider 都在首 token 之前失败"""
+
+
+KIND_TTFT = 'ttft'              # 流式调用的首 token 延迟
+KIND_COMPLETION = 'completion'  # 非流式调用的整次响应耗时
+
+
+class ProviderRouter:
+    """
+    维护每个 provider 按调用类型（KIND_TTFT / KIND_COMPLETION）区分的延迟 EWMA 与错误率 EWMA，并据此对候选路由排序
+
+    参数:
+        alpha (float): EWMA 平滑系数，越大越看重最近的调用
+        prior_ttft_ms (float): 尚无数据的 provider 的假定延迟
+        error_penalty_ms (float): 错误率为 1 时附加的惩罚延迟
+        cooldown_failures (int): 连续失败多少次后进入冷却
+        cooldown_seconds (float): 冷却时长，冷却期内排到最后
+    """
+
+    def __init__(self, alpha=0.3, prior_ttft_ms=1000.0, error_penalty_ms=10000.0,
+                 cooldown_failures=3, cooldown_seconds=30.0):
+        self.alpha = alpha
+        self.prior_ttft_ms = prior_ttft_ms
+        self.error_penalty_ms = error_penalty_ms
+        self.cooldown_failures = cooldown_failures
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _get(self, provider):
+        return self._stats.setdefault(provider, {
+            'latency_ewma_ms': {},  # {调用类型: EWMA}
+            'error_rate': 0.0,
+            'calls': 0,
+            'errors': 0,
+            'consecutive_failures': 0,
+            'last_failure_at': 0.0,
+        })
+
+    def record_success(self, provider, latency_ms, kind=KIND_TTFT):
+        """记录一次成功调用及其延迟（kind 为 KIND_TTFT 时是首 token 延迟，KIND_COMPLETION 时是整次响应耗时）"""
+        with self._lock:
+            s = self._get(provider)
+            s['calls'] += 1
+            s['consecutive_failures'] = 0
+            previous = s['latency_ewma_ms'].get(kind)
+            s['latency_ewma_ms'][kind] = latency_ms if previous is None else \
+                self.alpha * latency_ms + (1 - self.alpha) * previous
+            s['error_rate'] = (1 - self.alpha) * s['error_rate']
+            self._publish(provider, s)
+
+    def record_error(self, provider):
+        """记录一次失败调用（首 token 之前的错误 / 超时 / 非 200）"""
+        with self._lock:
+            s = self._get(provider)
+            s['calls'] += 1
+            s['errors'] += 1
+            s['consecutive_failures'] += 1
+            s['last_failure_at'] = time.time()
+            s['error_rate'] = self.alpha + (1 - self.alpha) * s['error_rate']
+            self._publish(provider, s)
+
+    def _publish(self, provider, s):
+        for kind, value in s['latency_ewma_ms'].items():
+            metrics.set_gauge(f'router.{provider}.{kind}_ewma_ms', round(value, 1))
+        metrics.set_gauge(f'router.{provider}.error_rate', round(s['error_rate'], 3))
+
+    def score(self, provider, kind=KIND_TTFT):
+        """越小越好（按 kind 类型的延迟 EWMA + 错误惩罚）；冷却中的 provider 返回 None"""
+        with self._lock:
+            s = self._get(provider)
+            cooling = (s['consecutive_failures'] >= self.cooldown_failures and
+                       time.time() - s['last_failure_at'] < self.cooldown_seconds)
+            if cooling:
+                return None
+            latency = s['latency_ewma_ms'].get(kind, self.prior_ttft_ms)
+            return latency + s['error_rate'] * self.error_penalty_ms
+
+    def rank(self, routes, kind=KIND_TTFT):
+        """按 kind 类型的得分对候选路由排序（同分保持原顺序，冷却中的排最后）"""
+        scored = []
+        for index, route in enumerate(routes):
+            score = self.score(route['provider'], kind)
+            scored.append((score is None, score or 0.0, index, route))
+        scored.sort(key=lambda item: item[:3])
+        return [item[3] for item in scored]
+
+    def snapshot(self):
+        with self._lock:
+            return {provider: {**s, 'latency_ewma_ms': dict(s['latency_ewma_ms'])} for provider, s in self._stats.items()}
+
+
+def hedged_stream(routes, open_stream, router, hedge_after_ms=0):
+    """
+    依次尝试 routes 发起流式请求，首 token 之前失败则自动切换到下一个 provider；
+    hedge_after_ms > 0 时，若首个 provider 在该时间内没有返回首 token，
+    会并行向下一个 provider 发起对冲请求，先返回首 token 的一方胜出，另一方被取消。
+
+    参数:
+        routes (list): 已排序的候选路由
+        open_stream (callable): open_stream(route, cancel_event) -> 文本片段迭代器
+        router (ProviderRouter): 用于记录首 token 延迟（KIND_TTFT）/ 错误
+        hedge_after_ms (int): 对冲等待时间，0 表示不对冲
+
+    产出:
+        (route, content, info)：info 为 {'ttft_ms', 'hedged', 'attempts'}
+
+    异常:
+        LLMUnavailable: 所有 provider 都在首 token 之前失败
+    """
+    events = queue.Queue()
+    cancels = []
+    start = time.time()
+    info = {'ttft_ms': None, 'hedged': False, 'attempts': 0}
+
+    def worker(index, route, cancel):
+        attempt_start = time.time()
+        got_first = False
+        try:
+            for content in open_stream(route, cancel):
+                if cancel.is_set():
+                    return
+                if not got_first:
+                    got_first = True
+                    router.record_success(route['provider'], (time.time() - attempt_start) * 1000, KIND_TTFT)
+                events.put(('data', index, content))
+            if not got_first and not cancel.is_set():
+                router.record_error(route['provider'])
+            events.put(('end', index, None))
+        except Exception as e:
+            if not got_first and not cancel.is_set():
+                router.record_error(route['provider'])
+            events.put(('error', index, e))
+
+    def launch():
+        index = len(cancels)
+        cancel = threading.Event()
+        cancels.append(cancel)
+        info['attempts'] += 1
+        threading.Thread(target=worker, args=(index, routes[index], cancel), daemon=True).start()
+        return index
+
+    running = {launch()}
+    winner = None
+    last_error = None
+    hedge_deadline = start + hedge_after_ms / 1000.0 if hedge_after_ms > 0 else None
+
+    try:
+        while True:
+            timeout = None
+            can_hedge = (winner is None and hedge_deadline is not None and
+                         not info['hedged'] and len(cancels) < len(routes))
+            if can_hedge:
+                timeout = max(0.0, hedge_deadline - time.time())
+            try:
+                kind, index, value = events.get(timeout=timeout)
+            except queue.Empty:
+                # 首 token 超时：向下一个 provider 发起对冲请求
+                info['hedged'] = True
+                print(f"[ROUTER] 首 token 超过 {hedge_after_ms}ms，对冲请求 {routes[len(cancels)]['provider']}", flush=True)
+                running.add(launch())
+                continue
+
+            if winner is None:
+                if kind == 'data':
+                    winner = index
+                    info['ttft_ms'] = (time.time() - start) * 1000
+                    for other, cancel in enumerate(cancels):
+                        if other != winner:
+                            cancel.set()
+                    yield routes[winner], value, info
+                    continue
+
+                running.discard(index)
+                if kind == 'error':
+                    last_error = value
+                    print(f"[ROUTER] {routes[index]['provider']} 调用失败: {value}", flush=True)
+                if not running:
+                    if len(cancels) < len(routes):
+                        # 失败切换到下一个 provider
+                        running.add(launch())
+                        continue
+                    if last_error is not None:
+                        raise LLMUnavailable(str(last_error))
+                    return
+            elif index == winner:
+                if kind == 'data':
+                    yield routes[winner], value, info
+                elif kind == 'end':
+                    return
+                else:
+                    raise value
+    finally:
+        for cancel in cancels:
+            cancel.set()
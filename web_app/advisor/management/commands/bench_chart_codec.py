@@ -0,0 +1,100 @@
+"""
+对比排盘的几种缓存形式：JSON 文本 / 原始 dict / Chart 对象 / 二进制编码（bazi_core.codec）
+
+用法:
+    python manage.py bench_chart_codec --samples 1000
+    python manage.py bench_chart_codec --reference ../bazi_analyzer/bazi_result_19980731.json
+
+输出每种形式的平均大小、编码 / 解码耗时，以及 SESSION_STORE 中每个会话多占用的内存。
+样本为随机生辰的原生排盘；--reference 指定的 MCP 结果（含农历、神煞、刑冲合会）单独统计
+"""
+import json
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bazi_core import codec
+from bazi_core.chart import Chart
+from bazi_core.engine import bazi_detail
+from bazi_core.validate import random_births
+
+DEFAULT_REFERENCE = os.path.join(settings.BASE_DIR.parent, 'bazi_analyzer', 'bazi_result_19980731.json')
+
+
+def _timed_us(func, items, repeat=3):
+    """对每个元素调用 func，取 repeat 次中最快一次的平均微秒数"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e6
+
+
+def _session_bytes(values):
+    """把每个值放进一个独立会话（结构同 views.SESSION_STORE）后，平均每个会话增加的内存"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = {f"session-{i}": {'history': [], 'bazi_chart': value} for i, value in enumerate(values())}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(store)
+
+
+class Command(BaseCommand):
+    help = "比较 JSON / dict / Chart / 二进制编码 的大小、编解码耗时与每会话内存"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--reference', default=DEFAULT_REFERENCE, help="MCP 排盘结果 JSON（留空跳过）")
+
+    def handle(self, *args, **options):
+        if options['samples'] <= 0:
+            raise CommandError("--samples 必须大于 0")
+        groups = [('native', [bazi_detail(s, gender=g)
+                              for s, g in random_births(options['samples'], seed=options['seed'])])]
+        if options['reference']:
+            try:
+                with open(options['reference'], encoding='utf-8') as f:
+                    groups.append(('mcp', [json.load(f)] * options['samples']))
+            except OSError as e:
+                self.stderr.write(f"跳过 MCP 样本: {e}")
+
+        for name, dicts in groups:
+            self._bench(name, dicts)
+
+    def _bench(self, name, dicts):
+        texts = [json.dumps(d, ensure_ascii=False) for d in dicts]
+        charts = [Chart.from_dict(d) for d in dicts]
+        blobs = [codec.encode(c) for c in charts]
+        for d, blob in zip(dicts, blobs):
+            if codec.decode_dict(blob) != d:
+                raise CommandError(f"{name}: 编码往返不一致 {d.get('阳历')}")
+
+        json_size = sum(len(t.encode('utf-8')) for t in texts) / len(texts)
+        blob_size = sum(len(b) for b in blobs) / len(blobs)
+        self.stdout.write(f"\n[{name}] {len(dicts)} 个排盘，往返一致")
+        self.stdout.write(f"{'':<22}{'JSON':>12}{'codec':>12}")
+        self.stdout.write(f"{'size (bytes)':<22}{json_size:>12.0f}{blob_size:>12.0f}")
+        self.stdout.write(f"{'encode dict (us)':<22}"
+                          f"{_timed_us(lambda d: json.dumps(d, ensure_ascii=False), dicts):>12.1f}"
+                          f"{_timed_us(codec.encode, dicts):>12.1f}")
+        self.stdout.write(f"{'encode Chart (us)':<22}{'-':>12}{_timed_us(codec.encode, charts):>12.1f}")
+        self.stdout.write(f"{'decode -> dict (us)':<22}"
+                          f"{_timed_us(json.loads, texts):>12.1f}{_timed_us(codec.decode_dict, blobs):>12.1f}")
+        self.stdout.write(f"{'decode -> Chart (us)':<22}{'-':>12}{_timed_us(codec.decode, blobs):>12.1f}")
+
+        self.stdout.write("per-session memory (bytes):")
+        for label, values in (
+            ('dict', lambda: (json.loads(t) for t in texts)),
+            ('JSON text', lambda: (t.encode('utf-8').decode('utf-8') for t in texts)),
+            ('Chart', lambda: (codec.decode(b) for b in blobs)),
+            ('codec bytes', lambda: (bytes(bytearray(b)) for b in blobs)),
+        ):
+            self.stdout.write(f"  {label:<14}{_session_bytes(values):>10.0f}")
@@ -0,0 +1,81 @@
+"""
+比较 L4 匹配模式（逐级 cascade / 单次 path）的延迟与准确率
+
+用法:
+    python manage.py compare_matching --queries labeled.jsonl
+    python manage.py compare_matching --queries labeled.jsonl --limit 50 --modes cascade,path
+
+问题文件为 JSONL，每行 {"query": ..., "l4_id": ...}，标注须独立于本系统（人工标注等）；
+QUERY_LOG_PATH 中的 L4 是系统自己的匹配结果，用它评估准确率是循环论证
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from advisor import metrics, views
+from advisor.management.commands.train_intent_classifier import read_query_log
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = "在带标注的问题上比较各匹配模式的延迟、LLM 调用次数与准确率"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', required=True, help="独立标注的问题 JSONL（不要用 QUERY_LOG_PATH）")
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--modes', default='cascade,path')
+
+    def handle(self, *args, **options):
+        samples = read_query_log(options['queries'])[:options['limit']]
+        if not samples:
+            raise CommandError("问题文件为空")
+
+        index = views.get_knowledge_tree_index()
+        if index is None:
+            raise CommandError("无法读取 knowledge_base")
+
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        results = {}
+        for mode in modes:
+            self.stdout.write(f"运行 {mode}（{len(samples)} 条）...")
+            results[mode] = [self._run(mode, query) for query, _ in samples]
+
+        self.stdout.write("")
+        self.stdout.write(f"{'mode':<10}{'L4 acc':>9}{'L3 acc':>9}{'no match':>10}"
+                          f"{'calls':>8}{'avg ms':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for mode in modes:
+            rows = results[mode]
+            n = len(rows)
+            l4_hits = sum(r['l4_id'] == l4_id for r, (_, l4_id) in zip(rows, samples))
+            l3_hits = sum(self._l3(index, r['l4_id']) is not None and
+                          self._l3(index, r['l4_id']) == self._l3(index, l4_id)
+                          for r, (_, l4_id) in zip(rows, samples))
+            misses = sum(r['l4_id'] is None for r in rows)
+            latencies = [r['ms'] for r in rows]
+            calls = sum(r['calls'] for r in rows) / n
+            self.stdout.write(f"{mode:<10}{l4_hits / n:>9.1%}{l3_hits / n:>9.1%}{misses:>10}"
+                              f"{calls:>8.2f}{sum(latencies) / n:>9.0f}"
+                              f"{_percentile(latencies, 0.5):>9.0f}{_percentile(latencies, 0.95):>9.0f}")
+
+        if len(modes) == 2:
+            a, b = modes
+            agree = sum(x['l4_id'] == y['l4_id'] for x, y in zip(results[a], results[b]))
+            self.stdout.write(f"\n{a} 与 {b} 选出相同 L4 的比例: {agree / len(samples):.1%}")
+
+    def _run(self, mode, query):
+        """运行一次匹配，返回 L4、耗时与选择调用次数（不经过路由缓存）"""
+        trace = metrics.start_trace('compare_matching')
+        start = time.time()
+        l4_id = views.find_best_l4_match(query, mode=mode, log_query=False)
+        elapsed_ms = (time.time() - start) * 1000
+        calls = sum(1 for s in trace['stages'] if s['stage'] == 'llm.selection')
+        return {'l4_id': l4_id, 'ms': elapsed_ms, 'calls': calls}
+
+    @staticmethod
+    def _l3(index, l4_id):
+        node = index.nodes.get(l4_id)
+        return node.get('parent_id') if node else None
@@ -0,0 +1,109 @@
+"""
+训练本地意图分类器（L1 / L2）
+
+用法:
+    python manage.py train_intent_classifier
+    python manage.py train_intent_classifier --query-log logs/queries.jsonl --epochs 10
+"""
+import json
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from advisor import views
+from advisor.intent_classifier import IntentClassifier
+
+
+def read_query_log(path, source=None):
+    """
+    读取 QUERY_LOG_PATH 格式的 JSONL：每行 {"query": ..., "l4_id": ..., "source": ...}
+
+    参数:
+        source (str): 只保留该来源的记录（没有 source 字段的旧记录一并跳过）；None 表示不过滤
+    """
+    samples = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if source is not None and record.get('source') != source:
+                    continue
+                samples.append((record['query'], int(record['l4_id'])))
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                continue
+    return samples
+
+
+class Command(BaseCommand):
+    help = "用 knowledge_base（及可选的问题日志）训练 L1 / L2 意图分类器"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query-log', default=views.QUERY_LOG_PATH,
+                            help="问题日志 JSONL（默认 QUERY_LOG_PATH）")
+        parser.add_argument('--output', default=views.INTENT_MODEL_PATH,
+                            help="模型输出路径（默认 INTENT_MODEL_PATH）")
+        parser.add_argument('--epochs', type=int, default=8)
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help="留出多少比例的问题日志用于评估")
+
+    def handle(self, *args, **options):
+        nodes = views.load_knowledge_tree_nodes()
+        if not nodes:
+            raise CommandError("无法读取 knowledge_base")
+
+        queries = []
+        if options['query_log'] and os.path.exists(options['query_log']):
+            # 只用 LLM 逐级选出的结果，分类器自己的预测不回流
+            queries = read_query_log(options['query_log'], source=views.QUERY_LOG_SOURCE)
+        self.stdout.write(f"知识树节点: {len(nodes)}，问题日志样本: {len(queries)}")
+
+        random.Random(0).shuffle(queries)
+        n_holdout = int(len(queries) * options['holdout'])
+        holdout, train_queries = queries[:n_holdout], queries[n_holdout:]
+
+        start = time.time()
+        classifier = IntentClassifier()
+        n_samples = classifier.train(nodes, train_queries, epochs=options['epochs'])
+        self.stdout.write(f"训练完成: {n_samples} 个样本，耗时 {time.time() - start:.1f}s")
+
+        if holdout:
+            self._evaluate(classifier, nodes, holdout)
+
+        classifier.save(options['output'])
+        size_kb = os.path.getsize(options['output']) / 1024
+        self.stdout.write(self.style.SUCCESS(f"模型已保存: {options['output']} ({size_kb:.0f} KB)"))
+
+    def _evaluate(self, classifier, nodes, holdout):
+        """在留出的问题上报告准确率，以及置信度阈值下的覆盖率 / 准确率"""
+        parents = {node['id']: node.get('parent_id') for node in nodes}
+        levels = {node['id']: node['level'] for node in nodes}
+
+        def l1_l2(l4_id):
+            path = {}
+            node_id = l4_id
+            while node_id in parents:
+                path[levels[node_id]] = node_id
+                node_id = parents[node_id]
+            return path.get(1), path.get(2)
+
+        l1_correct = l2_correct = confident = confident_correct = 0
+        start = time.time()
+        for query, l4_id in holdout:
+            l1_id, l2_id = l1_l2(l4_id)
+            prediction = classifier.predict(query)
+            l1_correct += prediction['l1'][0] == l1_id
+            if prediction['l2']:
+                l2_correct += prediction['l2'][0] == l2_id
+                if prediction['l2'][1] >= views.INTENT_CONFIDENCE:
+                    confident += 1
+                    confident_correct += prediction['l2'][0] == l2_id
+        per_query_us = (time.time() - start) / len(holdout) * 1e6
+
+        n = len(holdout)
+        self.stdout.write(f"留出评估 ({n} 条): L1 准确率 {l1_correct / n:.1%}，L2 准确率 {l2_correct / n:.1%}，"
+                          f"单次预测 {per_query_us:.0f}µs")
+        if confident:
+            self.stdout.write(f"置信度 ≥ {views.INTENT_CONFIDENCE}: 覆盖 {confident / n:.1%}，"
+                              f"L2 准确率 {confident_correct / confident:.1%}")
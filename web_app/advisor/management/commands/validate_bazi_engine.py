@@ -0,0 +1,67 @@
+"""
+逐字段对比原生排盘（bazi_core）与 bazi-mcp 的结果
+
+用法:
+    python manage.py validate_bazi_engine --samples 200
+    python manage.py validate_bazi_engine --samples 50 --start-year 1950 --end-year 2030 --seed 7
+
+需要本机可运行 npx bazi-mcp；所有样本在同一个 MCP 进程上流水线请求
+"""
+import collections
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from advisor.bazi_mcp_client import call_bazi_mcp_many
+from bazi_core.engine import bazi_detail
+from bazi_core.validate import diff_charts, field_group, random_births
+
+
+class Command(BaseCommand):
+    help = "在随机生辰上逐字段对比原生排盘与 bazi-mcp，输出各字段不一致的次数"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100)
+        parser.add_argument('--start-year', type=int, default=1901)
+        parser.add_argument('--end-year', type=int, default=2099)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--show', type=int, default=10, help="最多打印多少条不一致的明细")
+
+    def handle(self, *args, **options):
+        births = list(random_births(options['samples'], options['start_year'], options['end_year'], options['seed']))
+        mismatches = collections.Counter()
+        examples = []
+        native_ms = 0.0
+        compared = 0
+
+        references = call_bazi_mcp_many(
+            [{'solar_datetime': solar_datetime, 'gender': gender} for solar_datetime, gender in births],
+            timeout=max(30, len(births) * 0.5),
+        )
+        for (solar_datetime, gender), reference in zip(births, references):
+            if not reference:
+                self.stderr.write(f"MCP 排盘失败，跳过 {solar_datetime}")
+                continue
+            start = time.perf_counter()
+            native = bazi_detail(solar_datetime, gender=gender)
+            native_ms += (time.perf_counter() - start) * 1000
+            compared += 1
+            diffs = diff_charts(native, reference)
+            for path, ours, theirs in diffs:
+                mismatches[field_group(path)] += 1
+                if len(examples) < options['show']:
+                    examples.append((solar_datetime, gender, path, ours, theirs))
+
+        if not compared:
+            raise CommandError("没有可对比的样本（MCP 不可用？）")
+
+        self.stdout.write(f"对比 {compared} 个生辰，原生排盘平均 {native_ms / compared:.3f} ms")
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("所有字段一致"))
+            return
+        self.stdout.write(f"\n{'字段':<36}{'不一致次数':>10}")
+        for field, count in mismatches.most_common():
+            self.stdout.write(f"{field:<36}{count:>10}")
+        self.stdout.write("\n明细:")
+        for solar_datetime, gender, path, ours, theirs in examples:
+            self.stdout.write(f"  {solar_datetime} gender={gender} {path}: native={ours!r} mcp={theirs!r}")
@@ -0,0 +1,127 @@
+"""
+阶段指标 - 记录每个请求各阶段的耗时与路由决策，并在进程内聚合
+"""
+import collections
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+# 聚合统计（进程内）
+_STAGE_STATS = {}   # {stage: {'count': int, 'total_ms': float, 'max_ms': float}}
+_COUNTERS = {}      # {name: int}
+_GAUGES = {}        # {name: value}
+_RECENT_TRACES = collections.deque(maxlen=50)
+
+# 当前请求的 trace（流式生成器与其派生的线程共享同一个 dict）
+_current_trace = contextvars.ContextVar('advisor_trace', default=None)
+
+
+def start_trace(session_id=None):
+    """为当前请求创建 trace，后续 record_stage 会写入其中"""
+    trace = {
+        'trace_id': uuid.uuid4().hex[:12],
+        'session_id': session_id,
+        'started_at': time.time(),
+        'stages': [],
+    }
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    """返回当前请求的 trace（没有则为 None）"""
+    return _current_trace.get()
+
+
+def bind_trace(trace):
+    """在工作线程中绑定已有的 trace"""
+    _current_trace.set(trace)
+
+
+def record_stage(stage, duration_ms, **info):
+    """记录一个阶段的耗时及附加信息（如 provider / model）"""
+    entry = {'stage': stage, 'ms': round(duration_ms, 1)}
+    entry.update(info)
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace['stages'].append(entry)
+
+    with _lock:
+        stats = _STAGE_STATS.setdefault(stage, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += duration_ms
+        stats['max_ms'] = max(stats['max_ms'], duration_ms)
+    return entry
+
+
+@contextmanager
+def stage(name, **info):
+    """
+    计时上下文管理器，退出时记录阶段耗时
+
+    用法:
+        with stage('match') as info:
+            info['l4_id'] = ...
+    """
+    start = time.time()
+    try:
+        yield info
+    finally:
+        record_stage(name, (time.time() - start) * 1000, **info)
+
+
+def finish_trace(trace=None):
+    """结束 trace：计算总耗时、记录摘要（debug 级别日志）并保存到最近记录"""
+    trace = trace or _current_trace.get()
+    if trace is None:
+        return None
+    trace['total_ms'] = round((time.time() - trace['started_at']) * 1000, 1)
+    if logger.isEnabledFor(logging.DEBUG):
+        summary = ", ".join(
+            f"{s['stage']}={s['ms']}ms" + (f"({s['model']})" if s.get('model') else "")
+            for s in trace['stages']
+        )
+        logger.debug(f"trace={trace['trace_id']} total={trace['total_ms']}ms {summary}")
+    with _lock:
+        _RECENT_TRACES.append(trace)
+    return trace
+
+
+def incr(name, n=1):
+    """计数器自增"""
+    with _lock:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+
+def set_gauge(name, value):
+    """设置瞬时值指标"""
+    with _lock:
+        _GAUGES[name] = value
+
+
+def snapshot():
+    """返回所有指标的快照（用于 /advisor/metrics/）；最近的 trace 不含 session_id"""
+    with _lock:
+        stages = {
+            name: {
+                'count': s['count'],
+                'avg_ms': round(s['total_ms'] / s['count'], 1) if s['count'] else 0,
+                'max_ms': round(s['max_ms'], 1),
+            }
+            for name, s in _STAGE_STATS.items()
+        }
+        return {
+            'stages': stages,
+            'counters': dict(_COUNTERS),
+            'gauges': dict(_GAUGES),
+            'recent_traces': [{k: v for k, v in trace.items() if k != 'session_id'}
+                              for trace in list(_RECENT_TRACES)[-10:]],
+        }
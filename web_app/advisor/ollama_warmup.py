@@ -0,0 +1,142 @@
+"""
+Ollama 预热与常驻管理 - 启动时预加载模型，定期续期 keep_alive，并把模型常驻状态写入指标
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from . import metrics
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _base_url(api_url):
+    """http://host:11434/api/chat -> http://host:11434"""
+    base, sep, _ = api_url.rpartition('/api/')
+    return base if sep else api_url.rstrip('/')
+
+
+def should_warm_up(argv=None, environ=None):
+    """
+    是否在当前进程中预热
+
+    - manage.py 的其他命令（migrate、训练等）不预热
+    - runserver 自动重载时只在实际处理请求的子进程（RUN_MAIN=true）中预热
+    - gunicorn / uwsgi 等 WSGI 进程直接预热
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if environ.get('OLLAMA_WARMUP', 'true').strip('"').strip("'").lower() != 'true':
+        return False
+    if argv and os.path.basename(argv[0]) == 'manage.py':
+        if len(argv) < 2 or argv[1] != 'runserver':
+            return False
+        return environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return True
+
+
+def ollama_models(views):
+    """当前配置中会用到的 Ollama (接口地址, 模型) 列表"""
+    endpoint = views.PROVIDER_ENDPOINTS['ollama']
+    providers = {route['provider'] for route in views.LLM_TASK_ROUTES.values()} | set(views.LLM_FALLBACK_PROVIDERS)
+    if 'ollama' not in providers:
+        return []
+    models = []
+    for task in views.LLM_TASK_ROUTES:
+        route = views.get_llm_route(task, 'ollama')
+        if route['model'] not in models:
+            models.append(route['model'])
+    return [(_base_url(endpoint['api_url']), model) for model in models]
+
+
+def load_model(base_url, model, keep_alive, num_ctx, timeout=300):
+    """预加载 / 续期模型：空消息的 chat 请求只加载模型，不生成内容"""
+    start = time.time()
+    response = requests.post(
+        f"{base_url}/api/chat",
+        json={'model': model, 'messages': [], 'keep_alive': keep_alive, 'options': {'num_ctx': num_ctx}},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return (time.time() - start) * 1000
+
+
+def report_residency(base_url, models):
+    """读取 /api/ps，发布 ollama.<model>.resident / .size_vram_mb / .expires_in_s"""
+    response = requests.get(f"{base_url}/api/ps", timeout=5)
+    response.raise_for_status()
+    running = {m.get('name'): m for m in response.json().get('models', [])}
+    for model in models:
+        info = running.get(model) or running.get(f"{model}:latest")
+        metrics.set_gauge(f'ollama.{model}.resident', 1 if info else 0)
+        if info:
+            metrics.set_gauge(f'ollama.{model}.size_vram_mb', round(info.get('size_vram', 0) / 2 ** 20))
+            expires_at = info.get('expires_at')
+            if expires_at:
+                try:
+                    expires = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+                    seconds = (expires - datetime.now(timezone.utc)).total_seconds()
+                    metrics.set_gauge(f'ollama.{model}.expires_in_s', round(seconds))
+                except ValueError:
+                    pass
+
+
+def _publish_residency(targets):
+    for base_url in {base for base, _ in targets}:
+        try:
+            report_residency(base_url, [m for b, m in targets if b == base_url])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"[OLLAMA] 读取 /api/ps 失败: {e}", flush=True)
+
+
+def _warm_loop(targets, keep_alive, num_ctx, ping_seconds):
+    for base_url, model in targets:
+        try:
+            elapsed_ms = load_model(base_url, model, keep_alive, num_ctx)
+            metrics.record_stage('ollama.warmup', elapsed_ms, model=model)
+            print(f"[OLLAMA] 模型 {model} 已预加载（num_ctx={num_ctx}, keep_alive={keep_alive}），耗时 {elapsed_ms:.0f}ms", flush=True)
+        except requests.exceptions.RequestException as e:
+            metrics.incr('ollama.warmup_failed')
+            print(f"[OLLAMA] 预加载 {model} 失败: {e}", flush=True)
+    _publish_residency(targets)
+
+    # 定期续期 keep_alive（已常驻时几乎无开销），防止空闲后被卸载
+    while ping_seconds > 0:
+        time.sleep(ping_seconds)
+        for base_url, model in targets:
+            try:
+                load_model(base_url, model, keep_alive, num_ctx, timeout=60)
+            except requests.exceptions.RequestException as e:
+                metrics.incr('ollama.ping_failed')
+                print(f"[OLLAMA] 保温请求失败 {model}: {e}", flush=True)
+        _publish_residency(targets)
+
+
+def start_warmup():
+    """在后台线程中预热配置的 Ollama 模型（每个进程只启动一次）"""
+    global _started
+    if not should_warm_up():
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+
+    from . import views
+
+    targets = ollama_models(views)
+    if not targets:
+        return False
+    ping_seconds = int(os.getenv('OLLAMA_KEEPALIVE_PING_SECONDS', '240').strip('"').strip("'"))
+    threading.Thread(
+        target=_warm_loop,
+        args=(targets, views.OLLAMA_KEEP_ALIVE, views.OLLAMA_NUM_CTX, ping_seconds),
+        daemon=True,
+        name='ollama-warmup',
+    ).start()
+    return True
@@ -0,0 +1,93 @@
+"""
+查询缓存工具 - 问题文本归一化 + 带 TTL 的进程内 LRU 缓存
+"""
+import collections
+import re
+import threading
+import time
+
+from . import metrics
+
+# 英文标点 + 常见中文标点
+_PUNCT_RE = re.compile(r"[^\w\s]|_", re.UNICODE)
+
+
+# 英文停用词（BM25 词法索引分词时去掉）
+STOP_WORDS = frozenset("""
+a an the and or but if so of to in on at by for with about from into over as
+is are was were be been being am do does did have has had i me my mine we us our
+you your he him his she her they them their it its this that these those
+what which who whom how when where why should would could can will shall may might must
+please just really very some any there here then than too also
+""".split())
+
+# 路由键中去掉的词：只去冠词和语气词。疑问词、情态词、代词决定问题的意图
+# （"when should I quit" / "why should I quit"，"should he marry me" / "should I marry him" 不能共用 L4）
+ROUTING_STOP_WORDS = frozenset("""
+a an the please just really very so too also
+""".split())
+
+
+def normalize_query(text):
+    """归一化问题文本：小写、去标点、合并空白"""
+    text = _PUNCT_RE.sub(" ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def routing_key(text):
+    """路由缓存键：归一化后再去掉冠词 / 语气词（全被去掉时保留归一化结果）"""
+    normalized = normalize_query(text)
+    words = [w for w in normalized.split() if w not in ROUTING_STOP_WORDS]
+    return " ".join(words) if words else normalized
+
+
+class TTLCache:
+    """
+    线程安全的 LRU 缓存，条目超过 ttl_seconds 后失效
+
+    命中 / 未命中会记入指标计数器 cache.<name>.hit / cache.<name>.miss，
+    累计命中率发布为 gauge cache.<name>.hit_rate
+    """
+
+    def __init__(self, name, max_size=1000, ttl_seconds=3600):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._data = collections.OrderedDict()  # {key: (expires_at, value)}
+        self._hits = 0
+        self._lookups = 0
+
+    def get(self, key):
+        """返回缓存值；不存在或已过期返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.time():
+                del self._data[key]
+                item = None
+            self._lookups += 1
+            if item is not None:
+                self._hits += 1
+                self._data.move_to_end(key)
+            hit_rate = self._hits / self._lookups
+        metrics.set_gauge(f'cache.{self.name}.hit_rate', round(hit_rate, 3))
+        if item is None:
+            metrics.incr(f'cache.{self.name}.miss')
+            return None
+        metrics.incr(f'cache.{self.name}.hit')
+        return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
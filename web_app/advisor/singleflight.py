@@ -0,0 +1,71 @@
+"""
+Single-flight 请求合并 - 相同 key 的并发调用只执行一次，结果分发给所有等待者
+"""
+import threading
+
+from . import metrics
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    按调用点命名的 single-flight 组
+
+    指标:
+        singleflight.<name>.calls  实际执行次数
+        singleflight.<name>.dedup  被合并（未重复执行）的次数
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)；若相同 key 的调用正在进行，则等待并复用其结果
+        （异常同样会分发给所有等待者）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            metrics.incr(f'singleflight.{self.name}.dedup')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f'singleflight.{self.name}.calls')
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                print(f"[SINGLEFLIGHT] {self.name}: 1 次执行分发给 {call.waiters} 个等待者", flush=True)
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,134 @@
+"""
+可续传的 SSE 流 - 回答在后台线程生成并写入有界环形缓冲区（每个事件带 ID），
+连接断开后客户端带 Last-Event-ID 重连即可从缓冲区续传或接上仍在进行的生成
+"""
+import collections
+import threading
+import time
+import uuid
+
+from . import metrics
+
+
+class ResumeUnavailable(Exception):
+    """流不存在 / 已过期，或需要的事件已被环形缓冲区淘汰"""
+
+
+class StreamBuffer:
+    """
+    单个回答流的事件缓冲区
+
+    参数:
+        stream_id (str): 流 ID（事件 ID 形如 "<stream_id>:<seq>"）
+        max_events (int): 最多保留的事件数，超出后淘汰最早的事件
+    """
+
+    def __init__(self, stream_id, session_id, max_events):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self._events = collections.deque(maxlen=max_events)  # [(seq, chunk)]
+        self._cond = threading.Condition()
+        self._next_seq = 1
+        self.finished = False
+        self.finished_at = None
+
+    def append(self, chunk):
+        with self._cond:
+            self._events.append((self._next_seq, chunk))
+            self._next_seq += 1
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.finished = True
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def read(self, after_seq=0, idle_timeout=60):
+        """
+        依次产出 seq > after_seq 的 (seq, chunk)，生成未结束时等待新事件
+
+        异常:
+            ResumeUnavailable: after_seq 之后的事件已被淘汰
+        """
+        seq = after_seq
+        while True:
+            with self._cond:
+                if self._events and self._events[0][0] > seq + 1:
+                    raise ResumeUnavailable(f"events after {seq} were evicted from stream {self.stream_id}")
+                pending = [event for event in self._events if event[0] > seq]
+                if not pending:
+                    if self.finished:
+                        return
+                    if not self._cond.wait(idle_timeout):
+                        return
+                    continue
+            for event in pending:
+                seq = event[0]
+                yield event
+
+
+class StreamRegistry:
+    """
+    进程内的流注册表：启动后台生成、按 ID 查找、清理过期的流
+
+    参数:
+        max_events (int): 每个流的环形缓冲区大小
+        ttl_seconds (float): 流结束后保留多久以便续传
+    """
+
+    def __init__(self, max_events=2000, ttl_seconds=300):
+        self.max_events = max_events
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def start(self, session_id, generator):
+        """在后台线程中消费 generator（产出 SSE 文本块），返回 StreamBuffer"""
+        self._cleanup()
+        buffer = StreamBuffer(uuid.uuid4().hex[:16], session_id, self.max_events)
+        with self._lock:
+            self._streams[buffer.stream_id] = buffer
+            metrics.set_gauge('streams.active', sum(1 for b in self._streams.values() if not b.finished))
+
+        def run():
+            try:
+                for chunk in generator:
+                    buffer.append(chunk)
+            except Exception as e:
+                print(f"[STREAM] 后台生成出错: {e}", flush=True)
+            finally:
+                buffer.finish()
+
+        threading.Thread(target=run, daemon=True, name=f'stream-{buffer.stream_id}').start()
+        return buffer
+
+    def get(self, stream_id, session_id=None):
+        """查找流；不存在、已过期或会话不符时抛出 ResumeUnavailable"""
+        self._cleanup()
+        with self._lock:
+            buffer = self._streams.get(stream_id)
+        if buffer is None or (session_id and buffer.session_id != session_id):
+            raise ResumeUnavailable(f"stream {stream_id} not found")
+        return buffer
+
+    def _cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, b in self._streams.items()
+                       if b.finished and now - b.finished_at > self.ttl_seconds]
+            for sid in expired:
+                del self._streams[sid]
+
+
+def format_event(stream_id, seq, chunk):
+    """给 SSE 文本块加上事件 ID 行"""
+    return f"id: {stream_id}:{seq}\n{chunk}"
+
+
+def parse_event_id(value):
+    """解析 Last-Event-ID："<stream_id>:<seq>" -> (stream_id, seq)，无效时返回 None"""
+    stream_id, _, seq = (value or '').strip().rpartition(':')
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
@@ -1,3 +1,668 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from . import ollama_warmup, views
+from .admission import (PRIORITY_ANSWER, PRIORITY_BACKGROUND, AdmissionController, AdmissionRejected,
+                        DEFAULT_HOLD_SECONDS)
+from .intent_classifier import IntentClassifier
+from .lexical_index import KnowledgeTreeIndex
+from .llm_router import KIND_COMPLETION, KIND_TTFT, LLMUnavailable, ProviderRouter, hedged_stream
+from .singleflight import SingleFlight
+from .stream_buffer import ResumeUnavailable, StreamRegistry, format_event, parse_event_id
+
+
+# 小型知识树：L1 > L2 > L3 > L4，只有部分 L4 有预生成内容
+TREE_NODES = [
+    {'id': 1, 'parent_id': None, 'level': 1, 'name': 'Career', 'description': 'work, jobs and professional growth'},
+    {'id': 2, 'parent_id': None, 'level': 1, 'name': 'Love', 'description': 'romance, dating and relationships'},
+    {'id': 10, 'parent_id': 1, 'level': 2, 'name': 'Job change', 'description': 'leaving or switching jobs'},
+    {'id': 11, 'parent_id': 1, 'level': 2, 'name': 'Workplace conflict', 'description': 'tension with a boss or coworkers'},
+    {'id': 20, 'parent_id': 2, 'level': 2, 'name': 'Dating', 'description': 'meeting someone new and early dates'},
+    {'id': 100, 'parent_id': 10, 'level': 3, 'name': 'Resignation', 'description': 'deciding whether to quit'},
+    {'id': 110, 'parent_id': 11, 'level': 3, 'name': 'Difficult boss', 'description': 'a manager who criticizes you'},
+    {'id': 200, 'parent_id': 20, 'level': 3, 'name': 'First date', 'description': 'planning a first date'},
+    {'id': 1000, 'parent_id': 100, 'level': 4, 'name': 'Should I quit my job', 'description': 'timing of quitting',
+     'has_content': True},
+    {'id': 1001, 'parent_id': 100, 'level': 4, 'name': 'Negotiate a raise before leaving',
+     'description': 'salary negotiation', 'has_content': True},
+    {'id': 1100, 'parent_id': 110, 'level': 4, 'name': 'Handle criticism from my boss',
+     'description': 'responding to a critical manager', 'has_content': True},
+    {'id': 2000, 'parent_id': 200, 'level': 4, 'name': 'Where to go on a first date',
+     'description': 'date ideas', 'has_content': False},
+]
+
+
+def wait_until(predicate, timeout=2.0):
+    """轮询直到条件成立（测试线程间的先后顺序）"""
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight('test')
+        release = threading.Event()
+        calls = []
+
+        def fn(value):
+            calls.append(value)
+            release.wait(2)
+            return value * 2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', fn, 21))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight._calls.get('k') is not None and flight._calls['k'].waiters == 4)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_is_shared_and_key_is_released(self):
+        flight = SingleFlight('test')
+        release = threading.Event()
+
+        def fail():
+            release.wait(2)
+            raise RuntimeError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('k', fail)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight._calls.get('k') is not None and flight._calls['k'].waiters == 2)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(errors, ["boom"] * 3)
+        self.assertEqual(flight.do('k', lambda: 'fresh'), 'fresh')
+
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight('test')
+        self.assertEqual([flight.do(key, str.upper, key) for key in ('a', 'b')], ['A', 'B'])
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def hold_slot(self, controller, **kwargs):
+        """在后台线程占住一个名额，返回 (已占住, 释放) 两个 Event"""
+        acquired, release = threading.Event(), threading.Event()
+
+        def run():
+            with controller.slot(**kwargs):
+                acquired.set()
+                release.wait(2)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.assertTrue(acquired.wait(2))
+        return release
+
+    def enqueue(self, controller, order, label, **kwargs):
+        """排队一个请求（等它进入队列后返回），拿到名额时把 label 记入 order"""
+        depth = len(controller._waiting)
+
+        def run():
+            with controller.slot(**kwargs):
+                order.append(label)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        wait_until(lambda: len(controller._waiting) == depth + 1)
+        return thread
+
+    def test_answers_go_before_background(self):
+        controller = AdmissionController('test', max_concurrency=1)
+        release = self.hold_slot(controller, session_id='holder')
+        order = []
+        threads = [
+            self.enqueue(controller, order, 'background', session_id='a', priority=PRIORITY_BACKGROUND),
+            self.enqueue(controller, order, 'answer', session_id='b', priority=PRIORITY_ANSWER),
+        ]
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, ['answer', 'background'])
+
+    def test_sessions_are_interleaved(self):
+        controller = AdmissionController('test', max_concurrency=1)
+        release = self.hold_slot(controller, session_id='holder')
+        order = []
+        threads = [self.enqueue(controller, order, f's1-{i}', session_id='s1') for i in range(3)]
+        threads.append(self.enqueue(controller, order, 's2-0', session_id='s2'))
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, ['s1-0', 's2-0', 's1-1', 's1-2'])
+
+    def test_concurrency_limit(self):
+        controller = AdmissionController('test', max_concurrency=2)
+        lock = threading.Lock()
+        active = peak = 0
+
+        def run():
+            nonlocal active, peak
+            with controller.slot():
+                with lock:
+                    active += 1
+                    peak = max(peak, active)
+                time.sleep(0.01)
+                with lock:
+                    active -= 1
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(peak, 2)
+        self.assertEqual(controller._active, 0)
+
+    def test_busy_after_and_timeout_reject(self):
+        controller = AdmissionController('test', max_concurrency=1)
+        self.assertEqual(controller.estimate_wait(), 0.0)
+        release = self.hold_slot(controller)
+        self.assertAlmostEqual(controller.estimate_wait(), DEFAULT_HOLD_SECONDS)
+        with self.assertRaises(AdmissionRejected):
+            with controller.slot(busy_after=DEFAULT_HOLD_SECONDS / 2):
+                pass
+        with self.assertRaises(AdmissionRejected):
+            with controller.slot(timeout=0.05):
+                pass
+        self.assertEqual(controller._waiting, [])
+        release.set()
+
+    def test_hold_time_is_tracked_per_priority(self):
+        controller = AdmissionController('test', max_concurrency=1, alpha=1.0)
+        with controller.slot(priority=PRIORITY_ANSWER):
+            pass
+        answer_hold = controller._hold(PRIORITY_ANSWER)
+        self.assertLess(answer_hold, 0.1)
+        self.assertEqual(controller._hold(PRIORITY_BACKGROUND), DEFAULT_HOLD_SECONDS)
+
+        # 在途的是回答：按回答的占用时长估算，不受后台任务默认值影响
+        release = self.hold_slot(controller, priority=PRIORITY_ANSWER)
+        self.assertAlmostEqual(controller.estimate_wait(PRIORITY_BACKGROUND), answer_hold)
+        # 排在前面的后台请求按后台的占用时长计
+        order = []
+        thread = self.enqueue(controller, order, 'background', priority=PRIORITY_BACKGROUND)
+        self.assertAlmostEqual(controller.estimate_wait(PRIORITY_BACKGROUND), DEFAULT_HOLD_SECONDS + answer_hold)
+        self.assertAlmostEqual(controller.estimate_wait(PRIORITY_ANSWER), answer_hold)
+        release.set()
+        thread.join(2)
+
+
+class HedgedStreamTests(SimpleTestCase):
+    """hedged_stream 使用假的 provider：open_stream(route, cancel) 按 route['provider'] 查表"""
+
+    ROUTES = [{'provider': 'primary'}, {'provider': 'fallback'}]
+
+    def run_stream(self, providers, routes=None, router=None, hedge_after_ms=0):
+        opened = []
+
+        def open_stream(route, cancel):
+            opened.append(route['provider'])
+            return providers[route['provider']](cancel)
+
+        router = router or ProviderRouter()
+        chunks, info = [], None
+        for route, content, info in hedged_stream(routes or self.ROUTES, open_stream, router, hedge_after_ms):
+            chunks.append((route['provider'], content))
+        return chunks, info, opened, router
+
+    @staticmethod
+    def answer(*parts):
+        def stream(cancel):
+            yield from parts
+        return stream
+
+    @staticmethod
+    def stall(cancelled):
+        """首 token 之前一直等待，直到被取消"""
+        def stream(cancel):
+            cancel.wait(2)
+            cancelled.set()
+            return
+            yield
+        return stream
+
+    @staticmethod
+    def fail_after(*parts):
+        def stream(cancel):
+            yield from parts
+            raise RuntimeError("upstream 502")
+        return stream
+
+    def test_hedge_wins_when_primary_stalls(self):
+        cancelled = threading.Event()
+        chunks, info, opened, router = self.run_stream(
+            {'primary': self.stall(cancelled), 'fallback': self.answer('a', 'b')}, hedge_after_ms=50)
+        self.assertEqual(chunks, [('fallback', 'a'), ('fallback', 'b')])
+        self.assertEqual(opened, ['primary', 'fallback'])
+        self.assertTrue(info['hedged'])
+        self.assertGreaterEqual(info['ttft_ms'], 50)
+        self.assertTrue(cancelled.wait(2))
+        # 被取消的一方不算失败
+        self.assertEqual(router.snapshot()['fallback']['calls'], 1)
+        self.assertEqual(router.snapshot().get('primary', {}).get('errors', 0), 0)
+
+    def test_no_hedge_when_primary_answers_in_time(self):
+        chunks, info, opened, _ = self.run_stream(
+            {'primary': self.answer('a'), 'fallback': self.answer('b')}, hedge_after_ms=2000)
+        self.assertEqual(chunks, [('primary', 'a')])
+        self.assertEqual(opened, ['primary'])
+        self.assertFalse(info['hedged'])
+
+    def test_fails_over_before_first_token(self):
+        chunks, info, opened, router = self.run_stream(
+            {'primary': self.fail_after(), 'fallback': self.answer('a')})
+        self.assertEqual(chunks, [('fallback', 'a')])
+        self.assertEqual(info['attempts'], 2)
+        self.assertEqual(router.snapshot()['primary']['errors'], 1)
+
+    def test_empty_stream_counts_as_failure(self):
+        chunks, _, opened, router = self.run_stream({'primary': self.answer(), 'fallback': self.answer('a')})
+        self.assertEqual(chunks, [('fallback', 'a')])
+        self.assertEqual(router.snapshot()['primary']['errors'], 1)
+
+    def test_error_after_first_token_is_not_retried(self):
+        chunks = []
+        opened = []
+
+        def open_stream(route, cancel):
+            opened.append(route['provider'])
+            return {'primary': self.fail_after('a'), 'fallback': self.answer('b')}[route['provider']](cancel)
+
+        with self.assertRaisesMessage(RuntimeError, "upstream 502"):
+            for route, content, _ in hedged_stream(self.ROUTES, open_stream, ProviderRouter()):
+                chunks.append((route['provider'], content))
+        self.assertEqual(chunks, [('primary', 'a')])
+        self.assertEqual(opened, ['primary'])
+
+    def test_all_providers_fail(self):
+        with self.assertRaises(LLMUnavailable):
+            self.run_stream({'primary': self.fail_after(), 'fallback': self.fail_after()})
+
+    def test_provider_in_cooldown_is_skipped(self):
+        # 不计错误率惩罚，只看冷却本身
+        router = ProviderRouter(cooldown_failures=2, cooldown_seconds=0.2, error_penalty_ms=0)
+        router.record_error('primary')
+        self.assertEqual(router.rank(self.ROUTES), self.ROUTES)
+        router.record_error('primary')
+        self.assertIsNone(router.score('primary'))
+        ranked = router.rank(self.ROUTES)
+        self.assertEqual([route['provider'] for route in ranked], ['fallback', 'primary'])
+
+        chunks, _, opened, _ = self.run_stream(
+            {'primary': self.answer('p'), 'fallback': self.answer('f')}, routes=ranked, router=router)
+        self.assertEqual(chunks, [('fallback', 'f')])
+        self.assertEqual(opened, ['fallback'])
+
+        # 冷却结束后重新参与排序
+        time.sleep(0.25)
+        self.assertIsNotNone(router.score('primary'))
+
+    def test_latency_is_ranked_per_kind(self):
+        router = ProviderRouter(alpha=1.0)
+        router.record_success('primary', 100, KIND_TTFT)
+        router.record_success('primary', 5000, KIND_COMPLETION)
+        router.record_success('fallback', 400, KIND_TTFT)
+        router.record_success('fallback', 800, KIND_COMPLETION)
+        self.assertEqual([r['provider'] for r in router.rank(self.ROUTES, KIND_TTFT)], ['primary', 'fallback'])
+        self.assertEqual([r['provider'] for r in router.rank(self.ROUTES, KIND_COMPLETION)], ['fallback', 'primary'])
+
+
+class StreamRegistryTests(SimpleTestCase):
+    def finished(self, registry, chunks):
+        buffer = registry.start('session', iter(chunks))
+        wait_until(lambda: buffer.finished)
+        return buffer
+
+    def test_read_and_resume(self):
+        registry = StreamRegistry(max_events=10)
+        buffer = self.finished(registry, ['a', 'b', 'c', 'd'])
+        self.assertEqual(list(buffer.read()), [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')])
+        self.assertEqual(list(registry.get(buffer.stream_id, 'session').read(after_seq=2)), [(3, 'c'), (4, 'd')])
+
+    def test_follows_generation_in_progress(self):
+        registry = StreamRegistry()
+        release = threading.Event()
+
+        def generate():
+            yield 'first'
+            release.wait(2)
+            yield 'second'
+
+        buffer = registry.start('session', generate())
+        events = buffer.read(idle_timeout=2)
+        self.assertEqual(next(events), (1, 'first'))
+        release.set()
+        self.assertEqual(list(events), [(2, 'second')])
+
+    def test_evicted_events_cannot_be_resumed(self):
+        registry = StreamRegistry(max_events=3)
+        buffer = self.finished(registry, ['a', 'b', 'c', 'd', 'e'])
+        with self.assertRaises(ResumeUnavailable):
+            list(buffer.read(after_seq=0))
+        self.assertEqual(list(buffer.read(after_seq=2)), [(3, 'c'), (4, 'd'), (5, 'e')])
+
+    def test_generator_error_finishes_stream(self):
+        def generate():
+            yield 'a'
+            raise RuntimeError("boom")
+
+        buffer = self.finished(StreamRegistry(), generate())
+        self.assertEqual(list(buffer.read()), [(1, 'a')])
+
+    def test_lookup_checks_session_and_expiry(self):
+        registry = StreamRegistry(ttl_seconds=0.01)
+        buffer = self.finished(registry, ['a'])
+        with self.assertRaises(ResumeUnavailable):
+            registry.get(buffer.stream_id, 'other-session')
+        time.sleep(0.02)
+        with self.assertRaises(ResumeUnavailable):
+            registry.get(buffer.stream_id)
+
+    def test_event_ids(self):
+        self.assertEqual(format_event('abc', 3, 'data: x\n\n'), 'id: abc:3\ndata: x\n\n')
+        self.assertEqual(parse_event_id('abc:3'), ('abc', 3))
+        self.assertIsNone(parse_event_id('abc'))
+        self.assertIsNone(parse_event_id(None))
+
+
+class KnowledgeTreeVersionTests(SimpleTestCase):
+    def setUp(self):
+        self.counts = (120, 120, 80)
+        self.checksums = [('wuxing.knowledge_base', 1111), ('wuxing.l4_content', 2222)]
+        cursor = mock.MagicMock()
+        cursor.fetchone.side_effect = lambda: self.counts
+        cursor.fetchall.side_effect = lambda: self.checksums
+        connection = mock.MagicMock()
+        connection.cursor.return_value = cursor
+        patches = [
+            mock.patch.object(views.mysql.connector, 'connect', return_value=connection),
+            mock.patch.object(views, 'ROUTING_VERSION_CHECK_SECONDS', 0),
+            mock.patch.dict(views.KNOWLEDGE_TREE_VERSION, {'version': None, 'checked_at': 0.0}),
+            mock.patch.dict(views.TREE_INDEX, {'index': None, 'version': None}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        views.ROUTING_CACHE.clear()
+        self.addCleanup(views.ROUTING_CACHE.clear)
+        views.check_knowledge_tree_version()
+        views.ROUTING_CACHE.set('how do i ask for a raise', 42)
+
+    def test_in_place_edit_changes_version(self):
+        # 行数与最大 ID 不变，只有内容被修改
+        self.checksums = [('wuxing.knowledge_base', 1111), ('wuxing.l4_content', 3333)]
+        views.check_knowledge_tree_version()
+        self.assertIsNone(views.ROUTING_CACHE.get('how do i ask for a raise'))
+        self.assertEqual(views.KNOWLEDGE_TREE_VERSION['version'], (120, 120, 80, 1111, 3333))
+
+    def test_unchanged_tree_keeps_cache(self):
+        views.check_knowledge_tree_version()
+        self.assertEqual(views.ROUTING_CACHE.get('how do i ask for a raise'), 42)
+
+    def test_invalidate_drops_cache_and_index(self):
+        views.TREE_INDEX.update(index=object(), version=views.KNOWLEDGE_TREE_VERSION['version'])
+        views.KNOWLEDGE_TREE_VERSION['checked_at'] = time.time()
+        views.invalidate_knowledge_tree()
+        self.assertIsNone(views.ROUTING_CACHE.get('how do i ask for a raise'))
+        self.assertIsNone(views.TREE_INDEX['version'])
+        self.assertEqual(views.KNOWLEDGE_TREE_VERSION['checked_at'], 0.0)
+
+
+class AskAdvisorAdmissionTests(SimpleTestCase):
+    def setUp(self):
+        patch = mock.patch.object(views.LLM_ADMISSION, 'estimate_wait', return_value=views.LLM_QUEUE_BUSY_SECONDS + 5)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def ask(self, query):
+        request = RequestFactory().post('/ask/', {'query': query, 'session_id': 's1'})
+        response = views.ask_advisor(request)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_empty_query_is_validated_before_admission(self):
+        response, body = self.ask('  ')
+        self.assertIn('Please enter a question', body)
+        self.assertFalse(response.has_header('Retry-After'))
+
+    def test_busy_when_queue_is_long(self):
+        response, body = self.ask('Should I change jobs?')
+        self.assertIn('"busy": true', body)
+        self.assertEqual(response['Retry-After'], str(int(views.LLM_QUEUE_BUSY_SECONDS + 5) + 1))
+
+
+class KnowledgeTreeIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = KnowledgeTreeIndex(TREE_NODES, parent_weight=0.5)
+
+    def test_path_and_content(self):
+        self.assertEqual(self.index.path(1100), [1, 11, 110, 1100])
+        self.assertEqual(self.index.content_l4, {1000, 1001, 1100})
+        self.assertEqual(sorted(self.index.descendants(1, level=4)), [1000, 1001, 1100])
+
+    def test_path_scores_match_path_score(self):
+        for query in ('should I quit my job', 'my boss criticizes me at work', 'first date ideas', 'weather'):
+            scores = self.index.scores(query)
+            path_scores = self.index.path_scores(scores)
+            for node_id in self.index.nodes:
+                expected = self.index.path_score(node_id, scores)
+                self.assertAlmostEqual(path_scores.get(node_id, 0.0), expected, places=9)
+            # 没有词项得分的子树不计算
+            if not scores:
+                self.assertEqual(path_scores, {})
+
+    def test_parent_score_propagates(self):
+        scores = self.index.scores('quit')
+        path_scores = self.index.path_scores(scores)
+        # 1001 自身没有 quit，但路径得分来自 L3 Resignation（deciding whether to quit）
+        self.assertNotIn(1001, scores)
+        self.assertAlmostEqual(path_scores[1001], 0.5 * path_scores[100])
+        self.assertGreater(path_scores[1000], path_scores[1001])
+
+    def test_shortlist(self):
+        scores = self.index.scores('my boss criticizes me')
+        self.assertEqual(self.index.shortlist([1000, 1001, 1100, 2000], scores, top_k=1), [1100])
+        self.assertEqual(self.index.shortlist([1, 2], self.index.scores('romance'), top_k=1), [2])
+
+    def test_shortlist_without_overlap_returns_all(self):
+        candidates = [1000, 1001, 2000]
+        self.assertEqual(self.index.shortlist(candidates, self.index.scores('weather tomorrow'), top_k=1), candidates)
+        self.assertEqual(self.index.shortlist([], {}, top_k=3), [])
+
+    def test_best_at_level(self):
+        scores = self.index.scores('handle criticism from my boss')
+        self.assertEqual(self.index.best_at_level(4, scores, min_score=0.1, margin=1.5)[0], 1100)
+        self.assertIsNone(self.index.best_at_level(4, scores, min_score=1000, margin=1.5))
+        self.assertIsNone(self.index.best_at_level(4, self.index.scores('first date'), min_score=0.1, margin=1.5,
+                                                   require_content=True))
+
+
+class IntentClassifierTests(SimpleTestCase):
+    QUERIES = ['should I quit my job this year', 'my boss keeps criticizing me', 'ideas for a first date',
+               'is it time to resign', 'dating someone new', 'salary raise']
+
+    def test_save_load_keeps_predictions(self):
+        classifier = IntentClassifier(n_features=2 ** 12)
+        classifier.train(TREE_NODES, queries=[('time to hand in my notice', 1000)], epochs=20)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'intent.json')
+            classifier.save(path)
+            loaded = IntentClassifier.load(path)
+        self.assertEqual(loaded.n_features, classifier.n_features)
+        for query in self.QUERIES:
+            before, after = classifier.predict(query), loaded.predict(query)
+            self.assertEqual(after['l1'][0], before['l1'][0])
+            self.assertAlmostEqual(after['l1'][1], before['l1'][1], places=2)
+            self.assertEqual(after['l2'] and after['l2'][0], before['l2'] and before['l2'][0])
+        self.assertEqual(loaded.predict('ideas for a first date')['l1'][0], 2)
+        self.assertEqual(loaded.predict('my boss keeps criticizing me')['l2'][0], 11)
+
+    def test_load_rejects_other_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'intent.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{"format_version": 999}')
+            with self.assertRaises(ValueError):
+                IntentClassifier.load(path)
+
+
+class PathMatchTests(SimpleTestCase):
+    def setUp(self):
+        self.select = mock.MagicMock()
+        self.cascade = mock.MagicMock(return_value=1000)
+        patches = [
+            mock.patch.object(views, 'get_knowledge_tree_index', return_value=KnowledgeTreeIndex(TREE_NODES)),
+            mock.patch.object(views, 'INTENT_CLASSIFIER', None),
+            mock.patch.object(views, 'PATH_CANDIDATES', 2),
+            mock.patch.object(views, 'call_llm_for_selection', self.select),
+            mock.patch.object(views, 'find_best_l4_match_cascade', self.cascade),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_prompt_lists_full_paths_and_returns_selection(self):
+        self.select.return_value = 1001
+        self.assertEqual(views.find_best_l4_match('should I quit and ask for a raise', mode='path'), 1001)
+        prompt = self.select.call_args[0][0]
+        self.assertIn('ID 1000: Career > Job change > Resignation > Should I quit my job', prompt)
+        self.assertIn('ID 1001: Career > Job change > Resignation > Negotiate a raise before leaving', prompt)
+        # 只列出有预生成内容、且在短名单中的 L4
+        self.assertNotIn('ID 2000', prompt)
+        self.assertNotIn('ID 1100', prompt)
+
+    def test_selection_outside_shortlist_is_rejected(self):
+        self.select.return_value = 1100
+        self.assertIsNone(views.find_best_l4_match('should I quit and ask for a raise', mode='path'))
+
+    def test_single_candidate_skips_llm(self):
+        self.assertEqual(views.find_best_l4_match('criticism', mode='path'), 1100)
+        self.select.assert_not_called()
+
+    def test_no_lexical_signal_falls_back_to_cascade(self):
+        self.assertEqual(views.find_best_l4_match('weather tomorrow', mode='path'), 1000)
+        self.cascade.assert_called_once_with('weather tomorrow', log_query=False)
+        self.select.assert_not_called()
+
+    def test_intent_classifier_prunes_to_subtree(self):
+        classifier = mock.MagicMock()
+        classifier.predict.return_value = {'l1': (1, 0.99), 'l2': (11, 0.95)}
+        with mock.patch.object(views, 'INTENT_CLASSIFIER', classifier):
+            # 词法上 1000 / 1001 更相关，但分类器把候选限制在 Workplace conflict 子树（只剩 1100）
+            self.assertEqual(views.find_best_l4_match('should I quit and ask for a raise', mode='path'), 1100)
+        self.select.assert_not_called()
+        self.cascade.assert_not_called()
+
+    def test_low_confidence_intent_does_not_prune(self):
+        classifier = mock.MagicMock()
+        classifier.predict.return_value = {'l1': (2, 0.4), 'l2': (20, 0.3)}
+        self.select.return_value = 1000
+        with mock.patch.object(views, 'INTENT_CLASSIFIER', classifier):
+            self.assertEqual(views.find_best_l4_match('should I quit and ask for a raise', mode='path'), 1000)
+
+
+class SelectionReplyTests(SimpleTestCase):
+    def selected(self, reply):
+        with mock.patch.object(views, 'call_llm_completion', return_value=reply):
+            return views.call_llm_for_selection(f'prompt for {reply!r}')
+
+    def test_reply_parsing(self):
+        self.assertEqual(self.selected('1001'), 1001)
+        self.assertEqual(self.selected('The best path is ID 1001.'), 1001)
+        self.assertIsNone(self.selected('none of these fit'))
+        self.assertIsNone(self.selected(None))
+
+
+class OllamaWarmupTests(SimpleTestCase):
+    def test_should_warm_up(self):
+        on = {'OLLAMA_WARMUP': 'true'}
+        # runserver 自动重载的父进程只负责监视文件，不预热；子进程（RUN_MAIN=true）预热
+        self.assertFalse(ollama_warmup.should_warm_up(['manage.py', 'runserver'], on))
+        self.assertTrue(ollama_warmup.should_warm_up(['manage.py', 'runserver'], {**on, 'RUN_MAIN': 'true'}))
+        self.assertTrue(ollama_warmup.should_warm_up(['/srv/web_app/manage.py', 'runserver', '--noreload'], on))
+        for command in (['manage.py'], ['manage.py', 'migrate'], ['manage.py', 'test', 'advisor'],
+                        ['manage.py', 'train_intent_classifier'], ['manage.py', 'shell']):
+            self.assertFalse(ollama_warmup.should_warm_up(command, {**on, 'RUN_MAIN': 'true'}), command)
+        self.assertTrue(ollama_warmup.should_warm_up(['/usr/bin/gunicorn', 'wu_xing_advisor.wsgi'], on))
+        self.assertTrue(ollama_warmup.should_warm_up(['gunicorn'], {}))
+        self.assertFalse(ollama_warmup.should_warm_up(['gunicorn'], {'OLLAMA_WARMUP': '"false"'}))
+
+    def test_start_warmup_skips_management_commands(self):
+        with mock.patch.object(ollama_warmup, '_started', False), \
+                mock.patch.object(ollama_warmup.sys, 'argv', ['manage.py', 'migrate']), \
+                mock.patch.dict(ollama_warmup.os.environ, {'OLLAMA_WARMUP': 'true', 'RUN_MAIN': 'true'}), \
+                mock.patch.object(ollama_warmup.threading, 'Thread') as thread:
+            self.assertFalse(ollama_warmup.start_warmup())
+            self.assertFalse(ollama_warmup._started)
+        thread.assert_not_called()
+
+    def test_start_warmup_once_per_process(self):
+        targets = [('http://ollama:11434', 'qwen2.5:7b')]
+        with mock.patch.object(ollama_warmup, '_started', False), \
+                mock.patch.object(ollama_warmup, 'should_warm_up', return_value=True), \
+                mock.patch.object(ollama_warmup, 'ollama_models', return_value=targets), \
+                mock.patch.object(ollama_warmup.threading, 'Thread') as thread:
+            self.assertTrue(ollama_warmup.start_warmup())
+            self.assertFalse(ollama_warmup.start_warmup())
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs['args'][0], targets)
+        self.assertTrue(thread.call_args.kwargs['daemon'])
+
+    def test_base_url(self):
+        self.assertEqual(ollama_warmup._base_url('http://ollama:11434/api/chat'), 'http://ollama:11434')
+        self.assertEqual(ollama_warmup._base_url('http://ollama:11434/'), 'http://ollama:11434')
+
+    def test_load_model_posts_empty_chat(self):
+        with mock.patch.object(ollama_warmup.requests, 'post') as post:
+            elapsed_ms = ollama_warmup.load_model('http://ollama:11434', 'qwen2.5:7b', '30m', 4096, timeout=60)
+        self.assertGreaterEqual(elapsed_ms, 0)
+        post.assert_called_once_with(
+            'http://ollama:11434/api/chat',
+            json={'model': 'qwen2.5:7b', 'messages': [], 'keep_alive': '30m', 'options': {'num_ctx': 4096}},
+            timeout=60,
+        )
+        post.return_value.raise_for_status.assert_called_once()
+
+    def test_warm_loop_counts_failures(self):
+        error = ollama_warmup.requests.exceptions.ConnectionError('refused')
+        with mock.patch.object(ollama_warmup.requests, 'post', side_effect=error), \
+                mock.patch.object(ollama_warmup.requests, 'get', side_effect=error), \
+                mock.patch.object(ollama_warmup.metrics, 'incr') as incr:
+            ollama_warmup._warm_loop([('http://ollama:11434', 'qwen2.5:7b')], '30m', 4096, ping_seconds=0)
+        incr.assert_called_once_with('ollama.warmup_failed')
+
+    def test_report_residency(self):
+        response = mock.MagicMock()
+        response.json.return_value = {'models': [{'name': 'qwen2.5:7b', 'size_vram': 5 * 2 ** 30,
+                                                  'expires_at': '2999-01-01T00:00:00Z'}]}
+        with mock.patch.object(ollama_warmup.requests, 'get', return_value=response) as get, \
+                mock.patch.object(ollama_warmup.metrics, 'set_gauge') as set_gauge:
+            ollama_warmup.report_residency('http://ollama:11434', ['qwen2.5:7b', 'llama3'])
+        get.assert_called_once_with('http://ollama:11434/api/ps', timeout=5)
+        gauges = {call.args[0]: call.args[1] for call in set_gauge.call_args_list}
+        self.assertEqual(gauges['ollama.qwen2.5:7b.resident'], 1)
+        self.assertEqual(gauges['ollama.qwen2.5:7b.size_vram_mb'], 5120)
+        self.assertGreater(gauges['ollama.qwen2.5:7b.expires_in_s'], 0)
+        self.assertEqual(gauges['ollama.llama3.resident'], 0)
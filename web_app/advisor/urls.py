@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('ask/', views.ask_advisor, name='ask_advisor'),
+    path('prefetch_chart/', views.prefetch_chart_view, name='prefetch_chart'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('routing/invalidate/', views.invalidate_routing_view, name='invalidate_routing'),
 ]
@@ -1,12 +1,28 @@
 import os
 import json
 import time
+import hashlib
+import heapq
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import mysql.connector
 import requests
+from django.conf import settings
 from django.shortcuts import render
-from django.http import StreamingHttpResponse
+from django.http import StreamingHttpResponse, JsonResponse
 from dotenv import load_dotenv
 
+from . import metrics
+from .query_cache import TTLCache, normalize_query, routing_key
+from .singleflight import SingleFlight
+from .admission import (AdmissionController, AdmissionRejected,
+                        PRIORITY_ANSWER, PRIORITY_SELECTION, PRIORITY_BACKGROUND)
+from .llm_router import KIND_COMPLETION, KIND_TTFT, ProviderRouter, hedged_stream
+from .stream_buffer import StreamRegistry, ResumeUnavailable, format_event, parse_event_id
+from .lexical_index import KnowledgeTreeIndex
+from .intent_classifier import IntentClassifier
+
 load_dotenv()
 
 # Configuration
@@ -44,9 +60,287 @@ else:
     LLM_API_URL = SILICON_FLOW_API_URL
     LLM_API_KEY = SILICON_FLOW_API_KEY
 
+# ========== 按任务分层的模型路由 ==========
+# selection: L1-L4 逐级选择（只返回一个数字）；header: 决策头部 JSON；answer: 最终流式回答
+# 选择/分类类任务走小模型（或本地 Ollama），最终回答保持大模型
+PROVIDER_ENDPOINTS = {
+    'silicon_flow': {
+        'api_url': SILICON_FLOW_API_URL,
+        'api_key': SILICON_FLOW_API_KEY,
+        'answer_model': os.getenv('SILICON_FLOW_ANSWER_MODEL', 'Qwen/Qwen3-32B').strip('"').strip("'"),
+        'fast_model': os.getenv('SILICON_FLOW_FAST_MODEL', 'Qwen/Qwen2.5-7B-Instruct').strip('"').strip("'"),
+    },
+    'ollama': {
+        'api_url': OLLAMA_API_URL,
+        'api_key': None,  # Ollama不需要API Key
+        'answer_model': OLLAMA_MODEL,
+        'fast_model': os.getenv('OLLAMA_FAST_MODEL', OLLAMA_MODEL).strip('"').strip("'"),
+    },
+}
+
+# 每个任务可单独指定 provider / model；未配置时 provider 沿用 LLM_PROVIDER，
+# model 按任务类型取该 provider 的 answer_model 或 fast_model
+LLM_TASK_ROUTES = {
+    'answer': {
+        'provider': os.getenv('LLM_ANSWER_PROVIDER', LLM_PROVIDER).strip('"').strip("'").lower(),
+        'model': os.getenv('LLM_ANSWER_MODEL', '').strip('"').strip("'"),
+        'tier': 'answer_model',
+    },
+    'selection': {
+        'provider': os.getenv('LLM_SELECTION_PROVIDER', LLM_PROVIDER).strip('"').strip("'").lower(),
+        'model': os.getenv('LLM_SELECTION_MODEL', '').strip('"').strip("'"),
+        'tier': 'fast_model',
+    },
+    'header': {
+        'provider': os.getenv('LLM_HEADER_PROVIDER', LLM_PROVIDER).strip('"').strip("'").lower(),
+        'model': os.getenv('LLM_HEADER_MODEL', '').strip('"').strip("'"),
+        'tier': 'fast_model',
+    },
+}
+
+
+# ========== Provider 路由：失败切换 + 首 token 对冲 ==========
+# 备用 provider 列表（逗号分隔），为空时只使用任务配置的 provider
+LLM_FALLBACK_PROVIDERS = [
+    p.strip().lower() for p in os.getenv('LLM_FALLBACK_PROVIDERS', '').strip('"').strip("'").split(',')
+    if p.strip().lower() in PROVIDER_ENDPOINTS
+]
+# 流式回答首 token 超过该时间未到达时，向下一个 provider 发起对冲请求（0 表示不对冲）
+LLM_HEDGE_AFTER_MS = int(os.getenv('LLM_HEDGE_AFTER_MS', '0').strip('"').strip("'") or 0)
+
+LLM_ROUTER = ProviderRouter()
+
+# ========== Ollama：模型常驻与固定上下文长度 ==========
+# 每次请求都带相同的 num_ctx / keep_alive，避免 Ollama 因上下文长度变化重新分配或卸载模型
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m').strip('"').strip("'")
+# prompt 预算（token）：最长的知识库增强 prompt（含 10 轮历史与八字信息）的估计上限
+OLLAMA_PROMPT_BUDGET_TOKENS = int(os.getenv('OLLAMA_PROMPT_BUDGET_TOKENS', '3072').strip('"').strip("'"))
+ANSWER_MAX_TOKENS = 2048
+
+
+def ollama_num_ctx():
+    """num_ctx = prompt 预算 + 回答上限，向上取整到 1024 的倍数（OLLAMA_NUM_CTX 可直接指定）"""
+    configured = os.getenv('OLLAMA_NUM_CTX', '').strip('"').strip("'")
+    if configured.isdigit():
+        return int(configured)
+    needed = OLLAMA_PROMPT_BUDGET_TOKENS + ANSWER_MAX_TOKENS
+    return -(-needed // 1024) * 1024
+
+
+OLLAMA_NUM_CTX = ollama_num_ctx()
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数（英文约 4 字符 / token，中文按 1 字 / token 计）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+# ========== 准入控制：所有上游 LLM 调用共用的并发上限与公平队列 ==========
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8').strip('"').strip("'"))
+# 预计排队超过该秒数时，新的提问直接返回 busy（不再进入匹配）
+LLM_QUEUE_BUSY_SECONDS = float(os.getenv('LLM_QUEUE_BUSY_SECONDS', '10').strip('"').strip("'"))
+# 单次调用最长排队秒数
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '30').strip('"').strip("'"))
+
+LLM_ADMISSION = AdmissionController('llm_queue', LLM_MAX_CONCURRENCY)
+
+TASK_PRIORITIES = {
+    'answer': PRIORITY_ANSWER,
+    'selection': PRIORITY_SELECTION,
+    'header': PRIORITY_BACKGROUND,
+}
+
+BUSY_MESSAGE = "The advisor is busy right now. Please try again in a moment."
+
+
+def get_llm_route(task, provider=None):
+    """
+    返回某个任务应使用的 provider / model / 接口地址
+
+    参数:
+        task (str): 'selection' / 'header' / 'answer'
+        provider (str): 指定 provider（用于失败切换），默认取任务配置
+
+    返回:
+        dict: {'task', 'provider', 'model', 'api_url', 'api_key'}
+    """
+    config = LLM_TASK_ROUTES.get(task, LLM_TASK_ROUTES['answer'])
+    if provider is None:
+        provider = 'ollama' if config['provider'] == 'ollama' else 'silicon_flow'
+    endpoint = PROVIDER_ENDPOINTS[provider]
+    # 任务指定的模型只对任务配置的 provider 生效，备用 provider 使用自己的档位模型
+    model = config['model'] if provider == config['provider'] and config['model'] else endpoint[config['tier']]
+    return {
+        'task': task,
+        'provider': provider,
+        'model': model,
+        'api_url': endpoint['api_url'],
+        'api_key': endpoint['api_key'],
+    }
+
+
+def get_llm_routes(task):
+    """
+    返回某个任务的候选路由（已过滤未配置 Key 的 provider）
+
+    流式回答按首 token 延迟排序，非流式的选择 / 头部调用按整次响应耗时排序（均含错误率惩罚）
+    """
+    routes = [get_llm_route(task)]
+    for provider in LLM_FALLBACK_PROVIDERS:
+        if provider not in [r['provider'] for r in routes]:
+            routes.append(get_llm_route(task, provider))
+    routes = [r for r in routes if not (r['provider'] == 'silicon_flow' and not r['api_key'])]
+    return LLM_ROUTER.rank(routes, KIND_TTFT if task == 'answer' else KIND_COMPLETION)
+
+
+def build_llm_request(route, prompt, stream, max_tokens, temperature):
+    """按 provider 构建请求头和 payload"""
+    headers = {"Content-Type": "application/json"}
+    if route['api_key']:
+        headers["Authorization"] = f"Bearer {route['api_key']}"
+
+    payload = {
+        "model": route['model'],
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": stream
+    }
+
+    # Silicon Flow格式需要max_tokens
+    if route['provider'] == 'silicon_flow':
+        payload["max_tokens"] = max_tokens
+        payload["temperature"] = temperature
+    else:
+        # Ollama：固定 num_ctx 并续期常驻时间
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+        payload["options"] = {"num_ctx": OLLAMA_NUM_CTX}
+        if estimate_tokens(prompt) + max_tokens > OLLAMA_NUM_CTX:
+            metrics.incr('ollama.prompt_over_budget')
+            print(f"[OLLAMA] prompt 约 {estimate_tokens(prompt)} tokens，超出 num_ctx={OLLAMA_NUM_CTX} 的预算", flush=True)
+
+    return headers, payload
+
+# ========== 延迟预算：匹配超时则先用通用 prompt 开始回答 ==========
+# 从开始匹配计时（不含排盘 / MCP），超过该预算仍未匹配到 L4 时走 build_general_prompt（0 表示不限制）
+LATENCY_BUDGET_MS = int(os.getenv('LATENCY_BUDGET_MS', '8000').strip('"').strip("'") or 0)
+
+# 匹配在独立线程中执行，超时后继续跑完，结果写入路由缓存
+MATCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='l4-match')
+
+# ========== L4 路由缓存：相同问题直接复用上次选中的 L4 ==========
+# 缓存: {routing_key(问题): l4_id}；命中时跳过全部 call_llm_for_selection 调用，
+# 迟到的匹配结果（预算超时后才完成）同样写入
+ROUTING_CACHE = TTLCache('routing', max_size=20000,
+                         ttl_seconds=int(os.getenv('ROUTING_CACHE_TTL', '86400').strip('"').strip("'")))
+# 知识树版本（COUNT / MAX(id) / l4_content 数量 / 表校验和）变化时清空路由缓存；每隔该秒数检查一次
+ROUTING_VERSION_CHECK_SECONDS = int(os.getenv('ROUTING_VERSION_CHECK_SECONDS', '60').strip('"').strip("'"))
+KNOWLEDGE_TREE_VERSION = {'version': None, 'checked_at': 0.0}
+_tree_version_lock = threading.Lock()
+
+# ========== 知识树 BM25 预筛选 ==========
+# 在进程内对知识树快照建倒排索引（随知识树版本重建），每层只把得分最高的若干候选交给 LLM，
+# 最终选择仍由 LLM 做出
+LEXICAL_PREFILTER = os.getenv('LEXICAL_PREFILTER', 'true').strip('"').strip("'").lower() == 'true'
+LEXICAL_SHORTLIST_K = int(os.getenv('LEXICAL_SHORTLIST_K', '5').strip('"').strip("'"))
+# 词法上足够确定时直接跳到 L4 / L3（不经 LLM 确认，可能误判，默认关闭）
+LEXICAL_JUMP = os.getenv('LEXICAL_JUMP', 'false').strip('"').strip("'").lower() == 'true'
+LEXICAL_JUMP_MIN_SCORE = float(os.getenv('LEXICAL_JUMP_MIN_SCORE', '8').strip('"').strip("'"))
+LEXICAL_JUMP_MARGIN = float(os.getenv('LEXICAL_JUMP_MARGIN', '1.5').strip('"').strip("'"))
+LEXICAL_PARENT_WEIGHT = float(os.getenv('LEXICAL_PARENT_WEIGHT', '0.5').strip('"').strip("'"))
+TREE_INDEX = {'index': None, 'version': None}
+_tree_index_lock = threading.Lock()
+
+# ========== 本地意图分类器：预测 L1 / L2，置信度足够时跳过对应的选择调用 ==========
+# 模型由 `python manage.py train_intent_classifier` 生成，启动时加载；文件不存在时不启用
+INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'intent_model.json')).strip('"').strip("'")
+INTENT_CONFIDENCE = float(os.getenv('INTENT_CONFIDENCE', '0.6').strip('"').strip("'"))
+# L1-L4 全部由 LLM 逐级选出的 (问题, L4) 追加写入该 JSONL 文件（source: llm_cascade），作为分类器的训练数据；
+# 分类器 / 词法直达 / 路径模式的结果不记录，避免用自己的预测训练自己（为空时不记录）
+QUERY_LOG_SOURCE = 'llm_cascade'
+QUERY_LOG_PATH = os.getenv('QUERY_LOG_PATH', '').strip('"').strip("'")
+_query_log_lock = threading.Lock()
+
+
+def load_intent_classifier(path):
+    """加载意图分类器；文件不存在或格式不符时返回 None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        classifier = IntentClassifier.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[INTENT] 意图分类器加载失败: {e}", flush=True)
+        return None
+    print(f"[INTENT] 已加载意图分类器: {path}", flush=True)
+    return classifier
+
+
+INTENT_CLASSIFIER = load_intent_classifier(INTENT_MODEL_PATH)
+
+# ========== 匹配模式 ==========
+# cascade: L1 -> L2 -> L3 -> L4 逐级选择（最多 4 次调用）
+# path: 本地打分剪枝后，把完整的 L1 > L2 > L3 > L4 路径放进一个 prompt，一次调用选出
+MATCH_MODE = os.getenv('MATCH_MODE', 'cascade').strip('"').strip("'").lower()
+PATH_CANDIDATES = int(os.getenv('PATH_CANDIDATES', '15').strip('"').strip("'"))
+
+# ========== 决策头部：与主回答并行生成 ==========
+# 头部生成在后台线程执行，就绪后以 section: header 事件插入 SSE 流，不阻塞回答
+HEADER_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='decision-header')
+# 缓存: {(l4_id, normalized_query): header}
+HEADER_CACHE = TTLCache('header', max_size=5000,
+                        ttl_seconds=int(os.getenv('HEADER_CACHE_TTL', '86400').strip('"').strip("'")))
+# 回答结束时头部仍未就绪，在 [DONE] 之前最多再等的秒数（预生成回答 / 直出内容几毫秒就结束，不等就总会丢头部）
+HEADER_WAIT_SECONDS = float(os.getenv('HEADER_WAIT_SECONDS', '3').strip('"').strip("'"))
+
+# ========== L4 预生成内容（l4_content）直出 ==========
+# off: 不使用；direct: 直接输出预生成内容（轻度个性化，不调用 LLM）；
+# grounded: 以预生成内容为依据做简短生成（更少的输出 token）
+L4_CONTENT_MODE = os.getenv('L4_CONTENT_MODE', 'off').strip('"').strip("'").lower()
+GROUNDED_MAX_TOKENS = int(os.getenv('GROUNDED_MAX_TOKENS', '256').strip('"').strip("'"))
+L4_CONTENT_CACHE = TTLCache('l4_content', max_size=10000, ttl_seconds=3600)
+
+# 日主五行 -> 回答中使用的描述（沿用 prompt 中"说概念、不说标签"的原则）
+ELEMENT_QUALITIES = {
+    '木': "your natural drive to grow and take initiative",
+    '火': "your natural warmth and ability to step into your power",
+    '土': "your natural steadiness and grounded strength",
+    '金': "your natural clarity and talent for decisive moves",
+    '水': "your natural intuition and ability to adapt with wisdom",
+}
+
+# ========== L4 × 日主原型预生成回答（l4_answer_variant）==========
+# 由 data_generation/generate_answer_variants.py 离线生成；命中时直接输出，不调用 LLM
+ANSWER_VARIANTS_ENABLED = os.getenv('ANSWER_VARIANTS_ENABLED', 'false').strip('"').strip("'").lower() == 'true'
+ANSWER_VARIANT_CACHE = TTLCache('answer_variant', max_size=20000, ttl_seconds=3600)
+# 原型（日干编码 × 强弱）的定义见 bazi_core.archetype，与生成脚本共用
+
+# ========== Single-flight：相同的并发工作只执行一次 ==========
+# 热门问题 / 相同生辰同时涌入时，匹配、排盘和选择调用各自合并
+MATCH_FLIGHT = SingleFlight('match')          # key: 归一化问题
+MCP_FLIGHT = SingleFlight('bazi_mcp')         # key: (公历时间, 性别)
+SELECTION_FLIGHT = SingleFlight('selection')  # key: prompt 摘要
+
+# ========== 可续传的回答流 ==========
+# 回答在后台线程生成并写入环形缓冲区；断线重连带 Last-Event-ID 时从缓冲区续传，不重新生成
+STREAM_BUFFER_EVENTS = int(os.getenv('STREAM_BUFFER_EVENTS', '2000').strip('"').strip("'"))
+STREAM_BUFFER_TTL = int(os.getenv('STREAM_BUFFER_TTL', '300').strip('"').strip("'"))
+STREAM_REGISTRY = StreamRegistry(max_events=STREAM_BUFFER_EVENTS, ttl_seconds=STREAM_BUFFER_TTL)
+
+# ========== 排盘引擎 ==========
+# native：进程内排盘（bazi_core，约 0.1ms），解析失败或超出 1899-2101 时回退 bazi-mcp；
+#         结果不含农历，神煞只有 bazi_core.shensha 本地推出的常用神煞
+# mcp：始终调用 bazi-mcp（含农历 / 完整神煞 / 刑冲合会）
+BAZI_ENGINE = os.getenv('BAZI_ENGINE', 'native').strip('"').strip("'").lower()
+# native 排盘后在后台再调用一次 bazi-mcp，到达后替换会话中的排盘：首轮不等 MCP，之后的对话带上农历与完整神煞
+BAZI_MCP_ENRICH = os.getenv('BAZI_MCP_ENRICH', 'true').strip('"').strip("'").lower() == 'true'
+
+# ========== 排盘预取：页面填好生辰后即在后台排盘，首个问题无需等待 MCP ==========
+CHART_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='chart-prefetch')
+# 等待预取结果的最长秒数（超时后按原流程同步排盘）
+CHART_PREFETCH_WAIT_SECONDS = float(os.getenv('CHART_PREFETCH_WAIT_SECONDS', '30').strip('"').strip("'"))
+
 # 会话管理：存储多轮对话历史（生产环境应使用 Redis/数据库）
 SESSION_STORE = {}
-# 结构: {session_id: {'history': [{'role': 'user', 'content': '...'}, ...], 'l4_id': int, 'l4_content': dict}}
+# 结构: {session_id: {'history': [{'role': 'user', 'content': '...'}, ...], 'l4_id': int, 'l4_content': dict,
+#                     'bazi_chart': bytes（bazi_core.codec 编码的排盘，用 session_chart 取出）, 'bazi_text': str}}
 
 def get_or_create_session(session_id):
     """获取或创建会话"""
@@ -67,6 +361,143 @@ def add_to_history(session_id, role, content):
         session['history'] = session['history'][-20:]
 
 
+def session_chart(session):
+    """会话中的排盘（Chart）；会话里只保存二进制编码，取用时解码（约 20-40us）"""
+    from bazi_core import codec
+
+    data = session.get('bazi_chart')
+    return codec.decode(data) if data else None
+
+
+def store_session_chart(session, chart):
+    """把排盘（Chart 或 dict）编码后存入会话"""
+    from bazi_core import codec
+
+    session['bazi_chart'] = codec.encode(chart)
+
+
+def get_chart_key(bazi_data):
+    """排盘缓存键：(公历时间, 性别)"""
+    return (bazi_data.get('solar_datetime'), bazi_data.get('gender', 1))
+
+
+def compute_chart(bazi_data):
+    """
+    排盘并格式化：默认进程内排盘，失败时调用 bazi-mcp（相同生辰的并发 MCP 请求只调用一次）
+
+    返回:
+        (Chart, bazi_text)，失败时 (None, None)；会话中只保存它的二进制编码，不保存原始 dict
+    """
+    from bazi_core.chart import Chart
+    from .bazi_mcp_client import call_bazi_mcp, format_bazi_for_llm
+
+    bazi_result = None
+    if BAZI_ENGINE == 'native':
+        from bazi_core.engine import bazi_detail
+
+        with metrics.stage('bazi.native') as stage_info:
+            try:
+                bazi_result = bazi_detail(bazi_data.get('solar_datetime'), gender=int(bazi_data.get('gender', 1)))
+                stage_info['status'] = 'ok'
+            except (ValueError, TypeError) as e:
+                stage_info['status'] = 'error'
+                metrics.incr('chart.native_fallback')
+                print(f"[BAZI] 原生排盘失败，回退 MCP: {e}", flush=True)
+
+    if bazi_result is None:
+        with metrics.stage('mcp') as stage_info:
+            bazi_result = MCP_FLIGHT.do(
+                get_chart_key(bazi_data),
+                call_bazi_mcp,
+                solar_datetime=bazi_data.get('solar_datetime'),
+                gender=bazi_data.get('gender', 1)
+            )
+            stage_info['status'] = 'ok' if bazi_result else 'error'
+    if not bazi_result:
+        return None, None
+    try:
+        chart = Chart.from_dict(bazi_result)
+    except ValueError as e:
+        print(f"[BAZI] 排盘结果无法解析: {e}", flush=True)
+        return None, None
+    return chart, format_bazi_for_llm(chart)
+
+
+def enrich_session_chart(session, chart, bazi_data):
+    """
+    原生排盘（无农历、只有常用神煞）存入会话后，在后台调用 bazi-mcp 取完整排盘；
+    到达时生辰未变则替换会话中的 bazi_chart / bazi_text，失败时保留原生结果
+
+    返回:
+        Future | None: 未启用、已是 MCP 结果时为 None
+    """
+    if not BAZI_MCP_ENRICH or chart is None or chart.has_shensha:
+        return None
+    chart_key = get_chart_key(bazi_data)
+
+    def run():
+        from bazi_core.chart import Chart
+        from .bazi_mcp_client import call_bazi_mcp, format_bazi_for_llm
+
+        with metrics.stage('mcp.enrich') as stage_info:
+            bazi_result = MCP_FLIGHT.do(
+                chart_key,
+                call_bazi_mcp,
+                solar_datetime=bazi_data.get('solar_datetime'),
+                gender=bazi_data.get('gender', 1)
+            )
+            stage_info['status'] = 'ok' if bazi_result else 'error'
+        if not bazi_result or session.get('chart_key') != chart_key:
+            return None
+        try:
+            full_chart = Chart.from_dict(bazi_result)
+        except ValueError as e:
+            print(f"[BAZI] MCP 排盘结果无法解析，保留原生排盘: {e}", flush=True)
+            return None
+        store_session_chart(session, full_chart)
+        session['bazi_text'] = format_bazi_for_llm(full_chart)
+        metrics.incr('chart.mcp_enriched')
+        return full_chart
+
+    return CHART_EXECUTOR.submit(run)
+
+
+def prefetch_chart(session_id, bazi_data):
+    """
+    在后台为会话排盘，结果写入会话（bazi_chart / bazi_text）
+
+    返回:
+        str: 'ready'（会话中已有该生辰的排盘）/ 'pending'（已在进行）/ 'started'
+    """
+    session = get_or_create_session(session_id)
+    chart_key = get_chart_key(bazi_data)
+    if session.get('chart_key') == chart_key:
+        if session.get('bazi_text'):
+            return 'ready'
+        future = session.get('chart_future')
+        if future is not None and not future.done():
+            return 'pending'
+
+    def run():
+        bazi_result, bazi_text = compute_chart(bazi_data)
+        # 期间生辰又被修改过则丢弃
+        if bazi_result and session.get('chart_key') == chart_key:
+            store_session_chart(session, bazi_result)
+            session['bazi_text'] = bazi_text
+            print(f"[MCP] ✅ 预取排盘完成，已保存到会话 {session_id}", flush=True)
+            enrich_session_chart(session, bazi_result, bazi_data)
+        return bazi_text
+
+    # 生辰变化：清掉旧的排盘
+    if session.get('chart_key') != chart_key:
+        session.pop('bazi_chart', None)
+        session.pop('bazi_text', None)
+    session['chart_key'] = chart_key
+    session['chart_future'] = CHART_EXECUTOR.submit(run)
+    metrics.incr('chart.prefetch_started')
+    return 'started'
+
+
 def index(request):
     """Render the main advisor interface"""
     return render(request, 'advisor/index.html')
@@ -260,9 +691,6 @@ def generate_decision_header(user_query, l4_info):
     生成决策头部：信号灯 + 能量类型 + 核心指令
     使用快速 LLM 调用（非流式）
     """
-    if LLM_PROVIDER == 'silicon_flow' and not SILICON_FLOW_API_KEY:
-        return None
-    
     prompt = f"""Based on this question: "{user_query}"
 Topic: {l4_info['l4_name']}
 
@@ -282,75 +710,138 @@ Rules:
 
 Respond ONLY with valid JSON, no explanation."""
 
-    headers = {"Content-Type": "application/json"}
-    if LLM_API_KEY:
-        headers["Authorization"] = f"Bearer {LLM_API_KEY}"
-    
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 150,
-        "temperature": 0.5
-    }
-    
+    content = call_llm_completion('header', prompt, max_tokens=150, temperature=0.5, timeout=30)
+    if content is None:
+        print("[ERROR] 生成决策头部失败")
+        return None
+
     try:
-        response = requests.post(LLM_API_URL, headers=headers, 
-                                data=json.dumps(payload), timeout=30)
-        result = response.json()
-        content = result['choices'][0]['message']['content'].strip() if 'choices' in result else result.get('message', {}).get('content', '').strip()
-        
         # 尝试解析 JSON
         import re
         json_match = re.search(r'\{[^}]+\}', content, re.DOTALL)
         if json_match:
             decision = json.loads(json_match.group())
             return decision
-        
-        # 如果解析失败，返回默认值
-        return {
-            "signal": "🟢",
-            "vibe": "Clarity Energy",
-            "instruction": "Trust your instinct and move forward"
-        }
-    except Exception as e:
-        print(f"[ERROR] 生成决策头部失败: {e}")
-        return None
+    except json.JSONDecodeError as e:
+        print(f"[ERROR] 解析决策头部失败: {e}")
+
+    # 如果解析失败，返回默认值
+    return {
+        "signal": "🟢",
+        "vibe": "Clarity Energy",
+        "instruction": "Trust your instinct and move forward"
+    }
 
-def call_llm_stream(prompt: str):
+
+def start_decision_header(user_query, l4_id, l4_info):
     """
-    Call LLM API with streaming enabled.
-    Yields chunks of text as they arrive.
+    启动决策头部生成（命中缓存则直接返回）
+
+    返回:
+        (header, future): 命中缓存时 header 非空、future 为 None；否则 header 为 None
     """
-    if LLM_PROVIDER == 'silicon_flow' and not SILICON_FLOW_API_KEY:
-        yield "data: Error: API key not configured\n\n"
-        return
+    cache_key = (l4_id, normalize_query(user_query))
+    header = HEADER_CACHE.get(cache_key)
+    if header:
+        return header, None
 
-    headers = {"Content-Type": "application/json"}
-    if LLM_API_KEY:
-        headers["Authorization"] = f"Bearer {LLM_API_KEY}"
-    
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": True
-    }
-    
-    # Silicon Flow格式需要max_tokens
-    if LLM_PROVIDER == 'silicon_flow':
-        payload["max_tokens"] = 2048
-        payload["temperature"] = 0.7
+    def generate():
+        result = generate_decision_header(user_query, l4_info)
+        if result:
+            HEADER_CACHE.set(cache_key, result)
+        return result
 
+    return None, HEADER_EXECUTOR.submit(contextvars.copy_context().run, generate)
+
+
+def call_llm_completion(task, prompt, max_tokens, temperature, timeout):
+    """
+    非流式 LLM 调用：按路由顺序尝试各 provider，失败时透明切换到下一个
+
+    返回:
+        str: 模型返回的文本
+        None: 所有 provider 都失败
+    """
+    routes = get_llm_routes(task)
+    if not routes:
+        print("[ERROR] API Key 未配置！")
+        return None
+
+    session_id = (metrics.current_trace() or {}).get('session_id')
+    try:
+        with LLM_ADMISSION.slot(session_id, TASK_PRIORITIES.get(task, PRIORITY_BACKGROUND),
+                                timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            return _call_llm_completion_routes(task, routes, prompt, max_tokens, temperature, timeout)
+    except AdmissionRejected as e:
+        print(f"[QUEUE] {task} 调用排队超时: {e}", flush=True)
+        return None
+
+
+def _call_llm_completion_routes(task, routes, prompt, max_tokens, temperature, timeout):
+    """依次尝试候选路由，返回第一个成功的文本"""
+    for route in routes:
+        headers, payload = build_llm_request(route, prompt, stream=False, max_tokens=max_tokens, temperature=temperature)
+        start = time.time()
+        try:
+            print(f"[LLM] 调用模型: {route['model']} (Provider: {route['provider']}, 任务: {task})")
+            response = requests.post(route['api_url'], headers=headers,
+                                     data=json.dumps(payload), timeout=timeout)
+            elapsed_ms = (time.time() - start) * 1000
+            print(f"[LLM] 响应状态码: {response.status_code}")
+            result = response.json()
+
+            if response.status_code != 200:
+                print(f"[ERROR] API 返回错误: {result}")
+                LLM_ROUTER.record_error(route['provider'])
+                metrics.record_stage(f'llm.{task}', elapsed_ms, provider=route['provider'],
+                                     model=route['model'], status=f'http_{response.status_code}')
+                continue
+
+            # 兼容不同格式的响应
+            if 'choices' in result:
+                content = result['choices'][0]['message']['content'].strip()
+            elif 'message' in result:
+                content = result['message']['content'].strip()
+            else:
+                print(f"[ERROR] 无法解析响应格式: {result}")
+                LLM_ROUTER.record_error(route['provider'])
+                metrics.record_stage(f'llm.{task}', elapsed_ms, provider=route['provider'],
+                                     model=route['model'], status='bad_response')
+                continue
+
+            LLM_ROUTER.record_success(route['provider'], elapsed_ms, KIND_COMPLETION)
+            metrics.record_stage(f'llm.{task}', elapsed_ms, provider=route['provider'],
+                                 model=route['model'], status='ok')
+            return content
+
+        except Exception as e:
+            print(f"[ERROR] LLM 调用异常 ({route['provider']}): {e}")
+            LLM_ROUTER.record_error(route['provider'])
+            metrics.record_stage(f'llm.{task}', (time.time() - start) * 1000, provider=route['provider'],
+                                 model=route['model'], status='error')
+
+    return None
+
+
+def open_llm_stream(route, prompt, cancel, max_tokens=ANSWER_MAX_TOKENS):
+    """
+    发起一次流式请求，逐段产出文本（兼容 Silicon Flow 与 Ollama 两种格式）
+    cancel 被设置时关闭连接并停止
+    """
+    headers, payload = build_llm_request(route, prompt, stream=True, max_tokens=max_tokens, temperature=0.7)
+    response = requests.post(
+        route['api_url'], 
+        headers=headers, 
+        data=json.dumps(payload), 
+        stream=True,
+        timeout=120
+    )
     try:
-        response = requests.post(
-            LLM_API_URL, 
-            headers=headers, 
-            data=json.dumps(payload), 
-            stream=True,
-            timeout=120
-        )
         response.raise_for_status()
         
         for line in response.iter_lines():
+            if cancel.is_set():
+                break
             if line:
                 line_text = line.decode('utf-8')
                 
@@ -365,7 +856,7 @@ def call_llm_stream(prompt: str):
                             delta = data['choices'][0].get('delta', {})
                             content = delta.get('content', '')
                             if content:
-                                yield f"data: {json.dumps({'content': content})}\n\n"
+                                yield content
                     except json.JSONDecodeError:
                         continue
                 # Ollama格式（直接返回JSON）
@@ -375,145 +866,397 @@ def call_llm_stream(prompt: str):
                         if 'message' in data:
                             content = data['message'].get('content', '')
                             if content:
-                                yield f"data: {json.dumps({'content': content})}\n\n"
+                                yield content
                         if data.get('done', False):
                             break
                     except json.JSONDecodeError:
                         continue
-                        
+    finally:
+        response.close()
+
+
+def call_llm_stream(prompt: str, max_tokens: int = ANSWER_MAX_TOKENS):
+    """
+    Call LLM API with streaming enabled.
+    Yields chunks of text as they arrive.
+    """
+    routes = get_llm_routes('answer')
+    if not routes:
+        yield "data: Error: API key not configured\n\n"
+        return
+
+    start = time.time()
+    route = routes[0]
+    info = {}
+    status = 'ok'
+    session_id = (metrics.current_trace() or {}).get('session_id')
+    try:
+        with LLM_ADMISSION.slot(session_id, PRIORITY_ANSWER, busy_after=LLM_QUEUE_BUSY_SECONDS,
+                                timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            stream = hedged_stream(
+                routes,
+                lambda r, cancel: open_llm_stream(r, prompt, cancel, max_tokens),
+                LLM_ROUTER,
+                hedge_after_ms=LLM_HEDGE_AFTER_MS,
+            )
+            for route, content, info in stream:
+                yield f"data: {json.dumps({'content': content})}\n\n"
+    
+    except AdmissionRejected as e:
+        status = 'busy'
+        print(f"[QUEUE] 回答排队被拒绝: {e}", flush=True)
+        yield f"data: {json.dumps({'error': BUSY_MESSAGE, 'busy': True})}\n\n"
     except Exception as e:
+        status = 'error'
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        ttft_ms = info.get('ttft_ms')
+        metrics.record_stage('llm.answer', (time.time() - start) * 1000,
+                             provider=route['provider'], model=route['model'], status=status,
+                             ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None,
+                             hedged=info.get('hedged', False), attempts=info.get('attempts', 0))
 
 
-def find_best_l4_match(user_query):
-    """Find the best matching L4 intention for the user query with hierarchical search"""
+def load_knowledge_tree_nodes():
+    """
+    读取整棵知识树快照
+
+    返回:
+        list: [{'id', 'parent_id', 'level', 'name', 'description', 'has_content'}, ...]，失败时 None
+    """
     conn = None
     try:
-        print(f"[MATCH] 开始匹配流程，用户问题: '{user_query}'")
-        
         conn = mysql.connector.connect(**DB_CONFIG)
         cursor = conn.cursor()
-        
+        cursor.execute("""
+            SELECT kb.id, kb.parent_id, kb.level, kb.name, kb.description_en, c.l4_id IS NOT NULL
+            FROM knowledge_base kb
+            LEFT JOIN l4_content c ON kb.id = c.l4_id
+        """)
+        return [
+            {'id': row[0], 'parent_id': row[1], 'level': row[2], 'name': row[3],
+             'description': row[4], 'has_content': bool(row[5])}
+            for row in cursor.fetchall()
+        ]
+    except Exception as e:
+        print(f"Error in load_knowledge_tree_nodes: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+
+def get_knowledge_tree_index():
+    """
+    返回当前知识树快照上的 BM25 索引；知识树版本变化后首次调用时重建
+
+    返回:
+        KnowledgeTreeIndex 或 None（读取失败时）
+    """
+    check_knowledge_tree_version()
+    version = KNOWLEDGE_TREE_VERSION['version']
+    with _tree_index_lock:
+        if TREE_INDEX['index'] is not None and TREE_INDEX['version'] == version:
+            return TREE_INDEX['index']
+
+        start = time.time()
+        nodes = load_knowledge_tree_nodes()
+        if nodes is None:
+            return TREE_INDEX['index']
+
+        index = KnowledgeTreeIndex(nodes, parent_weight=LEXICAL_PARENT_WEIGHT)
+        TREE_INDEX['index'] = index
+        TREE_INDEX['version'] = version
+        metrics.set_gauge('lexical_index.nodes', len(index))
+        print(f"[LEXICAL] 知识树索引已构建：{len(index)} 个节点，耗时 {(time.time() - start) * 1000:.0f}ms", flush=True)
+        return index
+
+
+def _select_candidate(index, scores, user_query, candidate_ids, prompt_template, desc_chars):
+    """
+    在候选中选出一个：先按 BM25 截取短名单，再交给 LLM（只有一个候选时直接选中）
+
+    LLM 返回短名单之外的 ID 时视为失败，返回 None
+
+    参数:
+        prompt_template (str): 含 {candidates} 占位符的选择 prompt
+        desc_chars (int): 描述截取长度，0 表示只列名称
+    """
+    if LEXICAL_PREFILTER:
+        candidate_ids = index.shortlist(candidate_ids, scores, LEXICAL_SHORTLIST_K)
+    if len(candidate_ids) == 1:
+        return candidate_ids[0]
+
+    lines = []
+    for node_id in candidate_ids:
+        node = index.nodes[node_id]
+        line = f"ID {node_id}: {node['name']}"
+        if desc_chars:
+            line += f" - {(node['description'] or '')[:desc_chars]}"
+        lines.append(line)
+    selected_id = call_llm_for_selection(prompt_template.format(user_query=user_query, candidates="\n".join(lines)))
+    if selected_id is not None and selected_id not in candidate_ids:
+        metrics.incr('match.selection_out_of_shortlist')
+        print(f"[ERROR] 选择返回了候选之外的 ID: {selected_id}")
+        return None
+    return selected_id
+
+
+def find_best_l4_match(user_query, mode=None, log_query=True):
+    """
+    按 MATCH_MODE（或指定的 mode）为问题匹配最合适的 L4
+
+    参数:
+        mode (str): 'cascade' / 'path'，默认取 MATCH_MODE
+        log_query (bool): 逐级选择全部由 LLM 完成时写入问题日志（评估时传 False）
+    """
+    if (mode or MATCH_MODE) == 'path':
+        return find_best_l4_match_path(user_query)
+    return find_best_l4_match_cascade(user_query, log_query=log_query)
+
+
+def find_best_l4_match_path(user_query):
+    """
+    单次调用的路径级匹配：BM25（+ 意图分类器）剪枝出若干候选 L4，
+    以完整路径列出后让 LLM 一次选定；无法有效剪枝时退回逐级选择
+    """
+    print(f"[MATCH] 路径匹配，用户问题: '{user_query}'")
+
+    index = get_knowledge_tree_index()
+    if index is None:
+        return None
+
+    candidates = index.content_l4 or frozenset(index.by_level.get(4, []))
+    if not candidates:
+        print("[ERROR] 数据库中没有 L4 数据！")
+        return None
+
+    # 分类器足够确定时只保留其 L2 / L1 子树
+    if INTENT_CLASSIFIER is not None:
+        with metrics.stage('match.intent') as info:
+            prediction = INTENT_CLASSIFIER.predict(user_query)
+            info['l1'], info['l1_p'] = prediction['l1'][0], round(prediction['l1'][1], 3)
+        subtree = None
+        if prediction['l2'] and prediction['l2'][1] >= INTENT_CONFIDENCE:
+            subtree = prediction['l2'][0]
+        elif prediction['l1'][1] >= INTENT_CONFIDENCE:
+            subtree = prediction['l1'][0]
+        if subtree is not None:
+            pruned = candidates.intersection(index.descendants(subtree, level=4))
+            if pruned:
+                candidates = pruned
+                metrics.incr('match.path_intent_pruned')
+
+    # 路径得分只对有词项得分的节点及其子孙计算一次
+    path_scores = index.path_scores(index.scores(user_query))
+    shortlist = [i for _, i in heapq.nlargest(PATH_CANDIDATES, (
+        (score, i) for i, score in path_scores.items() if score > 0 and i in candidates))]
+    if not shortlist:
+        if len(candidates) > PATH_CANDIDATES:
+            metrics.incr('match.path_fallback')
+            print("[MATCH] 路径剪枝没有词法信号，退回逐级选择")
+            return find_best_l4_match_cascade(user_query, log_query=False)
+        shortlist = sorted(candidates)
+    if len(shortlist) == 1:
+        return shortlist[0]
+
+    lines = []
+    for l4_id in shortlist:
+        names = [index.nodes[i]['name'] for i in index.path(l4_id)]
+        lines.append(f"ID {l4_id}: {' > '.join(names)}")
+    prompt = f"""User Query: "{user_query}"
+
+Candidate paths (Life Domain > Scenario > Sub-scenario > User Intention):
+{chr(10).join(lines)}
+
+Task: Select the single path ID whose User Intention best matches what the user wants to know.
+Return ONLY the ID number."""
+
+    best_l4_id = call_llm_for_selection(prompt)
+    if best_l4_id not in shortlist:
+        print(f"[ERROR] 路径选择返回了候选之外的 ID: {best_l4_id}")
+        return None
+    print(f"[Match] L4 Intention ID (path): {best_l4_id}")
+    return best_l4_id
+
+
+def find_best_l4_match_cascade(user_query, log_query=True):
+    """Find the best matching L4 intention for the user query with hierarchical search"""
+    print(f"[MATCH] 开始匹配流程，用户问题: '{user_query}'")
+
+    index = get_knowledge_tree_index()
+    if index is None:
+        return None
+
+    l1_candidates = index.by_level.get(1, [])
+    print(f"[MATCH] 找到 {len(l1_candidates)} 个 L1 领域")
+    if not l1_candidates:
+        print("[ERROR] 数据库中没有 L1 数据！")
+        return None
+
+    scores = index.scores(user_query) if LEXICAL_PREFILTER else {}
+
+    # 词法上足够确定时直接跳到 L4 / L3，跳过前面的 LLM 选择（LEXICAL_JUMP 开启时）
+    if LEXICAL_PREFILTER and LEXICAL_JUMP:
+        jump = index.best_at_level(4, scores, LEXICAL_JUMP_MIN_SCORE, LEXICAL_JUMP_MARGIN, require_content=True)
+        if jump:
+            metrics.incr('match.lexical_jump_l4')
+            print(f"[MATCH] 词法直达 L4 {jump[0]} (score={jump[1]:.2f})")
+            return jump[0]
+
+    best_l3_id = None
+    if LEXICAL_PREFILTER and LEXICAL_JUMP:
+        jump = index.best_at_level(3, scores, LEXICAL_JUMP_MIN_SCORE, LEXICAL_JUMP_MARGIN)
+        if jump:
+            metrics.incr('match.lexical_jump_l3')
+            print(f"[MATCH] 词法直达 L3 {jump[0]} (score={jump[1]:.2f})")
+            best_l3_id = jump[0]
+
+    # 跳过了某一层 LLM 选择（词法直达 / 分类器）时不写问题日志
+    llm_skipped = best_l3_id is not None
+
+    # 本地分类器足够确定时直接采用其 L1 / L2
+    best_l1_id = best_l2_id = None
+    if best_l3_id is None and INTENT_CLASSIFIER is not None:
+        with metrics.stage('match.intent') as info:
+            prediction = INTENT_CLASSIFIER.predict(user_query)
+            info['l1'], info['l1_p'] = prediction['l1'][0], round(prediction['l1'][1], 3)
+        if prediction['l2'] and prediction['l2'][1] >= INTENT_CONFIDENCE and prediction['l2'][0] in index.nodes:
+            best_l1_id, best_l2_id = prediction['l1'][0], prediction['l2'][0]
+            metrics.incr('match.intent_l2')
+            print(f"[MATCH] 分类器预测 L2 {best_l2_id} (p={prediction['l2'][1]:.2f})")
+        elif prediction['l1'][1] >= INTENT_CONFIDENCE and prediction['l1'][0] in index.nodes:
+            best_l1_id = prediction['l1'][0]
+            metrics.incr('match.intent_l1')
+            print(f"[MATCH] 分类器预测 L1 {best_l1_id} (p={prediction['l1'][1]:.2f})")
+        else:
+            metrics.incr('match.intent_fallback')
+        llm_skipped = best_l1_id is not None
+
+    if best_l3_id is None and best_l1_id is None:
         # Step 1: Find best matching L1 Domain
-        print("[MATCH] 步骤 1/4: 查询所有 L1 领域...")
-        cursor.execute("SELECT id, name, description_en FROM knowledge_base WHERE level = 1")
-        l1_candidates = cursor.fetchall()
-        
-        print(f"[MATCH] 找到 {len(l1_candidates)} 个 L1 领域")
-        
-        if not l1_candidates:
-            print("[ERROR] 数据库中没有 L1 数据！")
-            return None
-        
-        # Use LLM to select best L1
-        l1_list = "\n".join([f"ID {c[0]}: {c[1]} - {c[2][:100] if c[2] else ''}" for c in l1_candidates])
-        l1_prompt = f"""User Query: "{user_query}"
+        print("[MATCH] 调用 LLM 选择 L1...")
+        best_l1_id = _select_candidate(index, scores, user_query, l1_candidates, """User Query: "{user_query}"
 
 Available Life Domains (L1):
-{l1_list}
+{candidates}
 
 Task: Select the single most relevant Life Domain ID that best matches the user's question.
-Return ONLY the ID number."""
-        
-        print("[MATCH] 调用 LLM 选择 L1...")
-        best_l1_id = call_llm_for_selection(l1_prompt)
+Return ONLY the ID number.""", desc_chars=100)
         if not best_l1_id:
             print("[ERROR] L1 匹配失败，LLM 未返回有效 ID")
             return None
-        
+
         print(f"[Match] L1 Domain ID: {best_l1_id}")
-        
+
+    if best_l3_id is None and best_l2_id is None:
         # Step 2: Find best matching L2 Scenario under the selected L1
-        cursor.execute("""
-            SELECT id, name, description_en 
-            FROM knowledge_base 
-            WHERE level = 2 AND parent_id = %s
-        """, (best_l1_id,))
-        l2_candidates = cursor.fetchall()
-        
+        l2_candidates = index.children.get(best_l1_id)
         if not l2_candidates:
             return None
-        
-        l2_list = "\n".join([f"ID {c[0]}: {c[1]} - {c[2][:100] if c[2] else ''}" for c in l2_candidates])
-        l2_prompt = f"""User Query: "{user_query}"
+
+        best_l2_id = _select_candidate(index, scores, user_query, l2_candidates, """User Query: "{user_query}"
 
 Available Scenarios (L2):
-{l2_list}
+{candidates}
 
 Task: Select the single most relevant Scenario ID that best matches the user's specific situation.
-Return ONLY the ID number."""
-        
-        best_l2_id = call_llm_for_selection(l2_prompt)
+Return ONLY the ID number.""", desc_chars=100)
         if not best_l2_id:
             return None
-        
+
         print(f"[Match] L2 Scenario ID: {best_l2_id}")
-        
+
+    if best_l3_id is None:
         # Step 3: Find best matching L3 Sub-scenario under the selected L2
-        cursor.execute("""
-            SELECT id, name, description_en 
-            FROM knowledge_base 
-            WHERE level = 3 AND parent_id = %s
-        """, (best_l2_id,))
-        l3_candidates = cursor.fetchall()
-        
+        l3_candidates = index.children.get(best_l2_id)
         if not l3_candidates:
             return None
-        
-        l3_list = "\n".join([f"ID {c[0]}: {c[1]} - {c[2][:80] if c[2] else ''}" for c in l3_candidates])
-        l3_prompt = f"""User Query: "{user_query}"
+
+        best_l3_id = _select_candidate(index, scores, user_query, l3_candidates, """User Query: "{user_query}"
 
 Available Sub-scenarios (L3):
-{l3_list}
+{candidates}
 
 Task: Select the single most relevant Sub-scenario ID.
-Return ONLY the ID number."""
-        
-        best_l3_id = call_llm_for_selection(l3_prompt)
+Return ONLY the ID number.""", desc_chars=80)
         if not best_l3_id:
             return None
-        
+
         print(f"[Match] L3 Sub-scenario ID: {best_l3_id}")
-        
-        # Step 4: Find best matching L4 Intention under the selected L3
-        cursor.execute("""
-            SELECT kb.id, kb.name, kb.description_en 
-            FROM knowledge_base kb
-            JOIN l4_content c ON kb.id = c.l4_id
-            WHERE kb.level = 4 AND kb.parent_id = %s
-        """, (best_l3_id,))
-        l4_candidates = cursor.fetchall()
-        
-        if not l4_candidates:
-            # Fallback: try to find any L4 with content under this L3
-            cursor.execute("""
-                SELECT kb.id, kb.name, kb.description_en 
-                FROM knowledge_base kb
-                WHERE kb.level = 4 AND kb.parent_id = %s
-                LIMIT 1
-            """, (best_l3_id,))
-            fallback = cursor.fetchone()
-            if fallback:
-                print(f"[Match] L4 Intention ID (fallback): {fallback[0]}")
-                return fallback[0]
-            return None
-        
-        l4_list = "\n".join([f"ID {c[0]}: {c[1]}" for c in l4_candidates])
-        l4_prompt = f"""User Query: "{user_query}"
+
+    # Step 4: Find best matching L4 Intention under the selected L3
+    l4_all = index.children.get(best_l3_id, [])
+    l4_candidates = [i for i in l4_all if index.nodes[i]['has_content']]
+
+    if not l4_candidates:
+        # Fallback: try to find any L4 under this L3
+        if l4_all:
+            print(f"[Match] L4 Intention ID (fallback): {l4_all[0]}")
+            return l4_all[0]
+        return None
+
+    best_l4_id = _select_candidate(index, scores, user_query, l4_candidates, """User Query: "{user_query}"
 
 Available User Intentions (L4):
-{l4_list}
+{candidates}
 
 Task: Select the single most relevant Intention ID that exactly matches what the user wants to know.
-Return ONLY the ID number."""
-        
-        best_l4_id = call_llm_for_selection(l4_prompt)
-        print(f"[Match] L4 Intention ID: {best_l4_id}")
-        
-        return best_l4_id
-        
+Return ONLY the ID number.""", desc_chars=0)
+    print(f"[Match] L4 Intention ID: {best_l4_id}")
+
+    # 只有 L1-L4 都由 LLM 选出时才作为分类器的训练数据
+    if log_query and best_l4_id and not llm_skipped:
+        log_matched_query(user_query, best_l4_id)
+    return best_l4_id
+
+
+def call_llm_for_selection(prompt):
+    """Helper function to call LLM and extract ID from response"""
+    print(f"[LLM] Prompt 长度: {len(prompt)} 字符")
+    prompt_key = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+    content = SELECTION_FLIGHT.do(prompt_key, call_llm_completion, 'selection', prompt,
+                                  max_tokens=50, temperature=0.3, timeout=60)
+    if content is None:
+        return None
+    
+    print(f"[LLM] 返回内容: '{content}'")
+    
+    import re
+    match = re.search(r'\d+', content)
+    if match:
+        selected_id = int(match.group())
+        print(f"[LLM] 提取的 ID: {selected_id}")
+        return selected_id
+    else:
+        print(f"[ERROR] 无法从返回内容中提取数字 ID")
+        return None
+
+
+def get_knowledge_tree_version():
+    """
+    知识树版本指纹：各表行数、最大 ID 与表校验和，任一变化即视为新版本
+
+    两张表都没有 updated_at 列，行数 / 最大 ID 只能发现增删；原地修改名称、描述或 L4 内容
+    靠 CHECKSUM TABLE 发现（InnoDB 上为全表扫描，知识树规模小且每 ROUTING_VERSION_CHECK_SECONDS 秒才查一次）。
+    需要立即生效时调用 invalidate_knowledge_tree()
+    """
+    conn = None
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM knowledge_base),
+                (SELECT MAX(id) FROM knowledge_base),
+                (SELECT COUNT(*) FROM l4_content)
+        """)
+        counts = tuple(cursor.fetchone())
+        cursor.execute("CHECKSUM TABLE knowledge_base, l4_content")
+        return counts + tuple(checksum for _table, checksum in cursor.fetchall())
     except Exception as e:
-        print(f"Error in find_best_l4_match: {e}")
+        print(f"Error in get_knowledge_tree_version: {e}")
         return None
     finally:
         if conn and conn.is_connected():
@@ -521,68 +1264,104 @@ Return ONLY the ID number."""
             conn.close()
 
 
-def call_llm_for_selection(prompt):
-    """Helper function to call LLM and extract ID from response"""
-    if LLM_PROVIDER == 'silicon_flow' and not SILICON_FLOW_API_KEY:
-        print("[ERROR] API Key 未配置！")
-        return None
-    
-    headers = {"Content-Type": "application/json"}
-    if LLM_API_KEY:
-        headers["Authorization"] = f"Bearer {LLM_API_KEY}"
-    
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": False
-    }
-    
-    if LLM_PROVIDER == 'silicon_flow':
-        payload["max_tokens"] = 50
-        payload["temperature"] = 0.3
-    
+def check_knowledge_tree_version():
+    """定期检查知识树版本，变化时清空路由缓存"""
+    now = time.time()
+    with _tree_version_lock:
+        if now - KNOWLEDGE_TREE_VERSION['checked_at'] < ROUTING_VERSION_CHECK_SECONDS:
+            return
+        KNOWLEDGE_TREE_VERSION['checked_at'] = now
+
+    version = get_knowledge_tree_version()
+    if version is None:
+        return
+    with _tree_version_lock:
+        previous = KNOWLEDGE_TREE_VERSION['version']
+        KNOWLEDGE_TREE_VERSION['version'] = version
+    if previous is not None and previous != version:
+        ROUTING_CACHE.clear()
+        metrics.incr('routing.invalidated')
+        print(f"[ROUTING] 知识树版本变化 {previous} -> {version}，已清空路由缓存", flush=True)
+
+
+def invalidate_knowledge_tree(reason='manual'):
+    """
+    立即作废本进程的路由缓存与 BM25 索引（修改知识库后不必等待版本检查）
+
+    下次匹配时重新读取版本指纹并重建索引；多进程部署时需对每个进程调用（见 invalidate_routing_view）
+    """
+    ROUTING_CACHE.clear()
+    with _tree_index_lock:
+        TREE_INDEX['version'] = None
+    with _tree_version_lock:
+        KNOWLEDGE_TREE_VERSION['checked_at'] = 0.0
+    metrics.incr('routing.invalidated')
+    print(f"[ROUTING] 已手动作废路由缓存与知识树索引 ({reason})", flush=True)
+
+
+def log_matched_query(user_query, l4_id, source=QUERY_LOG_SOURCE):
+    """
+    把匹配成功的 (问题, L4) 追加到 QUERY_LOG_PATH，供 train_intent_classifier 使用
+
+    由 find_best_l4_match_cascade 在实际执行匹配的线程中调用，single-flight 的等待者不会重复记录
+    """
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({'query': user_query, 'l4_id': l4_id, 'source': source, 'ts': int(time.time())},
+                      ensure_ascii=False)
     try:
-        print(f"[LLM] 调用模型: {LLM_MODEL} (Provider: {LLM_PROVIDER})")
-        print(f"[LLM] Prompt 长度: {len(prompt)} 字符")
-        
-        response = requests.post(LLM_API_URL, headers=headers, 
-                                data=json.dumps(payload), timeout=60)
-        
-        print(f"[LLM] 响应状态码: {response.status_code}")
-        
-        result = response.json()
-        
-        if response.status_code != 200:
-            print(f"[ERROR] API 返回错误: {result}")
-            return None
-        
-        # 兼容不同格式的响应
-        if 'choices' in result:
-            content = result['choices'][0]['message']['content'].strip()
-        elif 'message' in result:
-            content = result['message']['content'].strip()
-        else:
-            print(f"[ERROR] 无法解析响应格式: {result}")
-            return None
-        
-        print(f"[LLM] 返回内容: '{content}'")
-        
-        import re
-        match = re.search(r'\d+', content)
-        if match:
-            selected_id = int(match.group())
-            print(f"[LLM] 提取的 ID: {selected_id}")
-            return selected_id
-        else:
-            print(f"[ERROR] 无法从返回内容中提取数字 ID")
-            return None
-            
+        with _query_log_lock, open(QUERY_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f"[INTENT] 写入问题日志失败: {e}", flush=True)
+
+
+def _record_late_match(user_query, future):
+    """预算超时后匹配才完成：写入路由缓存，而不是丢弃"""
+    try:
+        l4_id = future.result()
     except Exception as e:
-        print(f"[ERROR] LLM 调用异常: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    return None
+        print(f"[BUDGET] 迟到的匹配失败: {e}", flush=True)
+        return
+    if not l4_id:
+        return
+    ROUTING_CACHE.set(routing_key(user_query), l4_id)
+    metrics.incr('match.late_recorded')
+    print(f"[BUDGET] 迟到的匹配结果已写入路由缓存: '{user_query}' -> L4 {l4_id}", flush=True)
+
+
+def find_best_l4_match_within_budget(user_query, deadline):
+    """
+    在截止时间之前完成 L4 匹配
+
+    参数:
+        user_query (str): 用户问题
+        deadline (float): 截止时间戳（time.time()），None 表示不限制
+
+    返回:
+        (l4_id, outcome): outcome 为 'cached' / 'matched' / 'no_match' / 'deadline'
+    """
+    check_knowledge_tree_version()
+    key = routing_key(user_query)
+    cached_id = ROUTING_CACHE.get(key)
+    if cached_id:
+        print(f"[ROUTING] 命中路由缓存: '{key}' -> L4 {cached_id}", flush=True)
+        return cached_id, 'cached'
+
+    # 在工作线程中共享当前请求的 trace，选择调用的指标仍记录到本请求
+    future = MATCH_EXECUTOR.submit(contextvars.copy_context().run, MATCH_FLIGHT.do,
+                                   key, find_best_l4_match, user_query)
+    try:
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        l4_id = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        metrics.incr('match.deadline_exceeded')
+        print(f"[BUDGET] 匹配超出延迟预算 ({LATENCY_BUDGET_MS}ms)，先用通用模式回答", flush=True)
+        future.add_done_callback(lambda f: _record_late_match(user_query, f))
+        return None, 'deadline'
+    if l4_id:
+        ROUTING_CACHE.set(key, l4_id)
+    return l4_id, 'matched' if l4_id else 'no_match'
 
 
 def get_l4_info(l4_id):
@@ -620,6 +1399,193 @@ def get_l4_info(l4_id):
             conn.close()
 
 
+def get_l4_content(l4_id):
+    """读取某个 L4 的预生成内容（l4_content 表），结果进程内缓存"""
+    cached = L4_CONTENT_CACHE.get(l4_id)
+    if cached:
+        return cached
+
+    conn = None
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT five_elements_insight, action_guide, communication_scripts, energy_harmonization
+            FROM l4_content
+            WHERE l4_id = %s
+        """, (l4_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        content = {
+            'five_elements_insight': row[0] or '',
+            'action_guide': row[1] or '',
+            'communication_scripts': row[2] or '',
+            'energy_harmonization': row[3] or '',
+        }
+        L4_CONTENT_CACHE.set(l4_id, content)
+        return content
+    except Exception as e:
+        print(f"Error in get_l4_content: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+
+def _content_items(text):
+    """把 l4_content 的字段（纯文本 / 换行列表 / JSON）拆成条目"""
+    if not text:
+        return []
+    try:
+        value = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        value = text
+    if isinstance(value, dict):
+        items = [f"{v}" if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in value.values()]
+    elif isinstance(value, list):
+        items = [str(v) for v in value]
+    else:
+        items = str(value).split('\n')
+    import re
+    items = [re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', item).strip() for item in items]
+    return [item for item in items if item]
+
+
+def _first_sentence(text):
+    import re
+    items = _content_items(text)
+    if not items:
+        return ""
+    match = re.match(r'(.+?[.!?])(\s|$)', items[0])
+    return match.group(1) if match else items[0]
+
+
+def render_l4_content_answer(l4_info, l4_content, day_master=None):
+    """
+    直出模式：用预生成内容拼出回答，按日主做轻度个性化（不调用 LLM）
+    """
+    parts = []
+    insight = _first_sentence(l4_content.get('five_elements_insight'))
+    if insight:
+        parts.append(insight)
+
+    steps = _content_items(l4_content.get('action_guide'))[:3]
+    if steps:
+        parts.append("Do this:\n" + "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1)))
+
+    scripts = _content_items(l4_content.get('communication_scripts'))
+    if scripts:
+        parts.append(f"Try saying: {scripts[0]}")
+
+    from bazi_core.archetype import stem_element
+
+    harmonization = _first_sentence(l4_content.get('energy_harmonization'))
+    element = stem_element(day_master)
+    if element:
+        parts.append(f"Lean on {ELEMENT_QUALITIES[element]} as you do this. {harmonization}".strip())
+    elif harmonization:
+        parts.append(harmonization)
+
+    return "\n\n".join(parts)
+
+
+def classify_day_master(chart):
+    """
+    把八字归入预生成回答的原型：(day_master, balance)
+
+    day_master 为日干编码（0-9）；balance 按八个字中与日主同五行（比劫）或生日主（印）的个数粗分
+    为 弱(0) / 中和(1) / 旺(2)。规则在 bazi_core.archetype 中，与 generate_answer_variants.py 共用
+
+    参数:
+        chart (Chart): 会话中的紧凑排盘
+
+    返回:
+        (int, int) 或 None（缺少八字数据时）
+    """
+    from bazi_core.archetype import day_master_archetype
+
+    return day_master_archetype(chart)
+
+
+def get_answer_variant(l4_id, day_master, balance):
+    """读取某个 (L4, 日主, 强弱) 的预生成回答，结果进程内缓存"""
+    key = (l4_id, day_master, balance)
+    cached = ANSWER_VARIANT_CACHE.get(key)
+    if cached:
+        return cached
+
+    conn = None
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT answer
+            FROM l4_answer_variant
+            WHERE l4_id = %s AND day_master = %s AND balance = %s
+        """, key)
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            return None
+        ANSWER_VARIANT_CACHE.set(key, row[0])
+        return row[0]
+    except Exception as e:
+        print(f"Error in get_answer_variant: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+
+def stream_text(text, words_per_chunk=4):
+    """把现成文本按小段输出为 SSE content 事件（与 LLM 流式格式一致）"""
+    import re
+    tokens = re.findall(r'\S+\s*', text)
+    for i in range(0, len(tokens), words_per_chunk):
+        yield f"data: {json.dumps({'content': ''.join(tokens[i:i + words_per_chunk])})}\n\n"
+
+
+def build_grounded_prompt(user_query, l4_info, l4_content, conversation_history, bazi_text=None, user_state=None):
+    """以 l4_content 预生成内容为依据的精简 prompt（输出更短）"""
+    reference = "\n".join(
+        f"{title}: {' | '.join(_content_items(l4_content.get(key))[:3])}"
+        for key, title in [
+            ('five_elements_insight', 'Insight'),
+            ('action_guide', 'Actions'),
+            ('communication_scripts', 'Scripts'),
+            ('energy_harmonization', 'Harmonization'),
+        ]
+        if l4_content.get(key)
+    )
+
+    bazi_context = ""
+    if bazi_text:
+        bazi_context = f"""
+User's Bazi (background only, never mention Bazi terms or the chart itself):
+{bazi_text}
+"""
+
+    history_text = ""
+    if conversation_history:
+        history_text = "\nPrevious conversation:\n"
+        for msg in conversation_history[-6:]:
+            role_label = "User" if msg['role'] == 'user' else "You"
+            history_text += f"{role_label}: {msg['content']}\n"
+
+    return f"""You are a Wu Xing (Five Elements) growth coach. Be direct, confident and empowering; describe element qualities as plain human strengths, never as "water energy" etc.
+
+Topic: {l4_info['l4_name']} ({l4_info['l1_name']} > {l4_info['l2_name']} > {l4_info['l3_name']})
+
+Expert guidance for this topic (adapt it, don't copy it verbatim):
+{reference}
+{bazi_context}{get_cultural_context(user_state)}{history_text}
+User question: "{user_query}"
+
+Answer in under 60 words with ONE clear directive and why it makes them stronger:"""
+
+
 def generate_stream_response(user_query, session_id='default', bazi_data=None, user_state=None):
     """Generate streaming response with L4 knowledge boundary and conversation context"""
     
@@ -636,31 +1602,52 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
     # 获取会话
     session = get_or_create_session(session_id)
     
+    # 本次请求的阶段指标
+    trace = metrics.start_trace(session_id)
+    trace['budget_ms'] = LATENCY_BUDGET_MS
+    trace['routes'] = {}
+    for task in LLM_TASK_ROUTES:
+        route = get_llm_route(task)
+        trace['routes'][task] = f"{route['provider']}:{route['model']}"
+    
     # === V2 新增：调用 MCP 获取排盘结果（优化：会话中已有则复用，不重复调用） ===
     bazi_result = None
     bazi_text = session.get('bazi_text')  # 先尝试从会话中获取
     
     # 只有当会话中没有八字信息，且前端传了新的八字数据时，才调用MCP
     if not bazi_text and bazi_data:
-        from .bazi_mcp_client import call_bazi_mcp, format_bazi_for_llm
-        
+        # 页面已预取过该生辰：等待后台结果（通常已就绪）
+        chart_future = session.get('chart_future')
+        if chart_future is not None and session.get('chart_key') == get_chart_key(bazi_data):
+            if not chart_future.done():
+                yield f"data: {json.dumps({'status': 'Getting Bazi chart...'})}\n\n"
+            with metrics.stage('mcp.prefetch_wait') as stage_info:
+                stage_info['ready'] = chart_future.done()
+                try:
+                    bazi_text = chart_future.result(timeout=CHART_PREFETCH_WAIT_SECONDS)
+                except Exception as e:
+                    print(f"[MCP] 等待预取排盘失败: {e}", flush=True)
+            if bazi_text:
+                bazi_result = session_chart(session)
+                metrics.incr('chart.prefetch_hit')
+                print("[MCP] ✅ 使用预取的八字排盘结果", flush=True)
+
+    if not bazi_text and bazi_data:
         yield f"data: {json.dumps({'status': 'Getting Bazi chart...'})}\n\n"
         
-        print("[MCP] 会话中无八字信息，开始调用 bazi-mcp 工具...", flush=True)
+        print(f"[MCP] 会话中无八字信息，开始排盘（引擎: {BAZI_ENGINE}）...", flush=True)
         sys.stdout.flush()
         
-        bazi_result = call_bazi_mcp(
-            solar_datetime=bazi_data.get('solar_datetime'),
-            gender=bazi_data.get('gender', 1)
-        )
+        bazi_result, bazi_text = compute_chart(bazi_data)
         
         if bazi_result:
             print("[MCP] ✅ 成功获取八字排盘结果，已保存到会话", flush=True)
             sys.stdout.flush()
-            bazi_text = format_bazi_for_llm(bazi_result)
             # 保存到会话中，后续对话可以复用
-            session['bazi_result'] = bazi_result
+            store_session_chart(session, bazi_result)
             session['bazi_text'] = bazi_text
+            session['chart_key'] = get_chart_key(bazi_data)
+            enrich_session_chart(session, bazi_result, bazi_data)
         else:
             print("[MCP] ❌ 获取八字排盘失败", flush=True)
             sys.stdout.flush()
@@ -675,7 +1662,11 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
     print("[STREAM] 调用 find_best_l4_match...", flush=True)
     sys.stdout.flush()
     
-    l4_id = find_best_l4_match(user_query)
+    with metrics.stage('match', budget_ms=LATENCY_BUDGET_MS) as stage_info:
+        # 预算从匹配开始计时，排盘 / MCP 耗时不占用
+        deadline = time.time() + LATENCY_BUDGET_MS / 1000.0 if LATENCY_BUDGET_MS > 0 else None
+        l4_id, stage_info['outcome'] = find_best_l4_match_within_budget(user_query, deadline)
+        stage_info['l4_id'] = l4_id
     
     print(f"[STREAM] 返回的 L4 ID: {l4_id}", flush=True)
     sys.stdout.flush()
@@ -716,6 +1707,7 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
         
         # 发送完成信号
         yield "data: [DONE]\n\n"
+        metrics.finish_trace(trace)
         print("[STREAM] 流式响应完成（通用模式）", flush=True)
         sys.stdout.flush()
         return
@@ -756,6 +1748,7 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
         
         # 发送完成信号
         yield "data: [DONE]\n\n"
+        metrics.finish_trace(trace)
         print("[STREAM] 流式响应完成（通用模式 - L4信息缺失）", flush=True)
         sys.stdout.flush()
         return
@@ -769,16 +1762,52 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
     matched_msg = {'status': f'Topic: {topic_name}', 'section': 'header'}
     yield f"data: {json.dumps(matched_msg)}\n\n"
     
-    # 构建 prompt（简洁版）
-    prompt = build_contextualized_prompt(user_query, l4_info, session['history'][:-1], bazi_text, user_state)  # 历史不包含当前问题
+    # 决策头部与主回答并行生成（命中缓存则立即发送）
+    header, header_future = start_decision_header(user_query, l4_id, l4_info)
+    if header:
+        yield f"data: {json.dumps({'decision_header': header, 'section': 'header'})}\n\n"
+    
+    # L4 × 日主原型的预生成回答（需要已有八字）
+    variant = None
+    if ANSWER_VARIANTS_ENABLED:
+        archetype = classify_day_master(session_chart(session))
+        if archetype:
+            variant = get_answer_variant(l4_id, *archetype)
+
+    # L4 预生成内容：直出或作为生成依据
+    l4_content = get_l4_content(l4_id) if L4_CONTENT_MODE in ('direct', 'grounded') else None
+    session['l4_content'] = l4_content
+
+    if variant:
+        answer_stream = stream_text(variant)
+        trace['answer_mode'] = 'variant'
+        print(f"[STREAM] 直出预生成原型回答 (day_master={archetype[0]}, balance={archetype[1]})", flush=True)
+    elif l4_content and L4_CONTENT_MODE == 'direct':
+        chart = session_chart(session)
+        day_master = chart.day_master_name if chart else None
+        answer_text = render_l4_content_answer(l4_info, l4_content, day_master)
+        answer_stream = stream_text(answer_text)
+        trace['answer_mode'] = 'l4_content_direct'
+        print(f"[STREAM] 直出 L4 预生成内容，长度: {len(answer_text)} 字符", flush=True)
+    elif l4_content:
+        prompt = build_grounded_prompt(user_query, l4_info, l4_content, session['history'][:-1], bazi_text, user_state)
+        answer_stream = call_llm_stream(prompt, max_tokens=GROUNDED_MAX_TOKENS)
+        trace['answer_mode'] = 'l4_content_grounded'
+        print(f"[STREAM] 基于 L4 预生成内容的精简 Prompt，长度: {len(prompt)} 字符", flush=True)
+    else:
+        # 构建 prompt（简洁版）
+        prompt = build_contextualized_prompt(user_query, l4_info, session['history'][:-1], bazi_text, user_state)  # 历史不包含当前问题
+        answer_stream = call_llm_stream(prompt)
+        trace['answer_mode'] = 'generated'
+        print(f"[STREAM] 构建知识库增强 Prompt，长度: {len(prompt)} 字符", flush=True)
+    metrics.incr(f"answer.{trace['answer_mode']}")
     
-    print(f"[STREAM] 构建知识库增强 Prompt，长度: {len(prompt)} 字符", flush=True)
     if bazi_text:
         print(f"[STREAM] 已整合八字信息到 Prompt", flush=True)
     
     # 调用 LLM 流式生成
     assistant_response = ""
-    for chunk in call_llm_stream(prompt):
+    for chunk in answer_stream:
         if chunk.startswith("data:"):
             yield chunk
             # 提取内容累积（用于保存到历史）
@@ -788,6 +1817,28 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
                     assistant_response += data['content']
             except:
                 pass
+        # 头部就绪后立即插入流中
+        if header_future is not None and header_future.done():
+            header = header_future.result()
+            header_future = None
+            if header:
+                yield f"data: {json.dumps({'decision_header': header, 'section': 'header'})}\n\n"
+    
+    # 回答结束时头部仍未就绪：最多再等 HEADER_WAIT_SECONDS，超时则放弃（结果仍会写入缓存）
+    if header_future is not None:
+        with metrics.stage('header.wait') as stage_info:
+            stage_info['ready'] = header_future.done()
+            try:
+                header = header_future.result(timeout=HEADER_WAIT_SECONDS)
+            except FutureTimeoutError:
+                header = None
+            except Exception as e:
+                print(f"[ERROR] 生成决策头部失败: {e}", flush=True)
+                header = None
+        if header:
+            yield f"data: {json.dumps({'decision_header': header, 'section': 'header'})}\n\n"
+        else:
+            metrics.incr('header.missed_stream')
     
     # 添加助手回复到历史
     if assistant_response:
@@ -795,6 +1846,7 @@ def generate_stream_response(user_query, session_id='default', bazi_data=None, u
     
     # Send completion
     yield "data: [DONE]\n\n"
+    metrics.finish_trace(trace)
     print(f"[STREAM] 流式响应完成", flush=True)
     sys.stdout.flush()
 
@@ -812,6 +1864,11 @@ def ask_advisor(request):
         else:
             print(f"[SESSION] 使用现有会话ID: {session_id}")
         
+        # 断线重连：从缓冲区续传，不重新匹配 / 生成
+        last_event_id = request.headers.get('Last-Event-ID') or request.POST.get('last_event_id', '')
+        if last_event_id:
+            return resume_stream_response(session_id, last_event_id)
+        
         # === V2 新增：获取八字数据 ===
         bazi_data_str = request.POST.get('bazi_data', '').strip()
         bazi_data = None
@@ -834,7 +1891,7 @@ def ask_advisor(request):
         print(f"[REQUEST] 八字数据: {'有' if bazi_data else '无'}")
         print(f"[REQUEST] 用户所在州: {user_state if user_state else '未指定'}")
         print(f"[REQUEST] API Key存在: {bool(SILICON_FLOW_API_KEY)}")
-        print(f"[REQUEST] 使用模型: {LLM_MODEL}")
+        print(f"[REQUEST] 使用模型: 回答={get_llm_route('answer')['model']}, 匹配={get_llm_route('selection')['model']}")
         print(f"{'='*60}\n")
         
         if not user_query:
@@ -844,14 +1901,100 @@ def ask_advisor(request):
                 content_type='text/event-stream'
             )
         
+        # 准入控制（输入校验之后）：预计排队时间过长时立即返回 busy，不再进入匹配和排盘
+        estimated_wait = LLM_ADMISSION.estimate_wait(PRIORITY_ANSWER)
+        if estimated_wait > LLM_QUEUE_BUSY_SECONDS:
+            metrics.incr('llm_queue.rejected_early')
+            print(f"[QUEUE] 预计排队 {estimated_wait:.1f}s，返回 busy")
+            response = StreamingHttpResponse(
+                iter([f"data: {json.dumps({'error': BUSY_MESSAGE, 'busy': True})}\n\n", "data: [DONE]\n\n"]),
+                content_type='text/event-stream'
+            )
+            response['Retry-After'] = str(int(estimated_wait) + 1)
+            return response
+        
+        # 在后台生成并缓冲，客户端断开不影响生成，可随时续传
+        buffer = STREAM_REGISTRY.start(session_id, generate_stream_response(user_query, session_id, bazi_data, user_state))
         response = StreamingHttpResponse(
-            generate_stream_response(user_query, session_id, bazi_data, user_state),
+            stream_events(buffer),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
         response['X-Session-ID'] = session_id  # 通过响应头返回 session_id
+        response['X-Stream-ID'] = buffer.stream_id
         response['X-Accel-Buffering'] = 'no'
         return response
     
     return render(request, 'advisor/index.html')
 
+
+def resume_failed_events(reason):
+    """无法续传时返回给客户端的事件（前端据此重新提问）"""
+    metrics.incr('streams.resume_failed')
+    print(f"[STREAM] 无法续传: {reason}", flush=True)
+    yield f"data: {json.dumps({'error': 'The answer could not be resumed. Please ask again.', 'resume_failed': True})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def stream_events(buffer, after_seq=0):
+    """把缓冲区中的事件（带事件 ID）输出给客户端"""
+    try:
+        for seq, chunk in buffer.read(after_seq):
+            yield format_event(buffer.stream_id, seq, chunk)
+    except ResumeUnavailable as e:
+        yield from resume_failed_events(e)
+
+
+def resume_stream_response(session_id, last_event_id):
+    """带 Last-Event-ID 的重连：从缓冲区中该事件之后续传（生成仍在进行时继续跟随）"""
+    parsed = parse_event_id(last_event_id)
+    try:
+        if parsed is None:
+            raise ResumeUnavailable(f"invalid Last-Event-ID: {last_event_id}")
+        buffer = STREAM_REGISTRY.get(parsed[0], session_id)
+        events = stream_events(buffer, parsed[1])
+        metrics.incr('streams.resumed')
+        print(f"[STREAM] 续传 {parsed[0]}，从事件 {parsed[1]} 之后开始（生成{'已结束' if buffer.finished else '进行中'}）", flush=True)
+    except ResumeUnavailable as e:
+        events = resume_failed_events(e)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Session-ID'] = session_id
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def prefetch_chart_view(request):
+    """页面填好生辰后调用：后台排盘并缓存到会话，首个问题直接使用"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    session_id = request.POST.get('session_id', '').strip()
+    try:
+        bazi_data = json.loads(request.POST.get('bazi_data', '').strip())
+    except json.JSONDecodeError:
+        bazi_data = None
+    if not session_id or not isinstance(bazi_data, dict) or not bazi_data.get('solar_datetime'):
+        return JsonResponse({'error': 'session_id and bazi_data.solar_datetime are required'}, status=400)
+
+    status = prefetch_chart(session_id, bazi_data)
+    print(f"[MCP] 预取排盘请求: session={session_id}, status={status}", flush=True)
+    return JsonResponse({'status': status, 'session_id': session_id})
+
+
+def metrics_view(request):
+    """返回进程内的阶段指标快照（JSON），仅限 DEBUG 或已登录的 staff 用户"""
+    if not (settings.DEBUG or (request.user.is_authenticated and request.user.is_staff)):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    return JsonResponse(metrics.snapshot(), json_dumps_params={'ensure_ascii': False})
+
+
+def invalidate_routing_view(request):
+    """POST：作废本进程的路由缓存与知识树索引，权限同 metrics_view"""
+    if not (settings.DEBUG or (request.user.is_authenticated and request.user.is_staff)):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    invalidate_knowledge_tree(reason='http')
+    return JsonResponse({'status': 'invalidated'})
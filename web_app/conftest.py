@@ -0,0 +1,10 @@
+"""
+pytest 入口：python -m pytest web_app/advisor/tests.py（也可用 python manage.py test advisor）
+"""
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wu_xing_advisor.settings')
+os.environ.setdefault('OLLAMA_WARMUP', 'false')
+django.setup()